@@ -20,7 +20,6 @@ def post_init_hook(cr, registry):
     
     # Populate stored fields in pago.enganche for existing records
     pago_enganche_records = env['pago.enganche'].search([])
-    for payment in pago_enganche_records:
-        # Trigger the compute methods to populate stored fields
-        payment._compute_balances()
-        payment._compute_cliente_propiedad()
\ No newline at end of file
+    # Trigger the compute methods to populate stored fields
+    pago_enganche_records._recompute_balances()
+    pago_enganche_records._compute_cliente_propiedad()
\ No newline at end of file
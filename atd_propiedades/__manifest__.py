@@ -25,6 +25,7 @@
         'views/res_company_views.xml',
         'views/res_config_settings_views.xml',
         'views/pago_enganche_views.xml',
+        'views/real_estate_mail_queue_views.xml',
         'data/sequence.xml',
         'views/sale_views.xml',
         'views/acuerdo_compra_venta_views.xml',
@@ -41,6 +42,8 @@
         'data/mail_templates.xml',
         'wizards/pago_enganche_anular_wizard_views.xml',
         'wizards/pago_enganche_edit_wizard_view.xml',
+        'wizards/sale_order_plan_simulator_view.xml',
+        'wizards/pago_enganche_import_wizard_view.xml',
     ],
     'installable': True,
     'application': False,
@@ -9,3 +9,4 @@ from . import pago_enganche
 from . import acuerdo_compra_venta
 from . import proyecto
 from . import pago_enganche_payment_type
+from . import real_estate_mail_queue
@@ -787,39 +787,47 @@ class AcuerdoCompraVenta(models.Model):
                 if edad < 18:
                     raise ValidationError(_('El deudor terciario debe ser mayor de edad (18 años o más)'))
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
+        orders = self.env['sale.order'].browse(
+            [vals['order_id'] for vals in vals_list if vals.get('order_id')]
+        )
+        orders = {order.id: order for order in orders}
+
+        # Agreements that need a number, grouped by project
+        pending = {}
+        for vals in vals_list:
+            if 'order_id' in vals:
+                order = orders.get(vals.get('order_id')) or self.env['sale.order'].browse(vals.get('order_id'))
+                
+                # Check if proyecto_id exists
+                if not order.proyecto_id:
+                    raise ValidationError(_('No se puede crear el acuerdo: La orden de venta debe tener un proyecto asignado. Seleccione al menos una propiedad en las lineas de venta'))
+                
+                # Check if sequence fields are set in the project
+                if not order.proyecto_id.sequence_number:
+                    raise ValidationError(_('No se puede crear el acuerdo: El proyecto no tiene configurado el número de secuencia.'))
+                
+                if not order.proyecto_id.sequence_prefix:
+                    raise ValidationError(_('No se puede crear el acuerdo: El proyecto no tiene configurado el prefijo de secuencia.'))
+                
+                if not order.proyecto_id.sequence_padding:
+                    raise ValidationError(_('No se puede crear el acuerdo: El proyecto no tiene configurado el padding de secuencia.'))
 
-        if 'order_id' in vals:
-            order = self.env['sale.order'].browse(vals.get('order_id'))
-            
-            # Check if proyecto_id exists
-            if not order.proyecto_id:
-                raise ValidationError(_('No se puede crear el acuerdo: La orden de venta debe tener un proyecto asignado. Seleccione al menos una propiedad en las lineas de venta'))
-            
-            # Check if sequence fields are set in the project
-            if not order.proyecto_id.sequence_number:
-                raise ValidationError(_('No se puede crear el acuerdo: El proyecto no tiene configurado el número de secuencia.'))
-            
-            if not order.proyecto_id.sequence_prefix:
-                raise ValidationError(_('No se puede crear el acuerdo: El proyecto no tiene configurado el prefijo de secuencia.'))
-            
-            if not order.proyecto_id.sequence_padding:
-                raise ValidationError(_('No se puede crear el acuerdo: El proyecto no tiene configurado el padding de secuencia.'))
-
-            if not vals.get('name'):
-                proyecto = order.proyecto_id
-                sequence_number = proyecto.sequence_number
-                # Create the sequence number
-                vals['name'] = f"{proyecto.sequence_prefix}{str(sequence_number).zfill(proyecto.sequence_padding)}"
-                # Increment the sequence
-                proyecto.sequence_number += 1
-        else:
-            raise ValidationError(_('No se puede crear el acuerdo: Se requiere una orden de venta.'))
+                if not vals.get('name'):
+                    pending.setdefault(order.proyecto_id, []).append(vals)
+            else:
+                raise ValidationError(_('No se puede crear el acuerdo: Se requiere una orden de venta.'))
+
+        # One block of numbers per project, allocated in a single query
+        for proyecto, project_vals in pending.items():
+            names = proyecto.get_next_acuerdo_sequences(len(project_vals))
+            for vals, name in zip(project_vals, names):
+                vals['name'] = name
         
-        record = super().create(vals)
-        record._sync_partner_data()
-        return record
+        records = super().create(vals_list)
+        records._sync_partner_data()
+        return records
 
 
     @api.depends('is_complete')
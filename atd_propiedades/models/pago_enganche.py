@@ -1,7 +1,11 @@
-from odoo import models, fields, api, _, Command
+from odoo import models, fields, api, tools, _, Command
 import logging
 import base64
+from markupsafe import Markup
+from bisect import bisect_left
+from itertools import accumulate
 from odoo.exceptions import ValidationError, UserError
+from odoo.osv import expression
 
 _logger = logging.getLogger(__name__)
 
@@ -39,6 +43,7 @@ class PagoEnganche(models.Model):
         'sale.order',
         string='Orden de Venta',
         required=True,
+        index=True,
         tracking=True
     )
 
@@ -133,14 +138,15 @@ class PagoEnganche(models.Model):
         string='Saldo Anterior',
         compute='_compute_balances',
         currency_field='currency_id',
-        store=False,
+        store=True,
     )
 
     new_balance = fields.Monetary(
         string='Nuevo Saldo',
         compute='_compute_balances',
         currency_field='currency_id',
-        store=False,
+        store=True,
+        index=True,
     )
 
     currency_id = fields.Many2one(
@@ -154,7 +160,8 @@ class PagoEnganche(models.Model):
     is_overpayment = fields.Boolean(
         string='Es Sobrepago',
         compute='_compute_balances',
-        store=False,
+        store=True,
+        index=True,
         help='Indica si este pago resulta en un sobrepago del enganche'
     )
 
@@ -162,7 +169,7 @@ class PagoEnganche(models.Model):
         string='Monto de Sobrepago',
         compute='_compute_balances',
         currency_field='currency_id',
-        store=False,
+        store=True,
         help='Monto pagado en exceso del enganche acordado'
     )
 
@@ -170,7 +177,7 @@ class PagoEnganche(models.Model):
         string='Total Pagado a la Fecha',
         compute='_compute_balances',
         currency_field='currency_id',
-        store=False,
+        store=True,
         help='Total pagado incluyendo este pago'
     )
 
@@ -225,6 +232,16 @@ class PagoEnganche(models.Model):
         help='Concatenación de cliente y propiedad para análisis'
     )
 
+    proyecto_id = fields.Many2one(
+        'real.estate.proyecto',
+        string='Proyecto',
+        related='order_id.proyecto_id',
+        store=True,
+        index=True,
+        readonly=True,
+        help='Proyecto de la orden de venta'
+    )
+
     @api.depends('amount_received', 'currency_id')
     def _compute_amount_received_text(self):
         for record in self:
@@ -249,27 +266,46 @@ class PagoEnganche(models.Model):
         for record in self:
             record.payment_sequence = f'Pago {record.payment_number} de {record.total_payments}'
 
-    @api.model
-    def create(self, vals):
+    @api.model_create_multi
+    def create(self, vals_list):
+        order_ids = {vals['order_id'] for vals in vals_list if vals.get('order_id')}
+        orders = {order.id: order for order in self.env['sale.order'].browse(order_ids)}
+
         # If total_payments is not provided, calculate it from existing payments
-        if 'total_payments' not in vals and vals.get('order_id'):
-            existing_payments = self.search([('order_id', '=', vals['order_id'])])
-            if existing_payments:
-                vals['total_payments'] = max(payment.total_payments for payment in existing_payments)
-            else:
-                vals['total_payments'] = 1  # If this is the first payment
-        
-        # Generate sequence number if needed
-        if vals.get('name', _('New')) == _('New'):
-            vals['name'] = self.env['ir.sequence'].next_by_code('pago.enganche') or _('New')
-        
-        # Check order status and set state accordingly
-        if vals.get('order_id'):
-            order = self.env['sale.order'].browse(vals['order_id'])
-            if order.state not in ['draft', 'sent', 'cancel']:
-                vals['state'] = 'scheduled'
-        
-        return super().create(vals)
+        total_payments = {}
+        if any('total_payments' not in vals and vals.get('order_id') for vals in vals_list):
+            for payment in self.search([('order_id', 'in', list(order_ids))]):
+                order_id = payment.order_id.id
+                total_payments[order_id] = max(total_payments.get(order_id, 0), payment.total_payments)
+
+        sequence = None
+        for vals in vals_list:
+            if 'total_payments' not in vals and vals.get('order_id'):
+                # 1 if this is the first payment
+                vals['total_payments'] = total_payments.get(vals['order_id']) or 1
+
+            # Generate sequence number if needed
+            if vals.get('name', _('New')) == _('New'):
+                if sequence is None:
+                    sequence = self._get_name_sequence()
+                vals['name'] = sequence and sequence._next() or _('New')
+
+            # Check order status and set state accordingly
+            if vals.get('order_id'):
+                order = orders[vals['order_id']]
+                if order.state not in ['draft', 'sent', 'cancel']:
+                    vals['state'] = 'scheduled'
+
+        return super().create(vals_list)
+
+    @api.model
+    def _get_name_sequence(self):
+        """The pago.enganche sequence, looked up once per batch as next_by_code does"""
+        company_id = self.env.company.id
+        return self.env['ir.sequence'].sudo().search([
+            ('code', '=', 'pago.enganche'),
+            ('company_id', 'in', [company_id, False]),
+        ], order='company_id', limit=1)
 
     def action_schedule(self):
         self.state = 'scheduled'
@@ -293,6 +329,73 @@ class PagoEnganche(models.Model):
     def action_confirm(self):
         self.state = 'confirmed'
 
+    def _prepare_receive_move_vals(self, journal, payment_type, amount_received, received_date):
+        """Values of the account.move that records the reception of the payment"""
+        self.ensure_one()
+        proyecto = self.order_id.proyecto_id
+        if not proyecto.enganche_account_id:
+            raise ValidationError('Por favor configure la cuenta contable para enganches en el proyecto.')
+        
+        # Calculate retention if applicable
+        retention_amount = 0.0
+        if payment_type.has_retention:
+            if not payment_type.retention_account_id:
+                raise ValidationError('Por favor configure la cuenta de retención en el tipo de pago.')
+            iva = (amount_received / 1.12) * 0.12 
+            retention_amount = iva* (payment_type.retention_percentage / 100)
+
+        # Get the sale order reference
+        sale_order_ref = self.order_id.name or ''
+        payment_ref = self.name or ''
+        line_name = f'Recepción de enganche {payment_ref} (Pedido: {sale_order_ref})'
+        retention_line_name = f'Retención de enganche {payment_ref} (Pedido: {sale_order_ref})'
+        journal_account = journal.inbound_payment_method_line_ids[0].payment_account_id
+
+        # Prepare move lines
+        move_lines = []
+        
+        # Credit line - always 100% to enganche account
+        move_lines.append((0, 0, {
+            'account_id': proyecto.enganche_account_id.id,
+            'debit': 0.0,
+            'credit': amount_received,
+            'name': line_name,
+        }))
+
+        if retention_amount > 0:
+            # Debit line split between journal and retention
+            move_lines.extend([
+                # Main payment to journal
+                (0, 0, {
+                    'account_id': journal_account.id,
+                    'debit': amount_received - retention_amount,
+                    'credit': 0.0,
+                    'name': line_name,
+                }),
+                # Retention amount
+                (0, 0, {
+                    'account_id': payment_type.retention_account_id.id,
+                    'debit': retention_amount,
+                    'credit': 0.0,
+                    'name': retention_line_name,
+                })
+            ])
+        else:
+            # Full debit to journal
+            move_lines.append((0, 0, {
+                'account_id': journal_account.id,
+                'debit': amount_received,
+                'credit': 0.0,
+                'name': line_name,
+            }))
+
+        return {
+            'journal_id': journal.id,
+            'date': received_date,
+            'ref': f'Recepción de enganche {self.name}',
+            'line_ids': move_lines,
+        }
+
     def action_open_receive_wizard(self):
         self.ensure_one()
         return {
@@ -306,17 +409,54 @@ class PagoEnganche(models.Model):
             }
         }
 
-    def _cron_check_due_payments(self):
-        """Check and update status of payments that are due"""
-        due_payments = self.search([
+    def init(self):
+        tools.create_index(self._cr, 'pago_enganche_state_expected_date_index',
+                           self._table, ['state', 'expected_date'])
+
+    @api.model
+    def _cron_check_due_payments(self, batch_size=None):
+        """Check and update status of payments that are due.
+
+        Payments are processed in chunks of ``batch_size`` and each chunk is
+        committed, so a backlog never becomes one huge transaction and an
+        interrupted run resumes with the payments that are still scheduled.
+        """
+        if not batch_size:
+            batch_size = int(self.env['ir.config_parameter'].sudo().get_param(
+                'atd_propiedades.due_payments_batch_size', 500))
+        domain = [
             ('state', '=', 'scheduled'),
             ('expected_date', '<', fields.Date.today())
-        ])
-        due_payments.action_mark_due()
+        ]
+        while True:
+            due_payments = self.search(domain, order='expected_date, id', limit=batch_size)
+            if not due_payments:
+                break
+            due_payments._mark_due_batch()
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+            _logger.info('Marked %d overdue enganche payments as due', len(due_payments))
+
+    def _mark_due_batch(self):
+        """Mark the payments as due with one summary message per order
+        instead of one tracking message per installment"""
+        self.with_context(tracking_disable=True).write({'state': 'due'})
+        payments_by_order = {}
+        for payment in self:
+            payments_by_order[payment.order_id] = payments_by_order.get(payment.order_id, self.browse()) | payment
+        for order, payments in payments_by_order.items():
+            body = Markup('<p>%s</p><ul>%s</ul>') % (
+                _('Cuotas de enganche vencidas:'),
+                Markup().join(
+                    Markup('<li>%s (%s)</li>') % (payment.payment_sequence, payment.expected_date)
+                    for payment in payments
+                ),
+            )
+            order.message_post(body=body)
 
     def write(self, vals):
         """Override write to handle state changes"""
-        _logger.info('Write method called with vals: %s', vals)
+        _logger.debug('Write method called with vals: %s', vals)
         if vals.get('state') == 'received':
             _logger.info('Processing received state change')
             # If changing to received state via direct write, call action_receive
@@ -337,6 +477,9 @@ class PagoEnganche(models.Model):
 
     @api.depends('order_id', 'order_id.enganche_amount', 'amount_received', 'state', 'recibo_number', 'order_id.pago_enganche_ids.state', 'order_id.pago_enganche_ids.amount_received', 'order_id.pago_enganche_ids.recibo_number')
     def _compute_balances(self):
+        # Build the running totals once per order instead of re-filtering and
+        # re-sorting the order's payments for every record being computed
+        ledgers = {}
         for record in self:
             if not record.order_id:
                 record.previous_balance = 0
@@ -345,48 +488,34 @@ class PagoEnganche(models.Model):
                 record.overpayment_amount = 0
                 record.total_paid_to_date = 0
                 continue
-                
-            # Get all valid payments for this order (received or confirmed, not anulado)
-            valid_payments = record.order_id.pago_enganche_ids.filtered(
-                lambda p: p.state in ['received', 'confirmed'] and p.id != record.id
-            )
-            
-            # Sort payments by recibo_number to get chronological order
-            # If no recibo_number, use payment_number as fallback
-            sorted_payments = valid_payments.sorted(
-                lambda p: (p.recibo_number or '999999', p.payment_number)
-            )
-            
-            # Get payments that came BEFORE the current payment
+
+            order = record.order_id
+            if order not in ledgers:
+                ledgers[order] = self._get_balance_ledger(order)
+            by_recibo, by_number = ledgers[order]
+
+            # Payments that came BEFORE the current payment: by recibo_number
+            # when the payment has one, by payment_number otherwise
             if record.recibo_number:
-                # Use recibo_number for chronological order
-                previous_payments = sorted_payments.filtered(
-                    lambda p: p.recibo_number and p.recibo_number < record.recibo_number
-                )
+                total_paid = self._sum_previous_payments(by_recibo, record.recibo_number)
             else:
-                # If current payment has no recibo_number, use payment_number
-                previous_payments = sorted_payments.filtered(
-                    lambda p: p.payment_number < record.payment_number
-                )
-            
-            # Calculate total paid from previous payments only
-            total_paid = sum(previous_payments.mapped('amount_received'))
-            
+                total_paid = self._sum_previous_payments(by_number, record.payment_number)
+
             # Get total enganche amount from sale order
-            total_to_pay = record.order_id.enganche_amount
-            
+            total_to_pay = order.enganche_amount
+
             # Calculate previous balance (minimum 0 to avoid negative balances)
             record.previous_balance = max(0, total_to_pay - total_paid)
-            
+
             # Calculate values including current payment
             if record.state in ['received', 'confirmed']:
                 current_payment = record.amount_received
             else:
                 current_payment = 0
-                
+
             # Total paid including current payment
             record.total_paid_to_date = total_paid + current_payment
-            
+
             # Check for overpayment
             if record.total_paid_to_date > total_to_pay:
                 record.is_overpayment = True
@@ -397,37 +526,119 @@ class PagoEnganche(models.Model):
                 record.overpayment_amount = 0
                 record.new_balance = max(0, total_to_pay - record.total_paid_to_date)
 
-    def action_send_receipt_email(self):
+    @api.model
+    def _get_balance_ledger(self, order):
+        """Prefix sums of the valid payments (received or confirmed) of an order.
+
+        Returns two ``(keys, sums)`` pairs, one ordered by recibo_number (only
+        payments that have one) and one ordered by payment_number, where
+        ``sums[i]`` is the amount received by the first ``i`` payments.
+        """
+        valid_payments = order.pago_enganche_ids.filtered(
+            lambda p: p.state in ['received', 'confirmed']
+        )
+        by_recibo = sorted(
+            (p.recibo_number, p.amount_received) for p in valid_payments if p.recibo_number
+        )
+        by_number = sorted(
+            (p.payment_number, p.amount_received) for p in valid_payments
+        )
+        return self._prefix_sums(by_recibo), self._prefix_sums(by_number)
+
+    @api.model
+    def _prefix_sums(self, pairs):
+        keys = [key for key, __ in pairs]
+        sums = [0.0]
+        sums.extend(accumulate(amount for __, amount in pairs))
+        return keys, sums
+
+    @api.model
+    def _sum_previous_payments(self, ledger, key):
+        """Amount received by the payments whose key is strictly lower than ``key``"""
+        keys, sums = ledger
+        return sums[bisect_left(keys, key)]
+
+    def _recompute_balances(self):
+        """Force the recomputation of the stored balance fields of these payments"""
+        fnames = ['previous_balance', 'new_balance', 'total_paid_to_date', 'is_overpayment', 'overpayment_amount']
+        for fname in fnames:
+            self.env.add_to_compute(self._fields[fname], self)
+        self.flush_recordset(fnames)
+
+    def _receipt_attachment_name(self):
+        """Name of the stored receipt PDF, the same expression used by the
+        ``attachment`` field of action_report_pago_enganche"""
+        self.ensure_one()
+        return f'Recibo_de_caja_{self.recibo_number}.pdf'
+
+    def _get_receipt_attachment(self):
+        """Return the receipt PDF as an attachment of the payment.
+
+        Once the payment has a recibo_number the receipt is a legal document:
+        the report stores it on its first rendering (attachment_use) and every
+        reprint is served from that attachment until the edit or anular
+        wizards invalidate it.
+        """
         self.ensure_one()
-        
-        # Generate PDF report
         report = self.env['ir.actions.report']._get_report_from_name('atd_propiedades.action_report_pago_enganche')
-        pdf_content, _ = report._render(report_ref='atd_propiedades.action_report_pago_enganche', res_ids=[self.id])
-        
+        if not self.recibo_number:
+            pdf_content, _ = report._render(report_ref='atd_propiedades.action_report_pago_enganche', res_ids=[self.id])
+            return self.env['ir.attachment'].create({
+                'name': f'Recibo_de_caja_{self.name}.pdf',
+                'datas': base64.b64encode(pdf_content),
+                'res_model': 'pago.enganche',
+                'res_id': self.id,
+                'type': 'binary',
+            })
+
+        attachment = self._get_stored_receipts()[:1]
+        if not attachment:
+            # Rendering through the report stores the attachment
+            report._render(report_ref='atd_propiedades.action_report_pago_enganche', res_ids=[self.id])
+            attachment = self._get_stored_receipts()[:1]
+        return attachment
+
+    def _get_stored_receipts(self):
+        domain = []
+        for record in self.filtered('recibo_number'):
+            domain = expression.OR([domain, [
+                ('res_id', '=', record.id),
+                ('name', '=', record._receipt_attachment_name()),
+            ]])
+        if not domain:
+            return self.env['ir.attachment']
+        return self.env['ir.attachment'].search(
+            expression.AND([[('res_model', '=', 'pago.enganche')], domain]), order='id desc'
+        )
+
+    def _store_receipt_attachments(self):
+        """Render the receipts of the numbered payments that have no stored
+        PDF in a single report call. The report splits the PDF and stores
+        one attachment per payment (attachment_use); receipts it could not
+        store are rendered one by one by _get_receipt_attachment."""
+        stored_ids = set(self._get_stored_receipts().mapped('res_id'))
+        missing = self.filtered(lambda p: p.recibo_number and p.id not in stored_ids)
+        if missing:
+            self.env['ir.actions.report']._render(report_ref='atd_propiedades.action_report_pago_enganche', res_ids=missing.ids)
 
+    def _invalidate_receipt_cache(self):
+        """Drop the stored receipt PDFs so the next print renders them again"""
+        self._get_stored_receipts().unlink()
+
+    def action_send_receipt_email(self):
+        self.ensure_one()
+        
         # Prepare email template
         mail_template = self.env.ref('atd_propiedades.email_template_pago_enganche', raise_if_not_found=False)
         if not mail_template:
             raise ValidationError('Email template not found!')
 
-        # Add PDF as attachment to the email
-        attachment_name = f'Recibo_de_caja_{self.name}.pdf'
-        #attachment_name = fields.Char(string='Nombre del archivo', tracking=True)
-        attachment_vals = {
-            'name': attachment_name,
-            'datas': base64.b64encode(pdf_content),
-            'res_model': 'pago.enganche',
-            'res_id': self.id,
-            'type': 'binary',
-        }
-        attachment = self.env['ir.attachment'].create(attachment_vals)
-
-        # Send email with attachment
-        mail_template.with_context(
-            attachment_ids=[attachment.id]
-        ).send_mail(
+        # Send email with the receipt attached
+        attachment = self._get_receipt_attachment()
+        mail_template.send_mail(
             self.id,
-            force_send=True
+            force_send=True,
+            email_values={'attachment_ids': [Command.link(attachment.id)]}
         )
 
         # Show success message to user
@@ -441,6 +652,20 @@ class PagoEnganche(models.Model):
             }
         }
 
+    def action_queue_receipt_email(self):
+        """Queue the receipts of the selected payments for the mail cron"""
+        payments = self.filtered(lambda p: p.state in ['received', 'confirmed'])
+        self.env['real.estate.mail.queue'].enqueue_receipts(payments)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _('%d recibos en cola de envío') % len(payments),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
     def action_download_report(self):
         return self.env.ref('atd_propiedades.action_report_pago_enganche').report_action(self)
 
@@ -539,10 +764,7 @@ class PagoEnganche(models.Model):
     def action_recalculate_balances(self):
         """Recalculate balances for all payments in the order"""
         self.ensure_one()
-        # Trigger recalculation by touching the computed fields
-        payments = self.order_id.pago_enganche_ids
-        for payment in payments:
-            payment._compute_balances()
+        self.order_id.pago_enganche_ids._recompute_balances()
         
         return {
             'type': 'ir.actions.client',
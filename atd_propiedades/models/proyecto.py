@@ -1,4 +1,4 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, _
 
 class Proyecto(models.Model):
     _name = 'real.estate.proyecto'
@@ -45,6 +45,18 @@ class Proyecto(models.Model):
         help='Cantidad de dígitos para el número de secuencia',
         tracking=True
     )
+    sequence_id = fields.Many2one(
+        'ir.sequence',
+        string='Secuencia de Acuerdos',
+        copy=False,
+        readonly=True,
+        help='Secuencia usada para numerar los acuerdos del proyecto, se crea con el primer acuerdo'
+    )
+    sequence_next = fields.Integer(
+        string='Próximo Número',
+        related='sequence_id.number_next_actual',
+        readonly=False
+    )
 
     condiciones = fields.Html(
         string='Condiciones de la venta',
@@ -76,6 +88,18 @@ class Proyecto(models.Model):
         help='Cantidad de dígitos para el número de secuencia de recibos',
         tracking=True
     )
+    recibo_sequence_id = fields.Many2one(
+        'ir.sequence',
+        string='Secuencia de Recibos',
+        copy=False,
+        readonly=True,
+        help='Secuencia usada para numerar los recibos del proyecto, se crea con el primer recibo'
+    )
+    recibo_sequence_next = fields.Integer(
+        string='Próximo Número de Recibo',
+        related='recibo_sequence_id.number_next_actual',
+        readonly=False
+    )
 
     payment_deadline = fields.Date(
         string='Fecha límite de pagos',
@@ -89,8 +113,111 @@ class Proyecto(models.Model):
          'El nombre del proyecto debe ser único por compañía!')
     ] 
 
+    def action_queue_balance_statements(self):
+        """Queue the balance statement of every buyer of the project"""
+        self.ensure_one()
+        orders = self.env['sale.order'].search([
+            ('proyecto_id', '=', self.id),
+            ('state', '=', 'sale'),
+        ])
+        return orders.action_queue_balance_report()
+
+    # Project fields mirrored on each project sequence
+    _sequence_fields = {
+        'sequence_id': {
+            'sequence_prefix': 'prefix',
+            'sequence_padding': 'padding',
+            'sequence_number': 'number_next',
+        },
+        'recibo_sequence_id': {
+            'recibo_sequence_prefix': 'prefix',
+            'recibo_sequence_padding': 'padding',
+            'recibo_sequence_number': 'number_next',
+        },
+    }
+
+    def write(self, vals):
+        result = super().write(vals)
+        for sequence_field, mapping in self._sequence_fields.items():
+            sequence_vals = {seq_field: vals[field] for field, seq_field in mapping.items() if field in vals}
+            if sequence_vals:
+                self.mapped(sequence_field).sudo().write(sequence_vals)
+        return result
+
+    def _get_or_create_sequence(self, sequence_field, sequence_vals):
+        """Return the project sequence stored in ``sequence_field``, creating it
+        on first use. The project row is locked only while creating it."""
+        self.ensure_one()
+        if not self[sequence_field]:
+            self.env.cr.execute(
+                'SELECT id FROM real_estate_proyecto WHERE id = %s FOR UPDATE', [self.id]
+            )
+            self.invalidate_recordset([sequence_field])
+            if not self[sequence_field]:
+                sequence = self.env['ir.sequence'].sudo().create(dict(
+                    sequence_vals,
+                    implementation='standard',
+                    number_increment=1,
+                    company_id=self.company_id.id,
+                ))
+                self.sudo()[sequence_field] = sequence
+        return self[sequence_field].sudo()
+
+    def _get_recibo_sequence(self):
+        self.ensure_one()
+        return self._get_or_create_sequence('recibo_sequence_id', {
+            'name': _('Recibos %s') % self.name,
+            'prefix': self.recibo_sequence_prefix,
+            'padding': self.recibo_sequence_padding,
+            'number_next': self.recibo_sequence_number or 1,
+        })
+
+    def _get_acuerdo_sequence(self):
+        self.ensure_one()
+        return self._get_or_create_sequence('sequence_id', {
+            'name': _('Acuerdos %s') % self.name,
+            'prefix': self.sequence_prefix,
+            'padding': self.sequence_padding,
+            'number_next': self.sequence_number or 1,
+        })
+
+    def _reserve_sequence_numbers(self, sequence, count):
+        """Allocate ``count`` consecutive numbers of a standard sequence.
+
+        Blocks on the same sequence are serialized with a transaction-scoped
+        advisory lock keyed on the sequence, so two blocks never interleave.
+        Single numbers (``get_next_recibo_sequence``) still use a plain
+        nextval without the lock; if one of them lands inside a block while
+        it is being drawn, the block is not consecutive and is drawn again.
+        The numbers of the discarded block are left as a gap, just like the
+        ones of a rolled back transaction.
+        """
+        self.ensure_one()
+        if count <= 0:
+            return []
+        self.env.cr.execute(
+            "SELECT pg_advisory_xact_lock(hashtext('ir_sequence'), %s)", [sequence.id]
+        )
+        while True:
+            self.env.cr.execute(
+                'SELECT nextval(%s) FROM generate_series(1, %s)',
+                ['ir_sequence_%03d' % sequence.id, count]
+            )
+            numbers = sorted(row[0] for row in self.env.cr.fetchall())
+            if numbers[-1] - numbers[0] == count - 1:
+                break
+        return [sequence.get_next_char(number) for number in numbers]
+
     def get_next_recibo_sequence(self):
         self.ensure_one()
-        sequence = f"{self.recibo_sequence_prefix}{str(self.recibo_sequence_number).zfill(self.recibo_sequence_padding)}"
-        self.recibo_sequence_number += 1
-        return sequence
\ No newline at end of file
+        return self._get_recibo_sequence()._next()
+
+    def get_next_recibo_sequences(self, count):
+        """Allocate a block of ``count`` receipt numbers for bulk operations"""
+        self.ensure_one()
+        return self._reserve_sequence_numbers(self._get_recibo_sequence(), count)
+
+    def get_next_acuerdo_sequences(self, count):
+        """Allocate a block of ``count`` agreement numbers"""
+        self.ensure_one()
+        return self._reserve_sequence_numbers(self._get_acuerdo_sequence(), count)
@@ -0,0 +1,137 @@
+from odoo import models, fields, api, _, Command
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class RealEstateMailQueue(models.Model):
+    _name = 'real.estate.mail.queue'
+    _description = 'Cola de Envío de Estados de Cuenta y Recibos'
+    _order = 'id'
+
+    kind = fields.Selection([
+        ('balance', 'Estado de cuenta'),
+        ('receipt', 'Recibo de caja')
+    ], string='Tipo', required=True)
+
+    order_id = fields.Many2one(
+        'sale.order',
+        string='Orden de Venta',
+        required=True,
+        ondelete='cascade'
+    )
+
+    pago_enganche_id = fields.Many2one(
+        'pago.enganche',
+        string='Pago de Enganche',
+        ondelete='cascade'
+    )
+
+    proyecto_id = fields.Many2one(
+        'real.estate.proyecto',
+        string='Proyecto',
+        related='order_id.proyecto_id',
+        store=True
+    )
+
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Cliente',
+        related='order_id.partner_id'
+    )
+
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('sent', 'Enviado'),
+        ('error', 'Error')
+    ], string='Estado', default='pending', required=True, index=True)
+
+    mail_id = fields.Many2one(
+        'mail.mail',
+        string='Correo',
+        readonly=True
+    )
+
+    error_message = fields.Text(
+        string='Error',
+        readonly=True
+    )
+
+    @api.model
+    def enqueue_balances(self, orders):
+        """Queue the balance statement of each order"""
+        return self.create([{'kind': 'balance', 'order_id': order.id} for order in orders])
+
+    @api.model
+    def enqueue_receipts(self, payments):
+        """Queue the receipt of each pago.enganche"""
+        return self.create([
+            {'kind': 'receipt', 'order_id': payment.order_id.id, 'pago_enganche_id': payment.id}
+            for payment in payments
+        ])
+
+    def action_retry(self):
+        self.filtered(lambda q: q.state == 'error').write({'state': 'pending', 'error_message': False})
+
+    @api.model
+    def _cron_process_queue(self, batch_size=None):
+        """Render and send the pending entries in batches.
+
+        Each batch renders its PDFs, queues one mail.mail per entry from a
+        shared template and sends them together, so the whole batch goes
+        through a single SMTP connection. Entries whose mail could not be
+        delivered are left in error, to be retried. Batches are committed
+        one by one.
+        """
+        if not batch_size:
+            batch_size = int(self.env['ir.config_parameter'].sudo().get_param(
+                'atd_propiedades.mail_queue_batch_size', 50))
+        while True:
+            entries = self.search([('state', '=', 'pending')], limit=batch_size)
+            if not entries:
+                break
+            entries._process_batch()
+            if not self.env.registry.in_test_mode():
+                self.env.cr.commit()
+
+    def _process_batch(self):
+        templates = {
+            'balance': self.env.ref('atd_propiedades.email_template_sale_balance'),
+            'receipt': self.env.ref('atd_propiedades.email_template_pago_enganche'),
+        }
+        receipts = self.filtered(lambda q: q.kind == 'receipt').pago_enganche_id
+        try:
+            with self.env.cr.savepoint():
+                receipts._store_receipt_attachments()
+        except Exception:
+            # Each entry renders its own receipt below and keeps its error
+            _logger.exception('Could not render the receipts of the batch together')
+
+        queued = self.browse()
+        for entry in self:
+            try:
+                with self.env.cr.savepoint():
+                    if entry.kind == 'balance':
+                        record = entry.order_id
+                        attachment = record._get_balance_report_attachment()
+                    else:
+                        record = entry.pago_enganche_id
+                        attachment = record._get_receipt_attachment()
+                    # Keep the mail after sending, its state tells whether
+                    # the entry was delivered
+                    mail_id = templates[entry.kind].send_mail(
+                        record.id,
+                        email_values={'attachment_ids': [Command.link(attachment.id)], 'auto_delete': False}
+                    )
+                    entry.write({'mail_id': mail_id, 'error_message': False})
+                    queued |= entry
+            except Exception as e:
+                _logger.exception('Could not queue %s for %s', entry.kind, entry.order_id.name)
+                entry.write({'state': 'error', 'error_message': str(e)})
+        if not queued:
+            return
+        queued.mail_id.send()
+        for entry in queued:
+            if entry.mail_id.state == 'exception':
+                entry.write({'state': 'error', 'error_message': entry.mail_id.failure_reason})
+            else:
+                entry.write({'state': 'sent'})
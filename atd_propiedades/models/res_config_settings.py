@@ -8,4 +8,11 @@ class ResConfigSettings(models.TransientModel):
         readonly=False,
         string='Enable Real Estate Management',
         help='Enable real estate property management features'
-    )
\ No newline at end of file
+    )
+
+    due_payments_batch_size = fields.Integer(
+        string='Pagos vencidos por lote',
+        config_parameter='atd_propiedades.due_payments_batch_size',
+        default=500,
+        help='Cantidad de pagos de enganche que la acción planificada marca como vencidos por transacción'
+    )
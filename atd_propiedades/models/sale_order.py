@@ -1,5 +1,5 @@
 from dateutil.relativedelta import relativedelta
-from odoo import models, fields, api, _
+from odoo import models, fields, api, _, Command
 from odoo.exceptions import UserError, ValidationError
 import base64
 import logging
@@ -105,15 +105,10 @@ class SaleOrder(models.Model):
 
     @api.depends('amount_total', 'enganche_percentage')
     def _compute_enganche_amount(self):
+        # Payment balances depend on order_id.enganche_amount and are
+        # recomputed by the ORM when it changes
         for order in self:
-            old_enganche = order.enganche_amount
             order.enganche_amount = order.amount_total * order.enganche_percentage
-            
-            # If enganche amount changed and there are payments, trigger balance recalculation
-            if old_enganche != order.enganche_amount and order.pago_enganche_ids:
-                # Trigger recalculation of balances for all payments
-                for payment in order.pago_enganche_ids:
-                    payment._compute_balances()
 
     pago_enganche_ids = fields.One2many(
         'pago.enganche',
@@ -193,9 +188,73 @@ class SaleOrder(models.Model):
         
         if self.state not in ('draft', 'sent'):
             raise UserError('No se pueden calcular los pagos de enganche en una orden que no sea presupuesto.')
-        
+
+        self._generate_enganche_plans()
+
+    def action_open_plan_simulator(self):
+        self.ensure_one()
+        return {
+            'name': _('Simular Plan de Pagos'),
+            'type': 'ir.actions.act_window',
+            'res_model': 'sale.order.plan.simulator',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {
+                'default_order_id': self.id,
+                'default_porcentajes': '%.2f' % self.enganche_percentage,
+                'default_cuotas': str(self.enganche_payments),
+                'default_reservas': '%.2f' % self.first_payment_amount,
+            }
+        }
+
+    def action_compute_enganche_multi(self):
+        """Regenerate the enganche plan of every selected quotation at once
+        and report the orders that were skipped and why"""
+        orders = self.browse()
+        amounts = {}
+        skipped = []
+        for order in self:
+            if order.state not in ('draft', 'sent'):
+                skipped.append(_('%s (no es presupuesto)') % order.name)
+                continue
+            amounts[order.id] = order._calculate_remaining_payment_amount()
+            if amounts[order.id][2] <= 0:
+                skipped.append(_('%s (los pagos ya confirmados cubren el número de pagos)') % order.name)
+                continue
+            orders |= order
+        orders._generate_enganche_plans(amounts)
+
+        message = _('Cuotas de enganche calculadas para %d de %d órdenes') % (len(orders), len(self))
+        if skipped:
+            message += _('. Omitidas: %s') % ', '.join(skipped)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': message,
+                'type': 'warning' if skipped else 'success',
+                'sticky': bool(skipped),
+            }
+        }
+
+    def _generate_enganche_plans(self, amounts=None):
+        """Build the payment schedule of every order in memory and insert all
+        the new installments with a single create(). amounts maps order ids
+        to their already computed _calculate_remaining_payment_amount()"""
+        amounts = amounts or {}
+        vals_list = []
+        for order in self:
+            vals_list.extend(order._prepare_enganche_plan(amounts.get(order.id)))
+        # Generated installments are drafts, skip the per-record chatter tracking
+        return self.env['pago.enganche'].with_context(tracking_disable=True).create(vals_list)
+
+    def _prepare_enganche_plan(self, amounts=None):
+        """Reset the open installments of the order and return the values of
+        the new ones. Confirmed payments are resequenced in place."""
+        self.ensure_one()
+
         # Calculate payment amount and get related values
-        payment_amount, remaining_amount, new_payments_count = self._calculate_remaining_payment_amount()
+        payment_amount, remaining_amount, new_payments_count = amounts or self._calculate_remaining_payment_amount()
         
         if new_payments_count <= 0:
             raise UserError(
@@ -227,10 +286,12 @@ class SaleOrder(models.Model):
         else:
             # If no received payments, start with payment number 1
             next_payment_number = 1
-        
+
+        vals_list = []
+
         # Create first payment if no confirmed payments exist
         if not confirmed_payments:
-            self.env['pago.enganche'].create({
+            vals_list.append({
                 'order_id': self.id,
                 'amount': self.first_payment_amount,
                 'payment_number': 1,
@@ -265,7 +326,7 @@ class SaleOrder(models.Model):
                 else:
                     months_delta = next_payment_number - 1 + i
                 expected_date = base_date + relativedelta(months=months_delta)
-                self.env['pago.enganche'].create({
+                vals_list.append({
                     'order_id': self.id,
                     'amount': amount,
                     'payment_number': next_payment_number + i,
@@ -274,7 +335,7 @@ class SaleOrder(models.Model):
                     'state': 'draft'
                 })
         
-        # Update total_payments for all payments
+        # Update total_payments for the payments that are kept
         self.pago_enganche_ids.write({'total_payments': self.enganche_payments})
         
         # Update the remaining_payment_amount field
@@ -282,6 +343,8 @@ class SaleOrder(models.Model):
             'remaining_payment_amount': payment_amount
         })
 
+        return vals_list
+
     def write(self, vals):
         """Override write to handle property-related lines"""
         # If order lines are being modified
@@ -464,39 +527,30 @@ class SaleOrder(models.Model):
                 }
             }
     
-    def action_send_balance_report(self):
+    def _get_balance_report_attachment(self):
+        """Render the balance statement and store it as an attachment of the order"""
         self.ensure_one()
-        
-        # Get the report action
         report = self.env['ir.actions.report']._get_report_from_name('atd_propiedades.report_sale_balance')
         pdf_content, _ = report._render(report_ref='atd_propiedades.report_sale_balance', res_ids=[self.id])
         
-        # Create attachment
-        attachment = self.env['ir.attachment'].create({
+        return self.env['ir.attachment'].create({
             'name': f'Estado de cuenta - {self.name}.pdf',
             'type': 'binary',
             'datas': base64.b64encode(pdf_content),
             'res_model': 'sale.order',
             'res_id': self.id,
         })
+
+    def action_send_balance_report(self):
+        self.ensure_one()
         
-        # Prepare email template
-        template = self.env['mail.template'].create({
-            'name': 'Estado de cuenta',
-            'subject': f'Estado de cuenta - {self.name}',
-            'body_html': f"""
-                <p>Estimado {self.partner_id.name},</p>
-                <p>Adjunto podrá encontrar el estado de cuenta de su plan de pagos de enganche.</p>
-                <p>Cordialmente,</p>
-            """,
-            'email_from': self.company_id.email,
-            'email_to': self.partner_id.email,
-            'model_id': self.env['ir.model']._get('sale.order').id,
-            'attachment_ids': [(6, 0, [attachment.id])],
-        })
-        
-        # Send email
-        template.send_mail(self.id, force_send=True)
+        attachment = self._get_balance_report_attachment()
+        template = self.env.ref('atd_propiedades.email_template_sale_balance')
+        template.send_mail(
+            self.id,
+            force_send=True,
+            email_values={'attachment_ids': [Command.link(attachment.id)]}
+        )
         
         return {
             'type': 'ir.actions.client',
@@ -508,6 +562,19 @@ class SaleOrder(models.Model):
                 'sticky': False,
             }
         }
+
+    def action_queue_balance_report(self):
+        """Queue the balance statement of the selected orders for the mail cron"""
+        self.env['real.estate.mail.queue'].enqueue_balances(self)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': _('%d estados de cuenta en cola de envío') % len(self),
+                'type': 'success',
+                'sticky': False,
+            }
+        }
     
     state = fields.Selection(
         selection=[
@@ -1,3 +1,5 @@
 from . import pago_enganche_receive_wizard 
 from . import pago_enganche_anular_wizard 
-from . import pago_enganche_edit_wizard 
\ No newline at end of file
+from . import pago_enganche_edit_wizard
+from . import sale_order_plan_simulator
+from . import pago_enganche_import_wizard
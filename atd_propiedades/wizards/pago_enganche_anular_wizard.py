@@ -13,6 +13,7 @@ class PagoEngancheAnularWizard(models.TransientModel):
     def action_confirm(self):
         self.ensure_one()
         self.pago_enganche_id.action_anular()
+        self.pago_enganche_id._invalidate_receipt_cache()
         
         # Return action to close wizard and refresh view
         return {
@@ -153,5 +153,8 @@ class PagoEngancheEditWizard(models.TransientModel):
             'boleta': self.boleta,
             'banco_emisor_id': self.banco_emisor_id.id,
         })
+
+        # The stored receipt no longer matches the payment
+        pago._invalidate_receipt_cache()
         
         return {'type': 'ir.actions.act_window_close'}
\ No newline at end of file
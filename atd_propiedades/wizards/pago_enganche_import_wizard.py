@@ -0,0 +1,318 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from datetime import date, datetime
+import base64
+import csv
+import io
+import re
+
+# Accepted column headers of the bank deposit file
+COLUMNS = {
+    'fecha': ('fecha', 'date', 'fecha deposito'),
+    'boleta': ('boleta', 'deposito', 'numero deposito', 'referencia'),
+    'monto': ('monto', 'amount', 'valor'),
+    'cliente': ('cliente', 'nit', 'comprador', 'nombre'),
+}
+
+class PagoEngancheImportWizard(models.TransientModel):
+    _name = 'pago.enganche.import.wizard'
+    _description = 'Importación de Depósitos de Enganche'
+
+    file = fields.Binary(
+        string='Archivo de Depósitos',
+        required=True,
+        help='Archivo CSV o XLSX con las columnas fecha, boleta, monto y cliente (NIT o nombre)'
+    )
+    filename = fields.Char(
+        string='Nombre del Archivo'
+    )
+    proyecto_id = fields.Many2one(
+        'real.estate.proyecto',
+        string='Proyecto',
+        help='Limitar la búsqueda de cuotas a este proyecto'
+    )
+    journal_id = fields.Many2one(
+        'account.journal',
+        string='Diario',
+        domain="[('type', 'in', ['bank', 'cash'])]",
+        required=True
+    )
+    payment_type_id = fields.Many2one(
+        'pago.enganche.payment.type',
+        string='Tipo de Pago',
+        required=True
+    )
+    state = fields.Selection([
+        ('upload', 'Cargar'),
+        ('review', 'Revisar')
+    ], default='upload')
+    line_ids = fields.One2many(
+        'pago.enganche.import.line',
+        'wizard_id',
+        string='Depósitos'
+    )
+    matched_count = fields.Integer(
+        string='Depósitos Encontrados',
+        compute='_compute_counts'
+    )
+    unmatched_count = fields.Integer(
+        string='Depósitos sin Cuota',
+        compute='_compute_counts'
+    )
+
+    @api.depends('line_ids.pago_enganche_id')
+    def _compute_counts(self):
+        for wizard in self:
+            matched = wizard.line_ids.filtered('pago_enganche_id')
+            wizard.matched_count = len(matched)
+            wizard.unmatched_count = len(wizard.line_ids) - len(matched)
+
+    def _iter_rows(self):
+        """Yield one dict per deposit of the uploaded CSV or XLSX file"""
+        self.ensure_one()
+        content = base64.b64decode(self.file)
+        if (self.filename or '').lower().endswith('.xlsx'):
+            try:
+                from openpyxl import load_workbook
+            except ImportError:
+                raise UserError(_('La librería openpyxl no está instalada.'))
+            workbook = load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+            rows = workbook.active.iter_rows(values_only=True)
+        else:
+            rows = csv.reader(io.TextIOWrapper(io.BytesIO(content), encoding='utf-8-sig'))
+
+        header = None
+        for row in rows:
+            if not any(row):
+                continue
+            if header is None:
+                header = self._map_header(row)
+                continue
+            yield {key: row[index] if index < len(row) else None for key, index in header.items()}
+
+    def _map_header(self, row):
+        header = {}
+        for index, title in enumerate(row):
+            title = str(title or '').strip().lower()
+            for key, aliases in COLUMNS.items():
+                if title in aliases and key not in header:
+                    header[key] = index
+        missing = {'fecha', 'monto'} - set(header)
+        if missing or not ({'boleta', 'cliente'} & set(header)):
+            raise UserError(_(
+                'El archivo debe tener las columnas fecha y monto, y al menos una de boleta o cliente.'
+            ))
+        return header
+
+    @api.model
+    def _normalize(self, value):
+        return re.sub(r'[\s\-]', '', str(value or '')).upper()
+
+    @api.model
+    def _parse_amount(self, value):
+        if isinstance(value, (int, float)):
+            return round(float(value), 2)
+        try:
+            return round(float(str(value or '').replace(',', '').replace('Q', '').strip()), 2)
+        except ValueError:
+            return 0.0
+
+    @api.model
+    def _parse_date(self, value):
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+            try:
+                return datetime.strptime(str(value).strip(), fmt).date()
+            except ValueError:
+                continue
+        return False
+
+    def _build_match_indexes(self):
+        """Index the open installments once per import.
+
+        Returns three dicts: by boleta/deposit number, by (buyer, amount) and
+        by buyer, where buyer is the normalized NIT or name of the customer.
+        """
+        self.ensure_one()
+        domain = [('state', 'in', ['scheduled', 'due'])]
+        if self.proyecto_id:
+            domain.append(('proyecto_id', '=', self.proyecto_id.id))
+        payments = self.env['pago.enganche'].search(domain, order='expected_date, payment_number, id')
+
+        by_reference, by_buyer_amount, by_buyer = {}, {}, {}
+        for payment in payments:
+            for reference in (payment.boleta, payment.deposit_number):
+                if reference:
+                    by_reference.setdefault(self._normalize(reference), []).append(payment)
+            partner = payment.order_id.partner_id
+            for buyer in {self._normalize(partner.vat), self._normalize(partner.name)} - {''}:
+                by_buyer_amount.setdefault((buyer, round(payment.amount, 2)), []).append(payment)
+                by_buyer.setdefault(buyer, []).append(payment)
+        return by_reference, by_buyer_amount, by_buyer
+
+    def action_match(self):
+        self.ensure_one()
+        by_reference, by_buyer_amount, by_buyer = self._build_match_indexes()
+        used = set()
+
+        def first_free(candidates):
+            for payment in candidates or []:
+                if payment.id not in used:
+                    return payment
+            return None
+
+        lines = []
+        for row in self._iter_rows():
+            boleta = str(row.get('boleta') or '').strip()
+            cliente = str(row.get('cliente') or '').strip()
+            amount = self._parse_amount(row.get('monto'))
+            buyer = self._normalize(cliente)
+
+            payment = first_free(by_reference.get(self._normalize(boleta))) if boleta else None
+            message = _('Boleta')
+            requires_confirmation = False
+            if not payment and buyer:
+                payment = first_free(by_buyer_amount.get((buyer, amount)))
+                message = _('Cliente y monto')
+            if not payment and buyer:
+                payment = first_free(by_buyer.get(buyer))
+                message = _('Cliente, monto distinto')
+                # Only the customer matches: the user has to confirm it
+                requires_confirmation = bool(payment)
+            if payment:
+                used.add(payment.id)
+            else:
+                message = _('Sin cuota pendiente')
+
+            lines.append((0, 0, {
+                'received_date': self._parse_date(row.get('fecha')) or fields.Date.context_today(self),
+                'boleta': boleta,
+                'cliente': cliente,
+                'amount_received': amount,
+                'pago_enganche_id': payment.id if payment else False,
+                'match_reason': message,
+                'requires_confirmation': requires_confirmation,
+            }))
+
+        self.write({'line_ids': [(5, 0, 0)] + lines, 'state': 'review'})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def action_confirm(self):
+        """Receive every matched installment: journal entries are created and
+        posted in batches and receipt numbers come from one preallocated block
+        per project. Lines matched only by customer are skipped until the
+        user confirms them"""
+        self.ensure_one()
+        lines = self.line_ids.filtered(lambda l: l.pago_enganche_id and l.amount_received > 0)
+        unconfirmed = lines.filtered(lambda l: l.requires_confirmation and not l.confirmed)
+        lines -= unconfirmed
+        if not lines:
+            if unconfirmed:
+                raise UserError(_('Los depósitos asociados solo por cliente deben confirmarse antes de registrarlos.'))
+            raise UserError(_('No hay depósitos asociados a cuotas de enganche.'))
+        if len(lines.pago_enganche_id) != len(lines):
+            raise UserError(_('Una cuota de enganche está asociada a más de un depósito.'))
+
+        if any(not pago.order_id.proyecto_id for pago in lines.pago_enganche_id):
+            raise UserError(_('No se puede generar el recibo: La orden no tiene un proyecto asignado.'))
+
+        recibos = {}
+        for proyecto in lines.pago_enganche_id.order_id.proyecto_id:
+            project_lines = lines.filtered(lambda l: l.pago_enganche_id.order_id.proyecto_id == proyecto)
+            recibos[proyecto] = iter(proyecto.get_next_recibo_sequences(len(project_lines)))
+
+        batch_size = 100
+        for start in range(0, len(lines), batch_size):
+            batch = lines[start:start + batch_size]
+            moves = self.env['account.move'].create([
+                line.pago_enganche_id._prepare_receive_move_vals(
+                    self.journal_id, self.payment_type_id, line.amount_received, line.received_date
+                )
+                for line in batch
+            ])
+            moves.action_post()
+            for line, move in zip(batch, moves):
+                pago = line.pago_enganche_id
+                vals = {
+                    'state': 'received',
+                    'recibo_number': next(recibos[pago.order_id.proyecto_id]),
+                    'received_date': line.received_date,
+                    'move_id': move.id,
+                    'journal_id': self.journal_id.id,
+                    'payment_type_id': self.payment_type_id.id,
+                    'amount_received': line.amount_received,
+                }
+                # Files matched by customer may not carry a boleta; keep the
+                # one already on the installment
+                if line.boleta:
+                    vals['boleta'] = line.boleta
+                pago.write(vals)
+
+        message = _('%d depósitos registrados') % len(lines)
+        if unconfirmed:
+            message += _(', %d sin confirmar no se registraron') % len(unconfirmed)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'message': message,
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
+
+
+class PagoEngancheImportLine(models.TransientModel):
+    _name = 'pago.enganche.import.line'
+    _description = 'Depósito de Enganche Importado'
+
+    wizard_id = fields.Many2one(
+        'pago.enganche.import.wizard',
+        required=True,
+        ondelete='cascade'
+    )
+    received_date = fields.Date(
+        string='Fecha de Recepción',
+        required=True
+    )
+    boleta = fields.Char(
+        string='Número de Boleta'
+    )
+    cliente = fields.Char(
+        string='Cliente'
+    )
+    amount_received = fields.Float(
+        string='Monto Recibido'
+    )
+    pago_enganche_id = fields.Many2one(
+        'pago.enganche',
+        string='Cuota',
+        domain="[('state', 'in', ['scheduled', 'due'])]"
+    )
+    amount = fields.Float(
+        related='pago_enganche_id.amount',
+        string='Monto Programado'
+    )
+    match_reason = fields.Char(
+        string='Coincidencia',
+        readonly=True
+    )
+    requires_confirmation = fields.Boolean(
+        string='Requiere Confirmación',
+        readonly=True,
+        help='La cuota se encontró solo por cliente y con un monto distinto'
+    )
+    confirmed = fields.Boolean(
+        string='Confirmado',
+        help='Registrar el depósito en la cuota encontrada solo por cliente'
+    )
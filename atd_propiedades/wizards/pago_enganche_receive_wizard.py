@@ -1,5 +1,4 @@
 from odoo import models, fields, api
-from odoo.exceptions import ValidationError
 
 class PagoEngancheReceiveWizard(models.TransientModel):
     _name = 'pago.enganche.receive.wizard'
@@ -70,68 +69,9 @@ class PagoEngancheReceiveWizard(models.TransientModel):
             })
         
         # Create account move
-        proyecto = self.pago_enganche_id.order_id.proyecto_id
-        if not proyecto.enganche_account_id:
-            raise ValidationError('Por favor configure la cuenta contable para enganches en el proyecto.')
-        
-        # Calculate retention if applicable
-        retention_amount = 0.0
-        if self.payment_type_id.has_retention:
-            if not self.payment_type_id.retention_account_id:
-                raise ValidationError('Por favor configure la cuenta de retención en el tipo de pago.')
-            iva = (self.amount_received / 1.12) * 0.12 
-            retention_amount = iva* (self.payment_type_id.retention_percentage / 100)
-
-        # Get the sale order reference
-        sale_order_ref = self.pago_enganche_id.order_id.name or ''
-        payment_ref = self.pago_enganche_id.name or ''
-        line_name = f'Recepción de enganche {payment_ref} (Pedido: {sale_order_ref})'
-        retention_line_name = f'Retención de enganche {payment_ref} (Pedido: {sale_order_ref})'
-
-        # Prepare move lines
-        move_lines = []
-        
-        # Credit line - always 100% to enganche account
-        move_lines.append((0, 0, {
-            'account_id': proyecto.enganche_account_id.id,
-            'debit': 0.0,
-            'credit': self.amount_received,
-            'name': line_name,
-        }))
-
-        if retention_amount > 0:
-            # Debit line split between journal and retention
-            move_lines.extend([
-                # Main payment to journal
-                (0, 0, {
-                    'account_id': self.journal_id.inbound_payment_method_line_ids[0].payment_account_id.id,
-                    'debit': self.amount_received - retention_amount,
-                    'credit': 0.0,
-                    'name': line_name,
-                }),
-                # Retention amount
-                (0, 0, {
-                    'account_id': self.payment_type_id.retention_account_id.id,
-                    'debit': retention_amount,
-                    'credit': 0.0,
-                    'name': retention_line_name,
-                })
-            ])
-        else:
-            # Full debit to journal
-            move_lines.append((0, 0, {
-                'account_id': self.journal_id.inbound_payment_method_line_ids[0].payment_account_id.id,
-                'debit': self.amount_received,
-                'credit': 0.0,
-                'name': line_name,
-            }))
-
-        move_vals = {
-            'journal_id': self.journal_id.id,
-            'date': self.received_date,
-            'ref': f'Recepción de enganche {self.pago_enganche_id.name}',
-            'line_ids': move_lines,
-        }
+        move_vals = self.pago_enganche_id._prepare_receive_move_vals(
+            self.journal_id, self.payment_type_id, self.amount_received, self.received_date
+        )
         move = self.env['account.move'].create(move_vals)
         move.action_post()
         
@@ -0,0 +1,167 @@
+from markupsafe import Markup, escape
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+from odoo.tools import format_amount
+import numpy as np
+
+class SaleOrderPlanSimulator(models.TransientModel):
+    _name = 'sale.order.plan.simulator'
+    _description = 'Simulador de Plan de Pagos de Enganche'
+
+    order_id = fields.Many2one(
+        'sale.order',
+        string='Orden de Venta',
+        required=True
+    )
+    currency_id = fields.Many2one(related='order_id.currency_id')
+    amount_total = fields.Monetary(related='order_id.amount_total', string='Total Venta')
+    first_payment_date = fields.Date(related='order_id.first_payment_date')
+    payment_deadline = fields.Date(related='order_id.proyecto_id.payment_deadline')
+    porcentajes = fields.Char(
+        string='Porcentajes de Enganche',
+        required=True,
+        default='0.10, 0.20, 0.30',
+        help='Porcentajes a evaluar separados por coma (ejemplo: 0.20 para 20%)'
+    )
+    cuotas = fields.Char(
+        string='Números de Cuotas',
+        required=True,
+        default='1, 6, 12, 24',
+        help='Números de cuotas a evaluar separados por coma'
+    )
+    reservas = fields.Char(
+        string='Montos de Reserva',
+        required=True,
+        default='10000',
+        help='Montos del primer pago a evaluar separados por coma'
+    )
+    tasa_fha = fields.Float(
+        string='Tasa Anual FHA (%)',
+        default=5.5
+    )
+    tasa_credito_directo = fields.Float(
+        string='Tasa Anual Crédito Directo (%)',
+        default=9.0
+    )
+    plazo_credito = fields.Integer(
+        string='Plazo del Crédito (años)',
+        default=25
+    )
+    result_html = fields.Html(
+        string='Escenarios',
+        compute='_compute_result_html',
+        sanitize=False
+    )
+
+    def _parse_values(self, text, label):
+        try:
+            values = [float(value) for value in (text or '').split(',') if value.strip()]
+        except ValueError:
+            raise UserError(_('Los valores de "%s" deben ser números separados por coma.') % label)
+        if not values:
+            raise UserError(_('Debe ingresar al menos un valor en "%s".') % label)
+        return np.array(values)
+
+    def _months_until_deadline(self):
+        """Number of installments allowed by the project deadline, same rule as
+        sale.order._check_enganche_payments_deadline"""
+        self.ensure_one()
+        if not self.payment_deadline or not self.first_payment_date:
+            return np.inf
+        return (self.payment_deadline.year - self.first_payment_date.year) * 12 + \
+               (self.payment_deadline.month - self.first_payment_date.month) + 1
+
+    def _simulate(self):
+        """Evaluate the percentage x installments x reserva grid with NumPy.
+
+        Returns a dict of flat arrays, one entry per scenario. Nothing is
+        written to the database.
+        """
+        self.ensure_one()
+        try:
+            import numpy_financial as npf
+        except ImportError:
+            raise UserError(_('La librería numpy-financial no está instalada.'))
+
+        porcentajes = self._parse_values(self.porcentajes, _('Porcentajes de Enganche'))
+        cuotas = self._parse_values(self.cuotas, _('Números de Cuotas'))
+        reservas = self._parse_values(self.reservas, _('Montos de Reserva'))
+        if ((porcentajes < 0) | (porcentajes > 1)).any():
+            raise UserError(_('El porcentaje de enganche debe estar entre 0 y 1 (ejemplo: 0.30 para 30%)'))
+        if (cuotas < 1).any():
+            raise UserError(_('El número de cuotas debe ser mayor a 0.'))
+
+        grid = np.meshgrid(porcentajes, np.floor(cuotas), reservas, indexing='ij')
+        porcentaje, cuota, reserva = (axis.ravel() for axis in grid)
+
+        total = self.amount_total
+        enganche = total * porcentaje
+        # Same split as sale.order._calculate_remaining_payment_amount: the
+        # reserva is the first payment and the rest is divided evenly
+        multiple = cuota > 1
+        monto_cuota = np.where(
+            multiple,
+            np.round((enganche - reserva) / np.where(multiple, cuota - 1, 1), 2),
+            enganche
+        )
+        saldo = total - enganche
+
+        periodos = max(self.plazo_credito, 1) * 12
+        cuota_fha = -npf.pmt(self.tasa_fha / 100 / 12, periodos, saldo)
+        cuota_directo = -npf.pmt(self.tasa_credito_directo / 100 / 12, periodos, saldo)
+
+        valido = (cuota <= self._months_until_deadline()) & (monto_cuota >= 0) & (reserva >= 10000)
+
+        return {
+            'porcentaje': porcentaje,
+            'cuotas': cuota.astype(int),
+            'reserva': reserva,
+            'enganche': enganche,
+            'monto_cuota': monto_cuota,
+            'saldo': saldo,
+            'cuota_fha': cuota_fha,
+            'cuota_directo': cuota_directo,
+            'valido': valido,
+        }
+
+    @api.depends('order_id', 'porcentajes', 'cuotas', 'reservas', 'tasa_fha', 'tasa_credito_directo', 'plazo_credito')
+    def _compute_result_html(self):
+        headers = [
+            _('Enganche %'), _('Cuotas'), _('Reserva'), _('Enganche'), _('Cuota Enganche'),
+            _('Saldo a Financiar'), _('Cuota FHA'), _('Cuota Crédito Directo'), _('Válido'),
+        ]
+        for wizard in self:
+            if not wizard.order_id:
+                wizard.result_html = False
+                continue
+            try:
+                result = wizard._simulate()
+            except UserError as e:
+                wizard.result_html = Markup('<p class="text-danger">%s</p>') % e.args[0]
+                continue
+
+            def money(amount):
+                return format_amount(wizard.env, amount, wizard.currency_id)
+
+            rows = []
+            for i in range(len(result['porcentaje'])):
+                cells = [
+                    '%.0f%%' % (result['porcentaje'][i] * 100),
+                    str(result['cuotas'][i]),
+                    money(result['reserva'][i]),
+                    money(result['enganche'][i]),
+                    money(result['monto_cuota'][i]),
+                    money(result['saldo'][i]),
+                    money(result['cuota_fha'][i]),
+                    money(result['cuota_directo'][i]),
+                    _('Sí') if result['valido'][i] else _('No'),
+                ]
+                row_class = '' if result['valido'][i] else ' class="text-muted"'
+                rows.append('<tr%s>%s</tr>' % (row_class, ''.join('<td>%s</td>' % escape(cell) for cell in cells)))
+
+            wizard.result_html = Markup(
+                '<table class="table table-sm table-striped"><thead><tr>%s</tr></thead><tbody>%s</tbody></table>' % (
+                    ''.join('<th>%s</th>' % escape(header) for header in headers),
+                    ''.join(rows),
+                )
+            )
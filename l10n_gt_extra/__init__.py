@@ -3,4 +3,15 @@
 from . import models
 from . import report
 
+def post_init_hook(cr_or_env, registry=None):
+    """Store the effective exchange rate of the invoices posted before the
+    module was installed. Receives (cr, registry) up to 16 and env from 17"""
+    from odoo import api, SUPERUSER_ID
+
+    if isinstance(cr_or_env, api.Environment):
+        env = cr_or_env
+    else:
+        env = api.Environment(cr_or_env, SUPERUSER_ID, {})
+    env['account.move']._calcular_tipo_cambio_validadas()
+
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -2,7 +2,7 @@
 
 {
     'name': 'Guatemala - Reportes y funcionalidad extra',
-    'version': '3.2',
+    'version': '3.3',
     'category': 'Localization',
     'description': """ Reportes requeridos por la SAT y otra funcionalidad extra para llevar un contabilidad en Guatemala. """,
     'author': 'aquíH',
@@ -21,11 +21,16 @@
         'views/reporte_inventario.xml',
         'views/reporte_diario.xml',
         'views/reporte_mayor.xml',
+        'views/reporte_balanza.xml',
         'views/l10n_gt_extra_view.xml',
+        'views/saldo_mensual_views.xml',
+        'views/reporte_trabajo_views.xml',
         'security/ir.model.access.csv',
+        'data/reporte_trabajo_data.xml',
     ],
     'demo': [],
     'installable': True,
     'license': 'Other OSI approved licence',
+    'post_init_hook': 'post_init_hook',
 }
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
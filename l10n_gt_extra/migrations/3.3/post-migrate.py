@@ -0,0 +1,13 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import api, SUPERUSER_ID
+
+def migrate(cr, version):
+    """Store the effective exchange rate of the invoices posted before it
+    existed, and recompute the ones stored with the rate of a taxed line"""
+    if not version:
+        return
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['account.move']._calcular_tipo_cambio_validadas()
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
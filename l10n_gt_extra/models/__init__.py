@@ -3,5 +3,8 @@
 from . import account
 from . import res_partner
 from . import l10n_gt_extra
+from . import saldo_mensual
+from . import reporte_trabajo
+from . import reporte_cache
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -3,7 +3,6 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 from odoo.addons.l10n_gt_extra import a_letras
-from odoo.release import version_info
 
 import datetime
 import logging
@@ -17,6 +16,7 @@ class AccountMove(models.Model):
     final_rango = fields.Integer(string="Final Rango")
     diario_facturas_por_rangos = fields.Boolean(string="Las facturas se ingresan por rango", help="Cada factura realmente es un rango de factura y el rango se ingresa en Referencia/Descripción", related="journal_id.facturas_por_rangos")
     nota_debito = fields.Boolean(string="Nota de debito")
+    tipo_cambio_efectivo = fields.Float(string="Tipo de cambio efectivo", readonly=True, copy=False, help="Total por cobrar o por pagar entre el total de las facturas en moneda extranjera al validarlas, usado por los libros de compras y ventas")
 
     def suma_impuesto(self,impuestos_ids):
         suma_monto = 0
@@ -79,6 +79,66 @@ class AccountMove(models.Model):
 
                 self.name = "{}-{} al {}-{}".format(factura.serie_rango, factura.inicial_rango, factura.serie_rango, factura.final_rango)
 
+    def _actualizar_tipo_cambio(self):
+        """Store the effective exchange rate of the foreign currency moves
+        of self, the receivable/payable total over the invoice total"""
+        self._calcular_tipo_cambio('m.id in %s', (tuple(self.ids),))
+
+    @api.model
+    def _calcular_tipo_cambio(self, filtro, parametros=()):
+        self.env.cr.execute('update account_move m set tipo_cambio_efectivo = t.tipo_cambio from (' \
+                'select m.id, abs(sum(l.debit - l.credit) / nullif(m.amount_total, 0)) as tipo_cambio ' \
+                'from account_move m join res_company c on (m.company_id = c.id) ' \
+                'join account_move_line l on (l.move_id = m.id) join account_account a on (l.account_id = a.id) ' \
+                'where a.reconcile and m.currency_id != c.currency_id and ' + filtro + ' group by m.id, m.amount_total' \
+            ') t where m.id = t.id',
+        parametros)
+        return self.env.cr.rowcount
+
+    @api.model
+    def _calcular_tipo_cambio_validadas(self):
+        """Store the rate of every posted foreign currency move, for the
+        moves posted before the field existed"""
+        cantidad = self._calcular_tipo_cambio('m.state = \'posted\'')
+        logging.getLogger(__name__).info('Tipo de cambio efectivo guardado en %s facturas', cantidad)
+        self.env['l10n_gt_extra.capacidades'].invalidar(self, ['tipo_cambio_efectivo'])
+
+    def _registrar_validadas(self):
+        """Add the moves just posted to the monthly balances and store their
+        effective exchange rate"""
+        self.env['l10n_gt_extra.saldo_mensual'].registrar_movimientos(self, 1)
+        if self:
+            capacidades = self.env['l10n_gt_extra.capacidades']
+            capacidades.guardar_cambios('account.move', ['currency_id', 'company_id', 'amount_total'])
+            capacidades.guardar_cambios('account.move.line', ['move_id', 'account_id', 'debit', 'credit'])
+            self._actualizar_tipo_cambio()
+            capacidades.invalidar(self, ['tipo_cambio_efectivo'])
+
+    def _post(self, soft=True):
+        posted = super(AccountMove, self)._post(soft)
+        posted._registrar_validadas()
+        return posted
+
+    def post(self):
+        # Odoo 13 posts through post(), 14 and later through _post()
+        if self.env['l10n_gt_extra.capacidades'].capacidades()['move_post']:
+            return super(AccountMove, self).post()
+        borradores = self.filtered(lambda m: m.state != 'posted')
+        res = super(AccountMove, self).post()
+        borradores.filtered(lambda m: m.state == 'posted')._registrar_validadas()
+        return res
+
+    def button_draft(self):
+        if not self.env.context.get('l10n_gt_extra_saldo_registrado'):
+            self.env['l10n_gt_extra.saldo_mensual'].registrar_movimientos(self.filtered(lambda m: m.state == 'posted'), -1)
+        return super(AccountMove, self).button_draft()
+
+    def button_cancel(self):
+        # On 16 button_cancel resets the posted moves with button_draft, on
+        # older versions it cancels them directly; remove them only once
+        self.env['l10n_gt_extra.saldo_mensual'].registrar_movimientos(self.filtered(lambda m: m.state == 'posted'), -1)
+        return super(AccountMove, self.with_context(l10n_gt_extra_saldo_registrado=True)).button_cancel()
+
 class AccountPayment(models.Model):
     _inherit = "account.payment"
 
@@ -103,10 +163,11 @@ class AccountPayment(models.Model):
         return super(AccountPayment, self).action_cancel()
 
     def anular(self):
+        capacidades = self.env['l10n_gt_extra.capacidades'].capacidades()
         for rec in self:
             move = self.env['account.move']
             
-            if 'move_line_ids' in rec.fields_get():
+            if capacidades['pago_move_line_ids']:
                 move += rec.move_line_ids.mapped('move_id')
             else:
                 move += rec.move_id
@@ -116,7 +177,7 @@ class AccountPayment(models.Model):
             move.line_ids.remove_move_reconcile()
             move.line_ids.write({ 'debit': 0, 'credit': 0, 'amount_currency': 0 })
 
-            if version_info[0] > 13:
+            if capacidades['move_post']:
                 move._post()
             else:
                 move.post()
@@ -131,3 +192,35 @@ class AccountJournal(models.Model):
     codigo_establecimiento = fields.Integer(string='Código de establecimiento')
     facturas_por_rangos = fields.Boolean(string='Las facturas se ingresan por rango', help='Cada factura realmente es un rango de factura y el rango se ingresa en Referencia/Descripción')
     usar_referencia = fields.Boolean(string='Usar referencia para libro de ventas', help='El número de la factua se ingresa en Referencia/Descripción')
+
+class AccountTax(models.Model):
+    _inherit = "account.tax"
+
+    def compute_all_memoria(self, memoria, price_unit, currency=None, quantity=1.0, product=None, partner=None):
+        """compute_all memoized in the dict memoria, for reports that compute
+        the same taxes on many identical lines.
+
+        The key is the tax set, the price, the quantity, the currency and the
+        price_include flags. Product and partner are only part of it, and only
+        passed on, when a python tax of the set reads them."""
+        impuestos = self.sorted('id')
+        llave_impuestos = tuple(impuestos.ids)
+        if llave_impuestos not in memoria:
+            codigo = ''.join(t.python_compute or '' for t in impuestos.flatten_taxes_hierarchy() if t.amount_type == 'code')
+            memoria[llave_impuestos] = ('product' in codigo, 'partner' in codigo)
+        usa_producto, usa_cliente = memoria[llave_impuestos]
+
+        producto = product if usa_producto else None
+        cliente = partner if usa_cliente else None
+        llave = (
+            llave_impuestos,
+            round(price_unit, 10),
+            quantity,
+            currency.id if currency else None,
+            tuple(impuestos.mapped('price_include')),
+            producto.id if producto else None,
+            cliente.id if cliente else None,
+        )
+        if llave not in memoria:
+            memoria[llave] = self.compute_all(price_unit, currency=currency, quantity=quantity, product=producto, partner=cliente)
+        return memoria[llave]
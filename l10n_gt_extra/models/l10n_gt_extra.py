@@ -1,6 +1,7 @@
 # -*- encoding: utf-8 -*-
 
 from odoo import api, fields, models, tools, SUPERUSER_ID
+from odoo.release import version_info
 
 class L10nGtExtraImpuestos(models.Model):
     _name = "l10n_gt_extra.impuestos"
@@ -18,3 +19,83 @@ class L10nGtExtraImpuestosRangos(models.Model):
     rango_final = fields.Float('Rango final')
     impuestos_ids = fields.Many2many('account.tax','impuestos_rangos_rel', string='Impuestos')
     impuesto_id = fields.Many2one('l10n_gt_extra.impuestos','Impuesto global')
+
+class L10nGtExtraCapacidades(models.AbstractModel):
+    _name = "l10n_gt_extra.capacidades"
+    _description = "Capacidades de la base de datos para reportes"
+
+    @api.model
+    @tools.ormcache()
+    def capacidades(self):
+        """Fields and SQL fragments that depend on the Odoo version or on
+        the installed modules (FEL, GFACE, tickets).
+
+        Computed once per registry: the ormcache is dropped whenever the
+        registry is reloaded, e.g. after installing or updating a module.
+        """
+        Move = self.env['account.move']
+        MoveLine = self.env['account.move.line']
+        Account = self.env['account.account']
+
+        if 'user_type_id' in Account._fields:
+            include_initial_balance = 't.include_initial_balance'
+            join_initial_balance = 'join account_account_type t on (t.id = a.user_type_id)'
+            account_type = 't.id'
+            grupo_balance = 'case when t.id in (1, 3, 5, 6, 7, 8) then \'activo\' when t.id in (2, 4, 9, 10) then \'pasivo\' when t.id = 11 then \'capital\' end'
+        else:
+            include_initial_balance = 'a.include_initial_balance'
+            join_initial_balance = ''
+            account_type = 'a.account_type'
+            # Escaped for cr.execute with parameters
+            grupo_balance = 'case when a.account_type like \'asset%%\' then \'activo\' when a.account_type like \'liability%%\' then \'pasivo\' when a.account_type like \'equity%%\' then \'capital\' end'
+
+        if 'exclude_from_invoice_tab' in MoveLine._fields:
+            lineas_factura = 'l.display_type is null and not l.exclude_from_invoice_tab'
+        else:
+            lineas_factura = 'l.display_type = \'product\''
+
+        return tools.frozendict({
+            'tipo_interno': 'type' if 'type' in Move._fields else 'move_type',
+            'firma_fel': 'firma_fel' in Move._fields,
+            'firma_gface': 'firma_gface' in Move._fields,
+            'requiere_resolucion': 'requiere_resolucion' in self.env['account.journal']._fields,
+            'tipos_de_cuenta': 'user_type_id' in Account._fields,
+            'include_initial_balance': include_initial_balance,
+            'join_initial_balance': join_initial_balance,
+            'account_type': account_type,
+            'grupo_balance': grupo_balance,
+            'lineas_factura': lineas_factura,
+            'analytic_account_id': 'analytic_account_id' in Move._fields,
+            'pago_move_line_ids': 'move_line_ids' in self.env['account.payment']._fields,
+            # account.move also has _post on 13 through this module's override
+            'move_post': version_info[0] >= 14,
+        })
+
+    @api.model
+    def guardar_cambios(self, modelo=None, campos=None):
+        """Flush the pending writes of campos of modelo, or of every model,
+        before reading the tables with SQL: flush_all and flush_model on 16,
+        flush on 13 to 15"""
+        if not modelo:
+            if hasattr(self.env, 'flush_all'):
+                self.env.flush_all()
+            else:
+                self.env['base'].flush()
+            return
+        registros = self.env[modelo]
+        if hasattr(registros, 'flush_model'):
+            registros.flush_model(campos)
+        else:
+            registros.flush(campos)
+
+    @api.model
+    def invalidar(self, registros, campos=None):
+        """Drop campos of registros, or of every record of their model when
+        registros is empty, from the cache after updating them with SQL"""
+        if hasattr(registros, 'invalidate_model'):
+            if registros:
+                registros.invalidate_recordset(campos)
+            else:
+                registros.invalidate_model(campos)
+        else:
+            registros.invalidate_cache(campos, registros.ids or None)
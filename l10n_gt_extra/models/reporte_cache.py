@@ -0,0 +1,173 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import api, fields, models
+import base64
+import datetime
+import hashlib
+import json
+import logging
+import zlib
+
+_logger = logging.getLogger(__name__)
+
+# Results read within this interval keep their last use, so hits do not
+# rewrite the same row on every read
+INTERVALO_USO = '1 hour'
+
+class L10nGtExtraReporteCache(models.Model):
+    _name = "l10n_gt_extra.reporte_cache"
+    _description = "Resultados de libros en caché"
+    _order = "ultimo_uso desc"
+    _log_access = False
+
+    reporte = fields.Char('Reporte', required=True, readonly=True)
+    llave = fields.Char('Llave', required=True, readonly=True)
+    huella = fields.Char('Huella', required=True, readonly=True)
+    datos = fields.Binary('Datos', attachment=False, readonly=True)
+    tamano = fields.Integer('Tamaño', readonly=True)
+    ultimo_uso = fields.Datetime('Último uso', readonly=True, index=True)
+
+    _sql_constraints = [
+        ('llave_uniq', 'unique(llave)', 'Solo puede existir un resultado por llave.'),
+    ]
+
+    def _codificar(self, valor):
+        if isinstance(valor, datetime.datetime):
+            return {'__fechahora__': fields.Datetime.to_string(valor)}
+        if isinstance(valor, datetime.date):
+            return {'__fecha__': fields.Date.to_string(valor)}
+        if isinstance(valor, models.BaseModel):
+            return {'__registros__': [valor._name, valor.ids]}
+        # dict_values and other iterables built by the books
+        return list(valor)
+
+    def _decodificar(self, valor):
+        if len(valor) == 1:
+            if '__fecha__' in valor:
+                return fields.Date.to_date(valor['__fecha__'])
+            if '__fechahora__' in valor:
+                return fields.Datetime.to_datetime(valor['__fechahora__'])
+            if '__registros__' in valor:
+                modelo, ids = valor['__registros__']
+                return self.env[modelo].browse(ids)
+        return valor
+
+    def _serializar(self, resultado):
+        texto = json.dumps(resultado, default=self._codificar, separators=(',', ':'))
+        return base64.b64encode(zlib.compress(texto.encode()))
+
+    def _deserializar(self, datos):
+        texto = zlib.decompress(base64.b64decode(bytes(datos))).decode()
+        return json.loads(texto, object_hook=self._decodificar)
+
+    @api.model
+    def _limite(self):
+        """Maximum size in bytes of the cache, 0 disables it"""
+        return int(self.env['ir.config_parameter'].sudo().get_param('l10n_gt_extra.reporte_cache_limite', 64 * 1024 * 1024))
+
+    def _normalizar(self, valor):
+        """Same value for the same input whether it comes from read(),
+        the Excel export or a background job"""
+        if isinstance(valor, (list, tuple)):
+            if len(valor) == 2 and isinstance(valor[0], int) and isinstance(valor[1], str):
+                # Many2one as returned by read()
+                return valor[0]
+            if all(isinstance(v, int) for v in valor):
+                return sorted(valor)
+        if isinstance(valor, datetime.date):
+            return str(valor)
+        return valor
+
+    @api.model
+    def obtener(self, reporte, datos, campos, huella, calcular):
+        """Return the result of calcular(), reusing the stored one when the
+        same report was generated with the same values of campos in datos
+        and the same huella.
+
+        campos are the inputs of the wizard the result depends on. huella is
+        a function returning a fingerprint of the data the report reads
+        (counts and last write dates), or None to skip the cache.
+        """
+        limite = self._limite()
+        if not limite:
+            return calcular()
+        huella = huella()
+        if huella is None:
+            return calcular()
+
+        parametros = {campo: self._normalizar(datos.get(campo)) for campo in campos}
+        llave = hashlib.sha1(json.dumps([reporte, parametros, self.env.company.id, self.env.lang], sort_keys=True, default=str).encode()).hexdigest()
+        huella = hashlib.sha1(json.dumps(huella, default=str).encode()).hexdigest()
+
+        self.env.cr.execute('select id, datos, ultimo_uso < now() at time zone \'UTC\' - interval %s from l10n_gt_extra_reporte_cache where llave = %s and huella = %s',
+            (INTERVALO_USO, llave, huella))
+        fila = self.env.cr.fetchone()
+        if fila:
+            _logger.debug('Resultado de %s tomado de la caché', reporte)
+            if fila[2]:
+                self.env.cr.execute('update l10n_gt_extra_reporte_cache set ultimo_uso = now() at time zone \'UTC\' ' \
+                    'where id = %s and ultimo_uso < now() at time zone \'UTC\' - interval %s',
+                (fila[0], INTERVALO_USO))
+            return self._deserializar(fila[1])
+
+        resultado = calcular()
+        datos = self._serializar(resultado)
+        self.env.cr.execute('insert into l10n_gt_extra_reporte_cache (reporte, llave, huella, datos, tamano, ultimo_uso) ' \
+            'values (%s, %s, %s, %s, %s, now() at time zone \'UTC\') ' \
+            'on conflict (llave) do update set huella = excluded.huella, datos = excluded.datos, tamano = excluded.tamano, ultimo_uso = excluded.ultimo_uso',
+        (reporte, llave, huella, datos, len(datos)))
+        self._desalojar(limite)
+        return resultado
+
+    @api.model
+    def huella_cuentas(self, cuentas, fecha_hasta):
+        """Fingerprint of the posted lines of cuentas up to fecha_hasta, the
+        opening balances included, of their moves (number and reference),
+        of the accounts themselves and of the partners, whose names the
+        ledgers show"""
+        if not cuentas:
+            return None
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios()
+        self.env.cr.execute('select count(l.id), max(l.write_date), max(m.write_date), (select max(a.write_date) from account_account a where a.id in %s), ' \
+                '(select max(p.write_date) from res_partner p) ' \
+            'from account_move_line l join account_move m on (l.move_id = m.id) ' \
+            'where l.parent_state = \'posted\' and l.account_id in %s and l.date <= %s',
+        (tuple(cuentas), tuple(cuentas), fecha_hasta))
+        return self.env.cr.fetchone()
+
+    @api.model
+    def huella_diarios(self, diarios, fecha_desde, fecha_hasta):
+        """Fingerprint of the moves of diarios between both dates, in any
+        state, of their lines, and of what the books read from their
+        partners (name, NIT, pequeño contribuyente), products, journals and
+        taxes"""
+        if not diarios:
+            return None
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios()
+        self.env.cr.execute('select count(distinct m.id), count(l.id), max(m.write_date), max(l.write_date), max(p.write_date), max(t.write_date), ' \
+                '(select max(j.write_date) from account_journal j where j.id in %s), ' \
+                '(select max(i.write_date) from account_tax i) ' \
+            'from account_move m left join account_move_line l on (l.move_id = m.id) left join res_partner p on (m.partner_id = p.id) ' \
+                'left join product_product pp on (l.product_id = pp.id) left join product_template t on (pp.product_tmpl_id = t.id) ' \
+            'where m.journal_id in %s and m.date >= %s and m.date <= %s',
+        (tuple(diarios), tuple(diarios), fecha_desde, fecha_hasta))
+        return self.env.cr.fetchone()
+
+    @api.model
+    def _desalojar(self, limite):
+        """Drop the least recently used results beyond limite bytes"""
+        self.env.cr.execute('delete from l10n_gt_extra_reporte_cache where id in (' \
+            'select id from (select id, sum(tamano) over (order by ultimo_uso desc, id desc) as acumulado from l10n_gt_extra_reporte_cache) c ' \
+            'where acumulado > %s)',
+        (limite,))
+        if self.env.cr.rowcount:
+            _logger.info('%s resultados de libros eliminados de la caché', self.env.cr.rowcount)
+        self.env['l10n_gt_extra.capacidades'].invalidar(self)
+
+    @api.model
+    def limpiar(self):
+        self.env.cr.execute('delete from l10n_gt_extra_reporte_cache')
+        self.env['l10n_gt_extra.capacidades'].invalidar(self)
+        return True
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,234 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import api, fields, models, _
+from odoo.release import version_info
+from markupsafe import Markup
+import contextlib
+import itertools
+import json
+import logging
+import traceback
+
+_logger = logging.getLogger(__name__)
+
+class L10nGtExtraReporteTrabajo(models.Model):
+    _name = "l10n_gt_extra.reporte_trabajo"
+    _description = "Reporte en segundo plano"
+    _inherit = ['mail.thread']
+    _order = "id desc"
+
+    name = fields.Char('Reporte', required=True, readonly=True)
+    modelo = fields.Char('Asistente', required=True, readonly=True)
+    formato = fields.Selection([('pdf', 'PDF'), ('xlsx', 'Excel')], 'Formato', required=True, readonly=True)
+    parametros = fields.Text('Parámetros', required=True, readonly=True)
+    llave = fields.Char('Llave', required=True, readonly=True, index=True)
+    company_id = fields.Many2one('res.company', 'Compañía', required=True, readonly=True, default=lambda self: self.env.company)
+    user_ids = fields.Many2many('res.users', string='Solicitado por', readonly=True)
+    state = fields.Selection([
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('terminado', 'Terminado'),
+        ('error', 'Error'),
+    ], 'Estado', default='pendiente', required=True, readonly=True, index=True, tracking=True)
+    avance_ids = fields.One2many('l10n_gt_extra.reporte_trabajo_avance', 'trabajo_id', 'Avance', readonly=True)
+    progreso = fields.Integer('Progreso', compute='_compute_avance')
+    etapa = fields.Char('Etapa', compute='_compute_avance')
+    fecha_inicio = fields.Datetime('Inicio', readonly=True)
+    fecha_fin = fields.Datetime('Fin', readonly=True)
+    attachment_id = fields.Many2one('ir.attachment', 'Archivo', readonly=True)
+    error = fields.Text('Error', readonly=True)
+
+    @api.depends('state', 'avance_ids.progreso', 'avance_ids.etapa')
+    def _compute_avance(self):
+        for trabajo in self:
+            avance = trabajo.avance_ids[:1]
+            trabajo.progreso = 100 if trabajo.state == 'terminado' else avance.progreso
+            trabajo.etapa = avance.etapa if trabajo.state == 'en_proceso' else False
+
+    def _despertar_cron(self):
+        cron = self.env.ref('l10n_gt_extra.ir_cron_reporte_trabajo').sudo()
+        if hasattr(cron, '_trigger'):
+            cron._trigger()
+        else:
+            # ir.cron triggers exist since 15
+            cron.write({'nextcall': fields.Datetime.now()})
+
+    @api.model
+    def encolar(self, asistente, formato, nombre, llave, parametros):
+        """Return the pending or running job with the same key, adding the
+        current user to it, or create a new one"""
+        trabajo = self.search([('llave', '=', llave), ('state', 'in', ['pendiente', 'en_proceso'])], limit=1)
+        if trabajo:
+            trabajo.user_ids = [(4, self.env.uid)]
+            return trabajo
+
+        trabajo = self.create({
+            'name': nombre,
+            'modelo': asistente._name,
+            'formato': formato,
+            'parametros': json.dumps(parametros),
+            'llave': llave,
+            'user_ids': [(4, self.env.uid)],
+        })
+        self._despertar_cron()
+        return trabajo
+
+    @api.model
+    def informar_avance(self, progreso, etapa=None):
+        """Store the progress of the job running in this environment, if
+        any. It is written through its own cursor, so it is visible while
+        the job runs without committing the job's transaction, and in the
+        progress table, so the job row is only updated by the job itself"""
+        trabajo_id = self.env.context.get('reporte_trabajo_id')
+        if not trabajo_id:
+            return
+        consulta = 'insert into l10n_gt_extra_reporte_trabajo_avance as a (trabajo_id, progreso, etapa) values (%s, %s, %s) ' \
+            'on conflict (trabajo_id) do update set progreso = excluded.progreso, etapa = coalesce(excluded.etapa, a.etapa)'
+        if self.env.registry.in_test_mode():
+            self.env.cr.execute(consulta, (trabajo_id, progreso, etapa))
+            return
+        with self.env.registry.cursor() as cr:
+            cr.execute(consulta, (trabajo_id, progreso, etapa))
+
+    @api.model
+    def avance(self, total, desde, hasta, etapa):
+        """Function to call once per item of a loop over total items,
+        reporting the progress from desde to hasta in steps of 5%"""
+        if not self.env.context.get('reporte_trabajo_id') or not total:
+            return lambda: None
+        self.informar_avance(desde, etapa)
+        paso = max(1, total // 20)
+        contador = itertools.count(1)
+
+        def avanzar():
+            i = next(contador)
+            if i % paso == 0:
+                self.informar_avance(desde + (hasta - desde) * i // total)
+        return avanzar
+
+    @api.model
+    def _cron_procesar(self, limite=10):
+        """Run up to limite pending jobs, each in its own transaction"""
+        for i in range(limite):
+            self.env.cr.execute('select id from l10n_gt_extra_reporte_trabajo where state = \'pendiente\' ' \
+                'order by id limit 1 for no key update skip locked')
+            fila = self.env.cr.fetchone()
+            if not fila:
+                break
+            self.browse(fila[0])._procesar()
+
+    def _tomar(self):
+        """Mark the job en_proceso, answering with it the pending requests
+        with the same parameters, and commit that before it starts"""
+        duplicados = self.search([('llave', '=', self.llave), ('state', '=', 'pendiente'), ('id', '!=', self.id)])
+        usuarios = self.user_ids | duplicados.user_ids
+        duplicados.unlink()
+        self.avance_ids.unlink()
+        self.write({'state': 'en_proceso', 'fecha_inicio': fields.Datetime.now(), 'error': False, 'user_ids': [(6, 0, usuarios.ids)]})
+        if not self.env.registry.in_test_mode():
+            self.env.cr.commit()
+            # Lock the row again for the rest of the run; requests added
+            # meanwhile only insert into the users table, which does not
+            # conflict with this lock
+            self.env.cr.execute('select id from l10n_gt_extra_reporte_trabajo where id = %s for no key update', (self.id,))
+
+    def _procesar(self):
+        """Generate the file in the job's transaction, which is committed
+        only once the job is done or has failed. A failure rolls back to a
+        savepoint, so the row stays locked while the error is stored"""
+        self.ensure_one()
+        self._tomar()
+        self.with_context(reporte_trabajo_id=self.id).informar_avance(5, _('Preparando'))
+
+        try:
+            with self._instantanea() as instantanea, self.env.cr.savepoint():
+                asistente = self.env[self.modelo].with_user(self.user_ids[:1] or self.env.user).with_company(self.company_id) \
+                    .with_context(reporte_trabajo_id=self.id, reporte_instantanea=instantanea).create(json.loads(self.parametros))
+                if self.formato == 'pdf':
+                    adjunto = asistente._generar_pdf()
+                else:
+                    adjunto = asistente._generar_excel()
+                adjunto.sudo().write({'res_model': self._name, 'res_id': self.id})
+        except Exception:
+            _logger.exception('No se pudo generar el reporte %s', self.name)
+            self.env.clear()
+            self.write({'state': 'error', 'fecha_fin': fields.Datetime.now(), 'error': traceback.format_exc()})
+            self._notificar(body=_('No se pudo generar el reporte.'))
+        else:
+            self.write({'state': 'terminado', 'fecha_fin': fields.Datetime.now(), 'attachment_id': adjunto.id})
+            self._notificar(
+                body=Markup('%s <a href="/web/content/%s?download=true">%s</a>') % (_('Reporte generado:'), adjunto.id, adjunto.name),
+                attachment_ids=adjunto.ids,
+            )
+
+        if not self.env.registry.in_test_mode():
+            self.env.cr.commit()
+
+    @contextlib.contextmanager
+    def _instantanea(self):
+        """Snapshot of the committed data, exported from a read-only cursor
+        that stays open while the job runs.
+
+        The job's transaction has already written its own row, and the
+        partitions of a book cannot import the snapshot of a transaction
+        with writes. The books only read committed accounting data, so they
+        import this one instead and can still be split."""
+        if self.env.registry.in_test_mode():
+            yield None
+            return
+        with self.env.registry.cursor() as cr:
+            cr.execute('set transaction read only')
+            cr.execute('select pg_export_snapshot()')
+            yield cr.fetchone()[0]
+
+    def _notificar(self, **valores):
+        """Post a comment on the job for the users who asked for it; the
+        subtype argument is subtype_xmlid from 14 on"""
+        valores['partner_ids'] = self._solicitantes().partner_id.ids
+        if version_info[0] >= 14:
+            valores['subtype_xmlid'] = 'mail.mt_comment'
+        else:
+            valores['subtype'] = 'mail.mt_comment'
+        return self.message_post(**valores)
+
+    def _solicitantes(self):
+        """Users of the job, including those who asked for it while it ran,
+        whose rows the snapshot of the job's transaction does not see"""
+        if self.env.registry.in_test_mode():
+            return self.user_ids
+        campo = self._fields['user_ids']
+        with self.env.registry.cursor() as cr:
+            cr.execute('select %s from %s where %s = %%s' % (campo.column2, campo.relation, campo.column1), (self.id,))
+            return self.env['res.users'].browse([r[0] for r in cr.fetchall()])
+
+    def action_reintentar(self):
+        """Queue again the failed jobs, and the ones left en_proceso by a
+        worker that died: running jobs keep their row locked"""
+        trabajos = self.filtered(lambda t: t.state == 'error')
+        en_proceso = self.filtered(lambda t: t.state == 'en_proceso')
+        if en_proceso:
+            self.env.cr.execute('select id from l10n_gt_extra_reporte_trabajo where id in %s for no key update skip locked', (tuple(en_proceso.ids),))
+            trabajos |= self.browse([r[0] for r in self.env.cr.fetchall()])
+        trabajos.write({'state': 'pendiente', 'error': False})
+        self._despertar_cron()
+
+    def action_descargar(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % self.attachment_id.id,
+            'target': 'self',
+        }
+
+class L10nGtExtraReporteTrabajoAvance(models.Model):
+    _name = "l10n_gt_extra.reporte_trabajo_avance"
+    _description = "Avance de un reporte en segundo plano"
+    _log_access = False
+
+    trabajo_id = fields.Many2one('l10n_gt_extra.reporte_trabajo', 'Reporte', required=True, readonly=True, ondelete='cascade')
+    progreso = fields.Integer('Progreso', readonly=True)
+    etapa = fields.Char('Etapa', readonly=True)
+
+    _sql_constraints = [
+        ('trabajo_uniq', 'unique(trabajo_id)', 'Solo puede existir un avance por reporte.'),
+    ]
@@ -0,0 +1,104 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import api, fields, models
+import logging
+
+_logger = logging.getLogger(__name__)
+
+class L10nGtExtraSaldoMensual(models.Model):
+    _name = "l10n_gt_extra.saldo_mensual"
+    _description = "Saldo mensual por cuenta"
+    _order = "mes, account_id"
+    _log_access = False
+
+    company_id = fields.Many2one('res.company', 'Compañía', required=True, readonly=True, ondelete='cascade')
+    account_id = fields.Many2one('account.account', 'Cuenta', required=True, readonly=True, ondelete='cascade')
+    mes = fields.Date('Mes', required=True, readonly=True, help='Primer día del mes')
+    debe = fields.Float('Debe', readonly=True)
+    haber = fields.Float('Haber', readonly=True)
+
+    _sql_constraints = [
+        ('cuenta_mes_uniq', 'unique(account_id, mes, company_id)', 'Solo puede existir un saldo por cuenta y mes.'),
+    ]
+
+    def init(self):
+        self.env.cr.execute('select 1 from l10n_gt_extra_saldo_mensual limit 1')
+        if not self.env.cr.fetchone():
+            self.reconstruir()
+
+    @api.model
+    def reconstruir(self):
+        """Rebuild every snapshot from the posted move lines"""
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios('account.move.line', ['account_id', 'company_id', 'date', 'debit', 'credit', 'parent_state'])
+        self.env.cr.execute('delete from l10n_gt_extra_saldo_mensual')
+        self.env.cr.execute('insert into l10n_gt_extra_saldo_mensual (company_id, account_id, mes, debe, haber) ' \
+            'select l.company_id, l.account_id, date_trunc(\'month\', l.date)::date, sum(l.debit), sum(l.credit) ' \
+            'from account_move_line l where l.parent_state = \'posted\' group by 1, 2, 3')
+        _logger.info('%s saldos mensuales reconstruidos', self.env.cr.rowcount)
+        self.env['l10n_gt_extra.capacidades'].invalidar(self)
+        return True
+
+    @api.model
+    def registrar_movimientos(self, moves, signo):
+        """Add (signo=1) or remove (signo=-1) the lines of moves to the
+        snapshots of their months.
+
+        Deltas are upserted, so concurrent postings on the same account and
+        month serialize on the snapshot row instead of overwriting each other.
+        """
+        if not moves:
+            return
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios('account.move.line', ['move_id', 'account_id', 'company_id', 'date', 'debit', 'credit'])
+        self.env.cr.execute('insert into l10n_gt_extra_saldo_mensual as s (company_id, account_id, mes, debe, haber) ' \
+            'select l.company_id, l.account_id, date_trunc(\'month\', l.date)::date, %s * sum(l.debit), %s * sum(l.credit) ' \
+            'from account_move_line l where l.move_id in %s group by 1, 2, 3 ' \
+            'on conflict (account_id, mes, company_id) do update set debe = s.debe + excluded.debe, haber = s.haber + excluded.haber',
+        (signo, signo, tuple(moves.ids)))
+        self.env['l10n_gt_extra.capacidades'].invalidar(self)
+
+    @api.model
+    def sumar(self, cuentas, fecha_hasta, fecha_inicio=None):
+        """Balance (debit - credit) of posted lines per account, for dates
+        before fecha_hasta and, if given, from fecha_inicio.
+
+        Whole months come from the snapshots and only the days of the month
+        of fecha_hasta are read from account_move_line. fecha_inicio must be
+        the first day of a month. Returns {account_id: saldo}.
+        """
+        if not cuentas:
+            return {}
+        fecha_hasta = fields.Date.to_date(fecha_hasta)
+        mes = fecha_hasta.replace(day=1)
+        fecha_inicio = fields.Date.to_date(fecha_inicio) if fecha_inicio else None
+        if fecha_inicio and fecha_inicio > mes:
+            mes = fecha_inicio
+
+        filtro_inicio = 'and s.mes >= %(inicio)s ' if fecha_inicio else ''
+        self.env.cr.execute('select cuenta, sum(saldo) from (' \
+            'select s.account_id as cuenta, sum(s.debe - s.haber) as saldo from l10n_gt_extra_saldo_mensual s ' \
+            'where s.account_id in %(cuentas)s and s.mes < %(mes)s ' + filtro_inicio + 'group by s.account_id ' \
+            'union all ' \
+            'select l.account_id, sum(l.debit - l.credit) from account_move_line l ' \
+            'where l.parent_state = \'posted\' and l.account_id in %(cuentas)s and l.date >= %(mes)s and l.date < %(hasta)s ' \
+            'group by l.account_id' \
+            ') saldos group by cuenta',
+        {'cuentas': tuple(cuentas), 'mes': mes, 'inicio': fecha_inicio, 'hasta': fecha_hasta})
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def saldos_iniciales(self, cuentas, fecha_desde):
+        """Opening balance at fecha_desde of every account: accounts with
+        include_initial_balance carry all previous years, the others start on
+        January 1. Returns {account_id: saldo}."""
+        if not cuentas:
+            return {}
+        cuentas = self.env['account.account'].browse(cuentas)
+        if self.env['l10n_gt_extra.capacidades'].capacidades()['tipos_de_cuenta']:
+            arrastre = cuentas.filtered('user_type_id.include_initial_balance')
+        else:
+            arrastre = cuentas.filtered('include_initial_balance')
+
+        fecha = fields.Date.to_date(fecha_desde)
+        saldos = self.sumar(arrastre.ids, fecha)
+        saldos.update(self.sumar((cuentas - arrastre).ids, fecha, fecha.replace(month=1, day=1)))
+        return saldos
@@ -20,6 +20,9 @@
 #
 ##############################################################################
 
+from . import asistente_excel
+from . import asistente_segundo_plano
+from . import reporte_particionado
 from . import asistente_reporte_banco
 from . import reporte_banco
 from . import asistente_reporte_compras
@@ -33,5 +36,7 @@ from . import asistente_reporte_diario
 from . import reporte_diario
 from . import asistente_reporte_mayor
 from . import reporte_mayor
+from . import asistente_reporte_balanza
+from . import reporte_balanza
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
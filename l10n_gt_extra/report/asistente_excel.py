@@ -0,0 +1,114 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import models
+from odoo.release import version_info
+import base64
+import hashlib
+import os
+import shutil
+import tempfile
+import xlsxwriter
+
+# Bytes read at a time from the exported file
+BLOQUE = 1024 * 1024
+
+class AsistenteExcel(models.AbstractModel):
+    _name = 'l10n_gt_extra.asistente_excel'
+    _description = 'Exportación de libros a Excel'
+
+    def _celdas(self, y, celdas):
+        """Cells of row y from a list with one value per column. A value can
+        be a (valor, formato) tuple, formato being 'fecha' or 'numero'; None
+        leaves the column empty."""
+        for x, celda in enumerate(celdas):
+            if celda is None:
+                continue
+            valor, formato = celda if isinstance(celda, tuple) else (celda, None)
+            yield y, x, valor, formato
+
+    def _filas_encabezado(self, titulo, compania, fecha_desde, fecha_hasta):
+        """Rows 0 to 3, shared by every book"""
+        partner = compania.partner_id
+        yield from self._celdas(0, [titulo])
+        yield from self._celdas(2, ['NUMERO DE IDENTIFICACION TRIBUTARIA', partner.vat, None, 'DOMICILIO FISCAL', partner.street])
+        yield from self._celdas(3, ['NOMBRE COMERCIAL', partner.name, None, 'REGISTRO DEL', (fecha_desde, 'fecha'), 'AL', (fecha_hasta, 'fecha')])
+
+    def _exportar_excel(self, nombre, filas):
+        """Write filas into an xlsx attached to the wizard and return the
+        attachment.
+
+        filas yields (fila, columna, valor, formato) in row order. The
+        workbook uses xlsxwriter's constant_memory mode, which flushes each
+        row to disk as soon as the next one starts, so only the book result
+        is kept in memory, not the cells. The file is then copied into the
+        attachment in blocks.
+        """
+        self.ensure_one()
+        self.env['l10n_gt_extra.reporte_trabajo'].informar_avance(85, 'Generando archivo')
+        descriptor, ruta = tempfile.mkstemp(suffix='.xlsx')
+        os.close(descriptor)
+        try:
+            libro = xlsxwriter.Workbook(ruta, {'constant_memory': True})
+            hoja = libro.add_worksheet('Reporte')
+            formatos = {
+                None: None,
+                'fecha': libro.add_format({'num_format': 'dd/mm/yy'}),
+                'numero': libro.add_format({'num_format': '#,##0.00'}),
+            }
+            for y, x, valor, formato in filas:
+                hoja.write(y, x, valor, formatos[formato])
+            libro.close()
+
+            adjunto = self._adjuntar_archivo(ruta, {
+                'name': nombre,
+                'res_model': self._name,
+                'res_id': self.id,
+                'mimetype': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            })
+        finally:
+            os.unlink(ruta)
+        return adjunto
+
+    def _adjuntar_archivo(self, ruta, valores):
+        """Create an ir.attachment with the content of the file at ruta.
+
+        With the file storage the file is hashed and copied into the
+        filestore in blocks, the way ir.attachment stores its own files,
+        instead of being read whole into memory."""
+        Attachment = self.env['ir.attachment']
+        if Attachment._storage() == 'db':
+            with open(ruta, 'rb') as archivo:
+                if version_info[0] >= 14:
+                    return Attachment.create(dict(valores, raw=archivo.read()))
+                return Attachment.create(dict(valores, datas=base64.b64encode(archivo.read())))
+
+        sha = hashlib.sha1()
+        with open(ruta, 'rb') as archivo:
+            for bloque in iter(lambda: archivo.read(BLOQUE), b''):
+                sha.update(bloque)
+        checksum = sha.hexdigest()
+
+        fname = checksum[:2] + '/' + checksum
+        ruta_completa = Attachment._full_path(fname)
+        if not os.path.isfile(ruta_completa):
+            os.makedirs(os.path.dirname(ruta_completa), exist_ok=True)
+            shutil.copyfile(ruta, ruta_completa)
+        # Removed by the filestore garbage collector if the transaction is
+        # rolled back
+        Attachment._mark_for_gc(fname)
+        return Attachment.create(dict(valores, store_fname=fname, file_size=os.path.getsize(ruta), checksum=checksum))
+
+    def unlink(self):
+        # Files exported from the wizard go away with it when the transient
+        # records are vacuumed; background jobs move theirs to the job first
+        self.env['ir.attachment'].sudo().search([('res_model', '=', self._name), ('res_id', 'in', self.ids)]).unlink()
+        return super(AsistenteExcel, self).unlink()
+
+    def _descargar_adjunto(self, adjunto):
+        return {
+            'type': 'ir.actions.act_url',
+            'url': '/web/content/%s?download=true' % adjunto.id,
+            'target': 'self',
+        }
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
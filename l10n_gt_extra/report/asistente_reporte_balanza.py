@@ -0,0 +1,89 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+import time
+
+class AsistenteReporteBalanza(models.TransientModel):
+    _name = 'l10n_gt_extra.asistente_reporte_balanza'
+    _inherit = ['l10n_gt_extra.asistente_excel', 'l10n_gt_extra.asistente_segundo_plano']
+    _reporte_pdf = 'l10n_gt_extra.action_reporte_balanza'
+    _reporte_nombre = 'balanza_de_comprobacion'
+
+    def _default_cuenta(self):
+        if len(self.env.context.get('active_ids', [])) > 0 and self.env.context.get('active_model') == 'account.account':
+            return self.env.context.get('active_ids')
+        return self.env['account.account'].search([('company_id', '=', self.env.company.id)]).ids
+
+    cuentas_id = fields.Many2many("account.account", string="Cuentas", required=True, default=_default_cuenta)
+    folio_inicial = fields.Integer(string="Folio Inicial", required=True, default=1)
+    niveles = fields.Char(string="Niveles", required=True, default='1,2,4', help="Largos de los prefijos del código de cuenta por los que se suman los saldos, separados por coma")
+    fecha_desde = fields.Date(string="Fecha Inicial", required=True, default=lambda self: time.strftime('%Y-%m-01'))
+    fecha_hasta = fields.Date(string="Fecha Final", required=True, default=lambda self: time.strftime('%Y-%m-%d'))
+
+    @api.constrains('niveles')
+    def _check_niveles(self):
+        for w in self:
+            try:
+                niveles = self.env['report.l10n_gt_extra.reporte_balanza'].niveles(w.niveles)
+            except ValueError:
+                niveles = [0]
+            if any(n < 1 for n in niveles):
+                raise ValidationError('Los niveles deben ser números enteros positivos separados por coma, por ejemplo 1,2,4')
+
+    def print_report(self):
+        if not self.cuentas_id:
+            raise UserError('Debe ingresar las cuentas que serán utilizadas en el reporte')
+
+        data = {
+             'ids': [],
+             'model': 'l10n_gt_extra.asistente_reporte_balanza',
+             'form': self.read()[0]
+        }
+        return self.env.ref('l10n_gt_extra.action_reporte_balanza').report_action(self, data=data)
+
+    def print_report_excel(self):
+        if not self.cuentas_id:
+            raise UserError('Debe ingresar las cuentas que serán utilizadas en el reporte')
+
+        return self._descargar_adjunto(self._generar_excel())
+
+    def _datos_excel(self):
+        return {
+            'fecha_hasta': self.fecha_hasta,
+            'fecha_desde': self.fecha_desde,
+            'niveles': self.niveles,
+            'cuentas_id': self.cuentas_id.ids,
+        }
+
+    def _generar_excel(self):
+        self.ensure_one()
+        datos = self._datos_excel()
+        res = self.env['report.l10n_gt_extra.reporte_balanza'].lineas(datos)
+        return self._exportar_excel('balanza_de_comprobacion.xlsx', self._filas_excel(res))
+
+    def _filas_excel(self, res):
+        lineas = res['lineas']
+        totales = res['totales']
+
+        yield from self._filas_encabezado('BALANZA DE COMPROBACION', self.cuentas_id[0].company_id, self.fecha_desde, self.fecha_hasta)
+
+        y = 5
+        yield from self._celdas(y, ['Codigo', 'Cuenta', 'Nivel', 'Saldo Inicial', 'Debe', 'Haber', 'Saldo Final'])
+
+        for linea in lineas:
+            y += 1
+            yield from self._celdas(y, [
+                linea['codigo'],
+                linea['cuenta'],
+                linea['nivel'] + 1,
+                (linea['saldo_inicial'], 'numero'),
+                (linea['debe'], 'numero'),
+                (linea['haber'], 'numero'),
+                (linea['saldo_final'], 'numero'),
+            ])
+
+        y += 1
+        yield from self._celdas(y, [None, 'Totales', None, (totales['saldo_inicial'], 'numero'), (totales['debe'], 'numero'), (totales['haber'], 'numero'), (totales['saldo_final'], 'numero')])
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -6,6 +6,9 @@ import time
 
 class AsistenteReporteBanco(models.TransientModel):
     _name = 'l10n_gt_extra.asistente_reporte_banco'
+    _inherit = ['l10n_gt_extra.asistente_segundo_plano']
+    _reporte_pdf = 'l10n_gt_extra.action_reporte_banco'
+    _reporte_nombre = 'libro_de_bancos'
 
     def _default_cuenta(self):
         if len(self.env.context.get('active_ids', [])) > 0:
@@ -3,21 +3,21 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError, ValidationError
 import time
-import xlsxwriter
-import base64
-import io
 import logging
 
 class AsistenteReporteCompras(models.TransientModel):
     _name = 'l10n_gt_extra.asistente_reporte_compras'
+    _inherit = ['l10n_gt_extra.asistente_excel', 'l10n_gt_extra.asistente_segundo_plano']
+    _reporte_pdf = 'l10n_gt_extra.action_reporte_compras'
+    _reporte_horizontal = True
+    _reporte_nombre = 'libro_de_compras'
 
     diarios_id = fields.Many2many("account.journal", string="Diarios", required=True)
     impuesto_id = fields.Many2one("account.tax", string="Impuesto", required=True)
     folio_inicial = fields.Integer(string="Folio Inicial", required=True, default=1)
+    paralelo = fields.Boolean(string="Generar en paralelo", help="Calcula cada diario y mes por separado y en paralelo, para libros de varios establecimientos o meses")
     fecha_desde = fields.Date(string="Fecha Inicial", required=True, default=lambda self: time.strftime('%Y-%m-01'))
     fecha_hasta = fields.Date(string="Fecha Final", required=True, default=lambda self: time.strftime('%Y-%m-%d'))
-    name = fields.Char('Nombre archivo', size=32)
-    archivo = fields.Binary('Archivo')
 
     def print_report(self):
         data = {
@@ -28,144 +28,91 @@ class AsistenteReporteCompras(models.TransientModel):
         return self.env.ref('l10n_gt_extra.action_reporte_compras').with_context(landscape=True).report_action(self, data=data)
 
     def print_report_excel(self):
-        for w in self:
-            dict = {}
-            dict['fecha_hasta'] = w['fecha_hasta']
-            dict['fecha_desde'] = w['fecha_desde']
-            dict['impuesto_id'] = [w.impuesto_id.id, w.impuesto_id.name]
-            dict['diarios_id'] =[x.id for x in w.diarios_id]
+        return self._descargar_adjunto(self._generar_excel())
 
-            res = self.env['report.l10n_gt_extra.reporte_compras'].lineas(dict)
-            lineas = res['lineas']
-            totales = res['totales']
-
-            f = io.BytesIO()
-            libro = xlsxwriter.Workbook(f)
-            hoja = libro.add_worksheet('Reporte')
-            formato_fecha = libro.add_format({'num_format': 'dd/mm/yy'})
-            formato_numero = libro.add_format({'num_format': '#,##0.00'})
+    def _datos_excel(self):
+        return {
+            'fecha_hasta': self.fecha_hasta,
+            'fecha_desde': self.fecha_desde,
+            'impuesto_id': [self.impuesto_id.id, self.impuesto_id.name],
+            'diarios_id': self.diarios_id.ids,
+            'paralelo': self.paralelo,
+        }
 
-            hoja.write(0, 0, 'LIBRO DE COMPRAS Y SERVICIOS')
-            hoja.write(2, 0, 'NUMERO DE IDENTIFICACION TRIBUTARIA')
-            hoja.write(2, 1, w.diarios_id[0].company_id.partner_id.vat)
-            hoja.write(3, 0, 'NOMBRE COMERCIAL')
-            hoja.write(3, 1, w.diarios_id[0].company_id.partner_id.name)
-            hoja.write(2, 3, 'DOMICILIO FISCAL')
-            hoja.write(2, 4, w.diarios_id[0].company_id.partner_id.street)
-            hoja.write(3, 3, 'REGISTRO DEL')
-            hoja.write(3, 4, w.fecha_desde, formato_fecha)
-            hoja.write(3, 5, 'AL')
-            hoja.write(3, 6, w.fecha_hasta, formato_fecha)
+    def _generar_excel(self):
+        self.ensure_one()
+        datos = self._datos_excel()
+        res = self.env['report.l10n_gt_extra.reporte_compras'].lineas(datos)
+        return self._exportar_excel('libro_de_compras.xlsx', self._filas_excel(res))
 
-            y = 5
-            hoja.write(y, 0, 'Tipo')
-            hoja.write(y, 1, 'Fecha')
-            hoja.write(y, 2, 'Doc')
-            hoja.write(y, 3, 'Proveedor')
-            hoja.write(y, 4, 'NIT')
-            hoja.write(y, 5, 'Compras')
-            hoja.write(y, 6, 'Compras exento')
-            hoja.write(y, 7, 'Servicios')
-            hoja.write(y, 8, 'Servicios exento')
-            hoja.write(y, 9, 'Combustible')
-            hoja.write(y, 10, 'Combustible exento')
-            hoja.write(y, 11, 'Importaciones')
-            hoja.write(y, 12, 'Pequeños contribuyentes')
-            hoja.write(y, 13, 'IVA')
-            hoja.write(y, 14, 'Total')
+    def _filas_excel(self, res):
+        lineas = res['lineas']
+        totales = res['totales']
+        tipos = ['compra', 'servicio', 'combustible', 'importacion', 'pequeño']
 
-            for linea in lineas:
-                y += 1
-                hoja.write(y, 0, linea['tipo'])
-                hoja.write(y, 1, linea['fecha'], formato_fecha)
-                hoja.write(y, 2, linea['numero'])
-                hoja.write(y, 3, linea['proveedor']['name'])
-                hoja.write(y, 4, linea['proveedor']['vat'])
-                hoja.write(y, 5, linea['compra'], formato_numero)
-                hoja.write(y, 6, linea['compra_exento'], formato_numero)
-                hoja.write(y, 7, linea['servicio'], formato_numero)
-                hoja.write(y, 8, linea['servicio_exento'], formato_numero)
-                hoja.write(y, 9, linea['combustible'], formato_numero)
-                hoja.write(y, 10, linea['combustible_exento'], formato_numero)
-                hoja.write(y, 11, linea['importacion'] + linea['importacion_exento'], formato_numero)
-                hoja.write(y, 12, linea['pequeño'] + linea['pequeño_exento'], formato_numero)
-                hoja.write(y, 13, linea['iva'], formato_numero)
-                hoja.write(y, 14, linea['total'], formato_numero)
+        yield from self._filas_encabezado('LIBRO DE COMPRAS Y SERVICIOS', self.diarios_id[0].company_id, self.fecha_desde, self.fecha_hasta)
 
-            y += 1
-            hoja.write(y, 3, 'Totales')
-            hoja.write(y, 5, totales['compra']['neto'], formato_numero)
-            hoja.write(y, 6, totales['compra']['exento'], formato_numero)
-            hoja.write(y, 7, totales['servicio']['neto'], formato_numero)
-            hoja.write(y, 8, totales['servicio']['exento'], formato_numero)
-            hoja.write(y, 9, totales['combustible']['neto'], formato_numero)
-            hoja.write(y, 10, totales['combustible']['exento'], formato_numero)
-            hoja.write(y, 11, totales['importacion']['neto'] + totales['importacion']['exento'], formato_numero)
-            hoja.write(y, 12, totales['pequeño']['neto'] + totales['pequeño']['exento'], formato_numero)
-            hoja.write(y, 13, totales['compra']['iva'] + totales['servicio']['iva'] + totales['combustible']['iva'] + totales['importacion']['iva'] + totales['pequeño']['iva'], formato_numero)
-            hoja.write(y, 14, totales['compra']['total'] + totales['servicio']['total'] + totales['combustible']['total'] + totales['importacion']['total'] + totales['pequeño']['total'], formato_numero)
+        y = 5
+        yield from self._celdas(y, ['Tipo', 'Fecha', 'Doc', 'Proveedor', 'NIT', 'Compras', 'Compras exento', 'Servicios', 'Servicios exento', 'Combustible', 'Combustible exento', 'Importaciones', 'Pequeños contribuyentes', 'IVA', 'Total'])
 
-            y += 2
-            hoja.write(y, 0, 'Cantidad de facturas')
-            hoja.write(y, 1, totales['num_facturas'])
-            y += 1
-            hoja.write(y, 0, 'Total credito fiscal')
-            hoja.write(y, 1, totales['compra']['iva'] + totales['servicio']['iva'] + totales['combustible']['iva'] + totales['importacion']['iva'] + totales['pequeño']['iva'], formato_numero)
-
-            y += 2
-            hoja.write(y, 3, 'EXENTO')
-            hoja.write(y, 4, 'NETO')
-            hoja.write(y, 5, 'IVA')
-            hoja.write(y, 6, 'TOTAL')
-            y += 1
-            hoja.write(y, 1, 'COMPRAS')
-            hoja.write(y, 3, totales['compra']['exento'], formato_numero)
-            hoja.write(y, 4, totales['compra']['neto'], formato_numero)
-            hoja.write(y, 5, totales['compra']['iva'], formato_numero)
-            hoja.write(y, 6, totales['compra']['total'], formato_numero)
+        for linea in lineas:
             y += 1
-            hoja.write(y, 1, 'SERVICIOS')
-            hoja.write(y, 3, totales['servicio']['exento'], formato_numero)
-            hoja.write(y, 4, totales['servicio']['neto'], formato_numero)
-            hoja.write(y, 5, totales['servicio']['iva'], formato_numero)
-            hoja.write(y, 6, totales['servicio']['total'], formato_numero)
+            yield from self._celdas(y, [
+                linea['tipo'],
+                (linea['fecha'], 'fecha'),
+                linea['numero'],
+                linea['proveedor']['name'],
+                linea['proveedor']['vat'],
+                (linea['compra'], 'numero'),
+                (linea['compra_exento'], 'numero'),
+                (linea['servicio'], 'numero'),
+                (linea['servicio_exento'], 'numero'),
+                (linea['combustible'], 'numero'),
+                (linea['combustible_exento'], 'numero'),
+                (linea['importacion'] + linea['importacion_exento'], 'numero'),
+                (linea['pequeño'] + linea['pequeño_exento'], 'numero'),
+                (linea['iva'], 'numero'),
+                (linea['total'], 'numero'),
+            ])
+
+        y += 1
+        yield from self._celdas(y, [
+            None, None, None, 'Totales', None,
+            (totales['compra']['neto'], 'numero'),
+            (totales['compra']['exento'], 'numero'),
+            (totales['servicio']['neto'], 'numero'),
+            (totales['servicio']['exento'], 'numero'),
+            (totales['combustible']['neto'], 'numero'),
+            (totales['combustible']['exento'], 'numero'),
+            (totales['importacion']['neto'] + totales['importacion']['exento'], 'numero'),
+            (totales['pequeño']['neto'] + totales['pequeño']['exento'], 'numero'),
+            (sum(totales[tipo]['iva'] for tipo in tipos), 'numero'),
+            (sum(totales[tipo]['total'] for tipo in tipos), 'numero'),
+        ])
+
+        y += 2
+        yield from self._celdas(y, ['Cantidad de facturas', totales['num_facturas']])
+        y += 1
+        yield from self._celdas(y, ['Total credito fiscal', (sum(totales[tipo]['iva'] for tipo in tipos), 'numero')])
+
+        y += 2
+        yield from self._celdas(y, [None, None, None, 'EXENTO', 'NETO', 'IVA', 'TOTAL'])
+        for titulo, tipo in [('COMPRAS', 'compra'), ('SERVICIOS', 'servicio'), ('COMBUSTIBLES', 'combustible'), ('IMPORTACIONES', 'importacion'), ('PEQUEÑOS CONTRIBUYENTES', 'pequeño')]:
             y += 1
-            hoja.write(y, 1, 'COMBUSTIBLES')
-            hoja.write(y, 3, totales['combustible']['exento'], formato_numero)
-            hoja.write(y, 4, totales['combustible']['neto'], formato_numero)
-            hoja.write(y, 5, totales['combustible']['iva'], formato_numero)
-            hoja.write(y, 6, totales['combustible']['total'], formato_numero)
-            y += 1
-            hoja.write(y, 1, 'IMPORTACIONES')
-            hoja.write(y, 3, totales['importacion']['exento'], formato_numero)
-            hoja.write(y, 4, totales['importacion']['neto'], formato_numero)
-            hoja.write(y, 5, totales['importacion']['iva'], formato_numero)
-            hoja.write(y, 6, totales['importacion']['total'], formato_numero)
-            y += 1
-            hoja.write(y, 1, 'PEQUEÑOS CONTRIBUYENTES')
-            hoja.write(y, 3, totales['pequeño']['exento'], formato_numero)
-            hoja.write(y, 4, totales['pequeño']['neto'], formato_numero)
-            hoja.write(y, 5, totales['pequeño']['iva'], formato_numero)
-            hoja.write(y, 6, totales['pequeño']['total'], formato_numero)
-            y += 1
-            hoja.write(y, 1, 'TOTALES')
-            hoja.write(y, 3, totales['compra']['exento']+totales['servicio']['exento']+totales['combustible']['exento']+totales['importacion']['exento']+totales['pequeño']['exento'], formato_numero)
-            hoja.write(y, 4, totales['compra']['neto']+totales['servicio']['neto']+totales['combustible']['neto']+totales['importacion']['neto']+totales['pequeño']['neto'], formato_numero)
-            hoja.write(y, 5, totales['compra']['iva']+totales['servicio']['iva']+totales['combustible']['iva']+totales['importacion']['iva']+totales['pequeño']['iva'], formato_numero)
-            hoja.write(y, 6, totales['compra']['total']+totales['servicio']['total']+totales['combustible']['total']+totales['importacion']['total']+totales['pequeño']['total'], formato_numero)
-
-            libro.close()
-            datos = base64.b64encode(f.getvalue())
-            self.write({'archivo':datos, 'name':'libro_de_compras.xlsx'})
-
-        return {
-            'view_type': 'form',
-            'view_mode': 'form',
-            'res_model': 'l10n_gt_extra.asistente_reporte_compras',
-            'res_id': self.id,
-            'view_id': False,
-            'type': 'ir.actions.act_window',
-            'target': 'new',
-        }
+            yield from self._celdas(y, [
+                None, titulo, None,
+                (totales[tipo]['exento'], 'numero'),
+                (totales[tipo]['neto'], 'numero'),
+                (totales[tipo]['iva'], 'numero'),
+                (totales[tipo]['total'], 'numero'),
+            ])
+        y += 1
+        yield from self._celdas(y, [
+            None, 'TOTALES', None,
+            (sum(totales[tipo]['exento'] for tipo in tipos), 'numero'),
+            (sum(totales[tipo]['neto'] for tipo in tipos), 'numero'),
+            (sum(totales[tipo]['iva'] for tipo in tipos), 'numero'),
+            (sum(totales[tipo]['total'] for tipo in tipos), 'numero'),
+        ])
 
 # vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -1,15 +1,17 @@
 # -*- encoding: utf-8 -*-
 
 from odoo import models, fields, api, _
-from odoo.release import version_info
 from odoo.exceptions import UserError, ValidationError
 import time
 
 class AsistenteReporteInventario(models.TransientModel):
     _name = 'l10n_gt_extra.asistente_reporte_inventario'
+    _inherit = ['l10n_gt_extra.asistente_segundo_plano']
+    _reporte_pdf = 'l10n_gt_extra.action_reporte_inventario'
+    _reporte_nombre = 'libro_de_inventario'
 
     def _default_cuenta(self):
-        if version_info[0] in [13, 14, 15]:
+        if self.env['l10n_gt_extra.capacidades'].capacidades()['tipos_de_cuenta']:
             if len(self.env.context.get('active_ids', [])) > 0:
                 return self.env.context.get('active_ids')
             else:
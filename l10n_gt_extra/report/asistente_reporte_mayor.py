@@ -1,19 +1,18 @@
 # -*- encoding: utf-8 -*-
 
 from odoo import models, fields, api, _
-from odoo.release import version_info
 from odoo.exceptions import UserError, ValidationError
 import time
-import xlsxwriter
-import base64
-import io
 import logging
 
 class AsistenteReporteMayor(models.TransientModel):
     _name = 'l10n_gt_extra.asistente_reporte_mayor'
+    _inherit = ['l10n_gt_extra.asistente_excel', 'l10n_gt_extra.asistente_segundo_plano']
+    _reporte_pdf = 'l10n_gt_extra.action_reporte_mayor'
+    _reporte_nombre = 'libro_mayor'
 
     def _default_cuenta(self):
-        if version_info[0] in [13, 14, 15]:
+        if self.env['l10n_gt_extra.capacidades'].capacidades()['tipos_de_cuenta']:
             if len(self.env.context.get('active_ids', [])) > 0:
                 return self.env.context.get('active_ids')
             else:
@@ -27,8 +26,6 @@ class AsistenteReporteMayor(models.TransientModel):
     agrupado_todo = fields.Boolean(string="Agrupado todo el periodo")
     fecha_desde = fields.Date(string="Fecha Inicial", required=True, default=lambda self: time.strftime('%Y-%m-01'))
     fecha_hasta = fields.Date(string="Fecha Final", required=True, default=lambda self: time.strftime('%Y-%m-%d'))
-    name = fields.Char('Nombre archivo', size=32)
-    archivo = fields.Binary('Archivo')
 
     def print_report(self):
         if not self.cuentas_id:
@@ -45,94 +42,94 @@ class AsistenteReporteMayor(models.TransientModel):
         if not self.cuentas_id:
             raise UserError('Debe ingresar las cuentas que serán utilizadas en el reporte')
 
-        for w in self:
-            dict = {}
-            dict['fecha_hasta'] = w['fecha_hasta']
-            dict['fecha_desde'] = w['fecha_desde']
-            dict['agrupado_por_dia'] = w['agrupado_por_dia']
-            dict['cuentas_id'] =[x.id for x in w.cuentas_id]
-            res = self.env['report.l10n_gt_extra.reporte_mayor'].lineas(dict)
-
-            f = io.BytesIO()
-            libro = xlsxwriter.Workbook(f)
-            hoja = libro.add_worksheet('Reporte')
-            formato_fecha = libro.add_format({'num_format': 'dd/mm/yy'})
-            formato_numero = libro.add_format({'num_format': '#,##0.00'})
-
-            hoja.write(0, 0, 'LIBRO MAYOR')
-            hoja.write(2, 0, 'NUMERO DE IDENTIFICACION TRIBUTARIA')
-            hoja.write(2, 1, w.cuentas_id[0].company_id.partner_id.vat)
-            hoja.write(3, 0, 'NOMBRE COMERCIAL')
-            hoja.write(3, 1, w.cuentas_id[0].company_id.partner_id.name)
-            hoja.write(2, 3, 'DOMICILIO FISCAL')
-            hoja.write(2, 4, w.cuentas_id[0].company_id.partner_id.street)
-            hoja.write(3, 3, 'REGISTRO DEL')
-            hoja.write(3, 4, w.fecha_desde, formato_fecha)
-            hoja.write(3, 5, 'AL')
-            hoja.write(3, 6, w.fecha_hasta, formato_fecha)
-
-            y = 5
-            if w['agrupado_por_dia']:
-                lineas = res['lineas']
-
-                hoja.write(y, 0, 'Codigo')
-                hoja.write(y, 1, 'Cuenta')
-                hoja.write(y, 2, 'Fecha')
-                hoja.write(y, 3, 'Saldo Inicial')
-                hoja.write(y, 4, 'Debe')
-                hoja.write(y, 5, 'Haber')
-                hoja.write(y, 6, 'Saldo Final')
-
-                for cuenta in lineas:
-                    y += 1
-                    hoja.write(y, 0, cuenta['codigo'])
-                    hoja.write(y, 1, cuenta['cuenta'])
-                    hoja.write(y, 3, cuenta['saldo_inicial'], formato_numero)
-                    hoja.write(y, 4, cuenta['total_debe'], formato_numero)
-                    hoja.write(y, 5, cuenta['total_haber'], formato_numero)
-                    hoja.write(y, 6, cuenta['saldo_final'], formato_numero)
-                    for fechas in cuenta['fechas']:
-                        y += 1
-                        hoja.write(y, 2, fechas['fecha'], formato_fecha)
-                        hoja.write(y, 4, fechas['debe'], formato_numero)
-                        hoja.write(y, 5, fechas['haber'], formato_numero)
-                    y += 1
-            else:
-                lineas = res['lineas']
-                totales = res['totales']
+        return self._descargar_adjunto(self._generar_excel())
 
-                hoja.write(y, 0, 'Codigo')
-                hoja.write(y, 1, 'Cuenta')
-                hoja.write(y, 2, 'Saldo Inicial')
-                hoja.write(y, 3, 'Debe')
-                hoja.write(y, 4, 'Haber')
-                hoja.write(y, 5, 'Saldo Final')
+    def _datos_excel(self):
+        return {
+            'fecha_hasta': self.fecha_hasta,
+            'fecha_desde': self.fecha_desde,
+            'agrupado_por_dia': self.agrupado_por_dia,
+            'agrupado_todo': self.agrupado_todo,
+            'cuentas_id': self.cuentas_id.ids,
+        }
 
-                for linea in lineas:
-                    y += 1
+    def _generar_excel(self):
+        self.ensure_one()
+        datos = self._datos_excel()
+        res = self.env['report.l10n_gt_extra.reporte_mayor'].lineas(datos)
+        return self._exportar_excel('libro_mayor.xlsx', self._filas_excel(res))
+
+    def _filas_excel(self, res):
+        lineas = res['lineas']
+        totales = res['totales']
+
+        yield from self._filas_encabezado('LIBRO MAYOR', self.cuentas_id[0].company_id, self.fecha_desde, self.fecha_hasta)
+
+        y = 5
+        if self.agrupado_por_dia:
+            yield from self._celdas(y, ['Codigo', 'Cuenta', 'Fecha', 'Saldo Inicial', 'Debe', 'Haber', 'Saldo Final'])
 
-                    hoja.write(y, 0, linea['codigo'])
-                    hoja.write(y, 1, linea['cuenta'])
-                    hoja.write(y, 2, linea['saldo_inicial'])
-                    hoja.write(y, 3, linea['debe'], formato_numero)
-                    hoja.write(y, 4, linea['haber'], formato_numero)
-                    hoja.write(y, 5, linea['saldo_final'], formato_numero)
+            for cuenta in lineas:
+                y += 1
+                yield from self._celdas(y, [
+                    cuenta['codigo'],
+                    cuenta['cuenta'],
+                    None,
+                    (cuenta['saldo_inicial'], 'numero'),
+                    (cuenta['total_debe'], 'numero'),
+                    (cuenta['total_haber'], 'numero'),
+                    (cuenta['saldo_final'], 'numero'),
+                ])
+                for fechas in cuenta['fechas']:
+                    y += 1
+                    yield from self._celdas(y, [None, None, (fechas['fecha'], 'fecha'), None, (fechas['debe'], 'numero'), (fechas['haber'], 'numero')])
+                y += 1
+        elif self.agrupado_todo:
+            yield from self._celdas(y, ['Codigo', 'Cuenta', 'Saldo Inicial', 'Debe', 'Haber', 'Saldo Final'])
 
+            for linea in lineas:
                 y += 1
-                hoja.write(y, 1, 'Totales')
-                hoja.write(y, 3, totales['debe'], formato_numero)
-                hoja.write(y, 4, totales['haber'], formato_numero)
+                yield from self._celdas(y, [
+                    linea['codigo'],
+                    linea['cuenta'],
+                    linea['saldo_inicial'],
+                    (linea['debe'], 'numero'),
+                    (linea['haber'], 'numero'),
+                    (linea['saldo_final'], 'numero'),
+                ])
+
+            y += 1
+            yield from self._celdas(y, [None, 'Totales', None, (totales['debe'], 'numero'), (totales['haber'], 'numero')])
+        else:
+            yield from self._celdas(y, ['Codigo', 'Cuenta', 'Fecha', 'Descripción', 'Saldo Inicial', 'Debe', 'Haber', 'Saldo Final'])
 
-            libro.close()
-            datos = base64.b64encode(f.getvalue())
-            self.write({'archivo':datos, 'name':'libro_mayor.xlsx'})
+            for cuenta in lineas:
+                y += 1
+                yield from self._celdas(y, [
+                    cuenta['codigo'],
+                    cuenta['cuenta'],
+                    None,
+                    None,
+                    (cuenta['saldo_inicial'], 'numero'),
+                    (cuenta['total_debe'], 'numero'),
+                    (cuenta['total_haber'], 'numero'),
+                    (cuenta['saldo_final'], 'numero'),
+                ])
+                for movimiento in cuenta['movimientos']:
+                    y += 1
+                    descripcion = movimiento['etiqueta']
+                    if movimiento['partner_name']:
+                        descripcion += ' - ' + movimiento['partner_name']
+                    yield from self._celdas(y, [
+                        None,
+                        None,
+                        (movimiento['fecha'], 'fecha'),
+                        descripcion,
+                        None,
+                        (movimiento['debe'], 'numero'),
+                        (movimiento['haber'], 'numero'),
+                        (movimiento['saldo_movimiento'], 'numero'),
+                    ])
+                y += 1
 
-        return {
-            'view_type': 'form',
-            'view_mode': 'form',
-            'res_model': 'l10n_gt_extra.asistente_reporte_mayor',
-            'res_id': self.id,
-            'view_id': False,
-            'type': 'ir.actions.act_window',
-            'target': 'new',
-        }
+            yield from self._celdas(y, [None, 'Totales', None, None, (totales['saldo_inicial'], 'numero'), (totales['debe'], 'numero'), (totales['haber'], 'numero'), (totales['saldo_final'], 'numero')])
@@ -0,0 +1,92 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import models, fields
+from odoo.release import version_info
+import base64
+import hashlib
+import json
+
+class AsistenteSegundoPlano(models.AbstractModel):
+    _name = 'l10n_gt_extra.asistente_segundo_plano'
+    _description = 'Generación de libros en segundo plano'
+
+    # xmlid of the ir.actions.report, its orientation and the file name
+    _reporte_pdf = None
+    _reporte_horizontal = False
+    _reporte_nombre = 'reporte'
+
+    def _parametros_trabajo(self):
+        """Wizard values as they are passed to create(), JSON serializable"""
+        valores = {}
+        for nombre, campo in self._fields.items():
+            if not campo.store or nombre in models.MAGIC_COLUMNS or nombre in ('name', 'archivo'):
+                continue
+            valor = self[nombre]
+            if campo.type == 'many2one':
+                valor = valor.id
+            elif campo.type == 'many2many':
+                valor = [(6, 0, sorted(valor.ids))]
+            elif campo.type == 'date':
+                valor = fields.Date.to_string(valor)
+            elif campo.type == 'datetime':
+                valor = fields.Datetime.to_string(valor)
+            elif campo.type in ('one2many', 'binary'):
+                continue
+            valores[nombre] = valor
+        return valores
+
+    def _encolar_trabajo(self, formato):
+        self.ensure_one()
+        parametros = self._parametros_trabajo()
+        # Identical requests share the key and therefore the job
+        llave = hashlib.sha1(json.dumps([self._name, formato, self.env.company.id, parametros], sort_keys=True).encode()).hexdigest()
+        nombre = '%s.%s' % (self._reporte_nombre, formato)
+        trabajo = self.env['l10n_gt_extra.reporte_trabajo'].encolar(self, formato, nombre, llave, parametros)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'l10n_gt_extra.reporte_trabajo',
+            'res_id': trabajo.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def print_report_background(self):
+        return self._encolar_trabajo('pdf')
+
+    def print_report_excel_background(self):
+        return self._encolar_trabajo('xlsx')
+
+    def _generar_pdf(self):
+        """Render the PDF of the wizard the same way print_report does and
+        attach it to the wizard"""
+        self.ensure_one()
+        # Same data the browser sends back through JSON for print_report
+        data = json.loads(json.dumps({
+            'ids': [],
+            'model': self._name,
+            'form': self.read()[0],
+        }, default=str))
+        self.env['l10n_gt_extra.reporte_trabajo'].informar_avance(10, 'Calculando')
+        contexto = {'active_model': self._name, 'active_ids': self.ids}
+        if self._reporte_horizontal:
+            contexto['landscape'] = True
+        if version_info[0] >= 16:
+            pdf, tipo = self.env['ir.actions.report'].with_context(**contexto)._render_qweb_pdf(self._reporte_pdf, res_ids=self.ids, data=data)
+        elif version_info[0] >= 14:
+            pdf, tipo = self.env.ref(self._reporte_pdf).with_context(**contexto)._render_qweb_pdf(self.ids, data=data)
+        else:
+            pdf, tipo = self.env.ref(self._reporte_pdf).with_context(**contexto).render_qweb_pdf(self.ids, data=data)
+
+        valores = {
+            'name': '%s.pdf' % self._reporte_nombre,
+            'res_model': self._name,
+            'res_id': self.id,
+            'mimetype': 'application/pdf',
+        }
+        if version_info[0] >= 14:
+            valores['raw'] = pdf
+        else:
+            valores['datas'] = base64.b64encode(pdf)
+        return self.env['ir.attachment'].create(valores)
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,130 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import api, models, fields
+
+class ReporteBalanza(models.AbstractModel):
+    _name = 'report.l10n_gt_extra.reporte_balanza'
+
+    # Inputs of the wizard the result depends on
+    _parametros_cache = ['cuentas_id', 'fecha_desde', 'fecha_hasta', 'niveles']
+
+    def niveles(self, texto):
+        """Prefix lengths of the rollups, '1,2,4' -> [1, 2, 4]"""
+        return sorted({int(n) for n in (texto or '').replace(' ', '').split(',') if n})
+
+    def _lineas(self, datos):
+        """Opening balance, debit, credit and closing balance of every
+        account and of every code prefix level, aggregated in one query.
+
+        Opening balances combine the monthly snapshots with the lines of the
+        month of fecha_desde before that date; accounts that do not carry
+        their balance start on January 1. The rollups come from GROUPING SETS
+        over the prefixes, so no account is read twice."""
+        totales = {'saldo_inicial': 0, 'debe': 0, 'haber': 0, 'saldo_final': 0}
+        lineas = []
+
+        account_ids = [x for x in datos['cuentas_id']]
+        if not account_ids:
+            return {'lineas': lineas, 'totales': totales}
+
+        niveles = self.niveles(datos['niveles'])
+        fecha_desde = fields.Date.to_date(datos['fecha_desde'])
+
+        capacidades = self.env['l10n_gt_extra.capacidades'].capacidades()
+        include_initial_balance = capacidades['include_initial_balance']
+        join_initial_balance = capacidades['join_initial_balance']
+
+        columnas_nivel = ''.join(', left(c.codigo, %d) as nivel_%d' % (n, i) for i, n in enumerate(niveles))
+        nombres_nivel = ['nivel_%d' % i for i in range(len(niveles))]
+        agrupacion = ''.join(', %s, grouping(%s) as agrupado_%d' % (nombre, nombre, i) for i, nombre in enumerate(nombres_nivel))
+        conjuntos = ['()'] + ['(' + ', '.join(nombres_nivel[:i + 1]) + ')' for i in range(len(niveles))]
+        conjuntos.append('(' + ', '.join(nombres_nivel + ['id', 'codigo', 'cuenta']) + ')')
+        orden = ''.join('%s nulls first, ' % nombre for nombre in nombres_nivel)
+
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios('account.move.line', ['account_id', 'date', 'debit', 'credit', 'parent_state'])
+        self.env.cr.execute('with cuentas as (' \
+                'select a.id, a.code as codigo, a.name as cuenta, ' + include_initial_balance + ' as balance_inicial ' \
+                'from account_account a ' + join_initial_balance + ' where a.id in %(cuentas)s' \
+            '), saldos as (' \
+                'select cuenta, sum(inicial) as saldo_inicial, sum(debe) as debe, sum(haber) as haber from (' \
+                    'select s.account_id as cuenta, sum(s.debe - s.haber) as inicial, 0 as debe, 0 as haber ' \
+                    'from l10n_gt_extra_saldo_mensual s join cuentas c on (c.id = s.account_id) ' \
+                    'where s.mes < %(mes)s and (c.balance_inicial or s.mes >= %(anio)s) group by s.account_id ' \
+                    'union all ' \
+                    'select l.account_id, ' \
+                        'sum(case when l.date < %(desde)s then l.debit - l.credit else 0 end), ' \
+                        'sum(case when l.date >= %(desde)s then l.debit else 0 end), ' \
+                        'sum(case when l.date >= %(desde)s then l.credit else 0 end) ' \
+                    'from account_move_line l where l.parent_state = \'posted\' and l.account_id in %(cuentas)s ' \
+                    'and l.date >= %(mes)s and l.date <= %(hasta)s group by l.account_id' \
+                ') movimientos group by cuenta' \
+            '), base as (' \
+                'select c.id, c.codigo, c.cuenta' + columnas_nivel + ', s.saldo_inicial, s.debe, s.haber ' \
+                'from cuentas c join saldos s on (s.cuenta = c.id)' \
+            ') ' \
+            'select id, codigo, cuenta' + agrupacion + ', grouping(id) as agrupado, count(*) as cuentas, min(codigo) as primer_codigo, ' \
+                'sum(saldo_inicial) as saldo_inicial, sum(debe) as debe, sum(haber) as haber ' \
+            'from base group by grouping sets (' + ', '.join(conjuntos) + ') ' \
+            'order by ' + orden + 'codigo nulls first',
+        {'cuentas': tuple(account_ids), 'mes': fecha_desde.replace(day=1), 'anio': fecha_desde.replace(month=1, day=1), 'desde': fecha_desde, 'hasta': datos['fecha_hasta']})
+        filas = self.env.cr.dictfetchall()
+
+        grupos = {g.code_prefix_start: g.name for g in self.env['account.group'].search([('code_prefix_start', '!=', False)])}
+
+        for r in filas:
+            r['saldo_final'] = r['saldo_inicial'] + r['debe'] - r['haber']
+            if not any(r[k] for k in ('saldo_inicial', 'debe', 'haber')):
+                continue
+
+            if not r['agrupado']:
+                nivel = len(niveles)
+                codigo = r['codigo']
+                cuenta = r['cuenta']
+            else:
+                # Rollup rows: the deepest grouped level is the one of the row
+                nivel = len([i for i in range(len(niveles)) if not r['agrupado_%d' % i]]) - 1
+                if nivel < 0:
+                    totales.update({k: r[k] for k in totales})
+                    continue
+                codigo = r['nivel_%d' % nivel]
+                # Codes shorter than the level repeat the previous one, and a
+                # level holding a single account with that exact code repeats
+                # the account
+                if len(codigo) < niveles[nivel] or (r['cuentas'] == 1 and r['primer_codigo'] == codigo):
+                    continue
+                cuenta = grupos.get(codigo, '')
+
+            lineas.append({
+                'id': r['id'],
+                'nivel': nivel,
+                'es_cuenta': not r['agrupado'],
+                'codigo': codigo,
+                'cuenta': cuenta,
+                'saldo_inicial': r['saldo_inicial'],
+                'debe': r['debe'],
+                'haber': r['haber'],
+                'saldo_final': r['saldo_final'],
+            })
+
+        return {'lineas': lineas, 'totales': totales}
+
+    def lineas(self, datos):
+        """Result of _lineas, reused while the data it reads does not change"""
+        cache = self.env['l10n_gt_extra.reporte_cache']
+        return cache.obtener(self._name, datos, self._parametros_cache, lambda: cache.huella_cuentas(datos['cuentas_id'], datos['fecha_hasta']), lambda: self._lineas(datos))
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        model = self.env.context.get('active_model')
+        docs = self.env[model].browse(self.env.context.get('active_ids', []))
+
+        return {
+            'doc_ids': self.ids,
+            'doc_model': model,
+            'data': data['form'],
+            'docs': docs,
+            'lineas': self.lineas,
+            'current_company_id': self.env.company,
+        }
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -7,57 +7,59 @@ class ReporteBanco(models.AbstractModel):
     _name = 'report.l10n_gt_extra.reporte_banco'
 
     def lineas(self, datos):
-        cuenta = self.env['account.account'].browse(datos['cuenta_bancaria_id'][0])
-
-        usar_balance_moneda = False
-        lineas = []
-        for linea in self.env['account.move.line'].search([('account_id','=',cuenta.id), ('parent_state','=','posted'), ('date','>=',datos['fecha_desde']), ('date','<=',datos['fecha_hasta'])], order='date'):
-            detalle = {
-                'fecha': linea.date,
-                'documento': linea.move_id.name if linea.move_id else '',
-                'nombre': linea.partner_id.name or '',
-                'concepto': (linea.ref if linea.ref else '') + (linea.name if linea.name else ''),
-                'debito': linea.debit,
-                'credito': linea.credit,
-                'balance': 0,
-                'tipo': '',
-                'moneda': linea.company_id.currency_id,
-            }
-
-            if linea.amount_currency:
-                detalle['moneda'] = linea.currency_id
-                if linea.amount_currency > 0:
-                    detalle['debito'] = linea.amount_currency
-                else:
-                    detalle['credito'] = -1 * linea.amount_currency
+        """Yield the posted lines of the bank account in date order with
+        their running balance.
 
-            # Si la cuenta no tiene moneda o la moneda de la cuenta es la misma de la compañía
-            if not cuenta.currency_id or (cuenta.currency_id.id == cuenta.company_id.currency_id.id):
-                usar_balance_moneda = False
-            
-                # Se agregan lineas que no tiene moneda o tienen la misma moneda que la compañía
-                if not linea.currency_id or linea.currency_id.id == cuenta.company_id.currency_id.id:
-                    lineas.append(detalle)
-                    
-            # Si no, si la cuenta si tienen moneda y la moneda de la cuenta es diferente que la de la compañía
-            else:
-                usar_balance_moneda = True
-                
-                # Se agregan lineas que tienen la moneda de la cuenta
-                if linea.currency_id.id == cuenta.currency_id.id:
-                    lineas.append(detalle)
+        The lines are read with one joined query through a named server-side
+        cursor, fetched in blocks of itersize rows, so the book is never
+        loaded in memory as a whole.
+        """
+        cuenta = self.env['account.account'].browse(datos['cuenta_bancaria_id'][0])
+        moneda_compania = cuenta.company_id.currency_id
 
         balance_inicial = self.balance_inicial(datos)
+        usar_balance_moneda = balance_inicial['usar_balance_moneda']
         if usar_balance_moneda:
             balance = balance_inicial['balance_moneda']
+            # Se agregan lineas que tienen la moneda de la cuenta
+            filtro_moneda = 'and l.currency_id = %s' % cuenta.currency_id.id
         else:
             balance = balance_inicial['balance']
+            # Se agregan lineas que no tiene moneda o tienen la misma moneda que la compañía
+            filtro_moneda = 'and (l.currency_id is null or l.currency_id = %s)' % moneda_compania.id
+
+        capacidades = self.env['l10n_gt_extra.capacidades']
+        capacidades.guardar_cambios('account.move.line')
+        capacidades.guardar_cambios('account.move', ['name'])
+        with self.env.cr._cnx.cursor('reporte_banco_%s' % cuenta.id) as cursor:
+            cursor.itersize = 2000
+            cursor.execute('select l.date, m.name, p.name, l.ref, l.name, l.debit, l.credit, l.amount_currency, l.currency_id ' \
+                'from account_move_line l join account_move m on (l.move_id = m.id) left join res_partner p on (l.partner_id = p.id) ' \
+                'where l.account_id = %s and l.parent_state = \'posted\' and l.date >= %s and l.date <= %s ' + filtro_moneda + ' ' \
+                'order by l.date, l.id',
+            (cuenta.id, datos['fecha_desde'], datos['fecha_hasta']))
 
-        for linea in lineas:
-            balance = balance + linea['debito'] - linea['credito']
-            linea['balance'] = balance
+            for fecha, documento, nombre, referencia, etiqueta, debito, credito, monto_moneda, moneda_id in cursor:
+                moneda = moneda_compania
+                if monto_moneda:
+                    moneda = self.env['res.currency'].browse(moneda_id)
+                    if monto_moneda > 0:
+                        debito = monto_moneda
+                    else:
+                        credito = -1 * monto_moneda
 
-        return lineas
+                balance = balance + debito - credito
+                yield {
+                    'fecha': fecha,
+                    'documento': documento or '',
+                    'nombre': nombre or '',
+                    'concepto': (referencia or '') + (etiqueta or ''),
+                    'debito': debito,
+                    'credito': credito,
+                    'balance': balance,
+                    'tipo': '',
+                    'moneda': moneda,
+                }
 
     def balance_inicial(self, datos):
         cuenta = self.env['account.account'].browse(datos['cuenta_bancaria_id'][0])
@@ -6,8 +6,117 @@ import logging
 
 class ReporteCompras(models.AbstractModel):
     _name = 'report.l10n_gt_extra.reporte_compras'
+    _inherit = ['l10n_gt_extra.reporte_particionado']
+
+    # Inputs of the wizard the result depends on
+    _parametros_cache = ['diarios_id', 'impuesto_id', 'fecha_desde', 'fecha_hasta']
+
+    def _extraer_facturas(self, datos):
+        """Supplier invoice headers of the book in one query"""
+        capacidades = self.env['l10n_gt_extra.capacidades'].capacidades()
+        tipo_interno = 'm.' + capacidades['tipo_interno']
+
+        columnas = ''
+        if capacidades['firma_fel']:
+            columnas += ', m.firma_fel, m.serie_fel, m.numero_fel'
+
+        self.env.cr.execute('select m.id, m.state, m.tipo_cambio_efectivo, m.invoice_date, m.ref, m.nota_debito, m.partner_id, ' + tipo_interno + ' as tipo_interno, ' \
+            'coalesce(p.pequenio_contribuyente, false) as pequenio_contribuyente' + columnas + ' ' \
+            'from account_move m left join res_partner p on (m.partner_id = p.id) ' \
+            'where m.state = \'posted\' and m.journal_id in %s and m.date >= %s and m.date <= %s ' \
+            'and ' + tipo_interno + ' in (\'in_invoice\', \'in_refund\') order by m.id',
+        (tuple(datos['diarios_id']), datos['fecha_desde'], datos['fecha_hasta']))
+        return self.env.cr.dictfetchall()
+
+    def _extraer_montos(self, move_ids):
+        """Untaxed amounts per invoice and line type (compra, servicio,
+        combustible, importacion or pequeño), and tax amounts per invoice and
+        tax, read from the posted move lines in company currency"""
+        bases = {}
+        impuestos = {}
+        if not move_ids:
+            return bases, impuestos
+
+        lineas_factura = self.env['l10n_gt_extra.capacidades'].capacidades()['lineas_factura']
+
+        self.env.cr.execute('select l.move_id, ' \
+            'case when p.pequenio_contribuyente then \'pequeño\' ' \
+            'else coalesce(nullif(m.tipo_gasto, \'mixto\'), case when pt.type = \'product\' then \'compra\' else \'servicio\' end) end as tipo_linea, ' \
+            'exists(select 1 from account_move_line_account_tax_rel r where r.account_move_line_id = l.id) as con_impuesto, ' \
+            'sum(l.balance) as monto ' \
+            'from account_move_line l join account_move m on (l.move_id = m.id) left join res_partner p on (m.partner_id = p.id) ' \
+            'left join product_product pp on (l.product_id = pp.id) left join product_template pt on (pp.product_tmpl_id = pt.id) ' \
+            'where l.move_id in %s and ' + lineas_factura + ' group by 1, 2, 3',
+        (tuple(move_ids),))
+        for r in self.env.cr.dictfetchall():
+            bases.setdefault(r['move_id'], []).append((r['tipo_linea'], r['con_impuesto'], r['monto']))
+
+        self.env.cr.execute('select l.move_id, l.tax_line_id, sum(l.balance) as monto ' \
+            'from account_move_line l where l.move_id in %s and l.tax_line_id is not null group by 1, 2',
+        (tuple(move_ids),))
+        for r in self.env.cr.dictfetchall():
+            impuestos.setdefault(r['move_id'], []).append((r['tax_line_id'], r['monto']))
+
+        return bases, impuestos
+
+    def _montos_compute_all(self, f, tipo, linea, totales, impuesto_id, tipo_cambio_efectivo=None, memoria=None):
+        """Amounts of one invoice recomputed from its lines with compute_all,
+        used when the tax lines cannot be attributed to a single line type.
+        tipo_cambio_efectivo is the payable total over the invoice total
+        stored when the invoice was posted; invoices posted before it existed
+        derive it from their lines. memoria is the compute_all_memoria dict
+        shared by the whole book."""
+        memoria = {} if memoria is None else memoria
+        tipo_cambio = 1
+        if f.currency_id.id != f.company_id.currency_id.id and tipo_cambio_efectivo is not None:
+            tipo_cambio = tipo_cambio_efectivo
+        elif f.currency_id.id != f.company_id.currency_id.id:
+            total = 0
+            for l in f.line_ids:
+                if l.account_id.reconcile:
+                    total += l.debit - l.credit
+            if f.amount_total != 0:
+                tipo_cambio = abs(total / f.amount_total)
+
+        for l in f.invoice_line_ids:
+            precio = ( l.price_unit * (1-(l.discount or 0.0)/100.0) ) * tipo_cambio
+            if tipo == 'NC':
+                precio = precio * -1
+
+            tipo_linea = f.tipo_gasto or 'mixto'
+            if tipo_linea == 'mixto':
+                if l.product_id.type == 'product':
+                    tipo_linea = 'compra'
+                else:
+                    tipo_linea = 'servicio'
 
-    def lineas(self, datos):
+            if f.partner_id.pequenio_contribuyente:
+                tipo_linea = 'pequeño'
+
+            r = l.tax_ids.compute_all_memoria(memoria, precio, currency=f.currency_id, quantity=l.quantity, product=l.product_id, partner=f.partner_id)
+
+            linea['base'] += r['total_excluded']
+            totales[tipo_linea]['total'] += r['total_excluded']
+            if len(l.tax_ids) > 0:
+                linea[tipo_linea] += r['total_excluded']
+                totales[tipo_linea]['neto'] += r['total_excluded']
+                for i in r['taxes']:
+                    self._sumar_impuesto(i['id'], i['amount'], tipo, tipo_linea, linea, totales, impuesto_id)
+            else:
+                linea[tipo_linea+'_exento'] += r['total_excluded']
+                totales[tipo_linea]['exento'] += r['total_excluded']
+
+    def _sumar_impuesto(self, tax_id, monto, tipo, tipo_linea, linea, totales, impuesto_id):
+        if tax_id == impuesto_id:
+            linea['iva'] += monto
+            totales[tipo_linea]['iva'] += monto
+            totales[tipo_linea]['total'] += monto
+        elif (monto > 0 and tipo != 'NC') or (monto < 0 and tipo == 'NC'):
+            linea[tipo_linea+'_exento'] += monto
+            totales[tipo_linea]['exento'] += monto
+            totales[tipo_linea]['total'] += monto
+
+    def _calcular(self, datos, memoria=None):
         totales = {}
 
         totales['num_facturas'] = 0
@@ -17,55 +126,51 @@ class ReporteCompras(models.AbstractModel):
         totales['importacion'] = {'exento':0,'neto':0,'iva':0,'total':0}
         totales['pequeño'] = {'exento':0,'neto':0,'iva':0,'total':0}
 
-        journal_ids = [x for x in datos['diarios_id']]
-        filtro = [
-            ('state','in',['posted']),
-            ('journal_id','in',journal_ids),
-            ('date','<=',datos['fecha_hasta']),
-            ('date','>=',datos['fecha_desde']),
-        ]
-        
-        if 'type' in self.env['account.move'].fields_get():
-            filtro.append(('type','in',['in_invoice','in_refund']))
-        else:
-            filtro.append(('move_type','in',['in_invoice','in_refund']))
-        
-        facturas = self.env['account.move'].search(filtro)
-
         lineas = []
+        if not datos['diarios_id']:
+            return { 'lineas': lineas, 'totales': totales }
+
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios()
+        impuesto_id = datos['impuesto_id'][0]
+        facturas = self._extraer_facturas(datos)
+        bases, impuestos = self._extraer_montos([f['id'] for f in facturas])
+
+        # One recordset so the QWeb and Excel outputs read every supplier in
+        # a single prefetch
+        proveedores = self.env['res.partner'].browse(list({f['partner_id'] for f in facturas if f['partner_id']}))
+        proveedores = {p.id: p for p in proveedores}
+
+        # compute_all results shared by the invoices of the book, and by
+        # the partitions when it is computed in parallel
+        if memoria is None:
+            memoria = {}
+        avanzar = self.env['l10n_gt_extra.reporte_trabajo'].avance(len(facturas), 10, 80, 'Calculando facturas')
+
         for f in facturas:
+            avanzar()
             totales['num_facturas'] += 1
 
-            tipo_cambio = 1
-            if f.currency_id.id != f.company_id.currency_id.id:
-                total = 0
-                for l in f.line_ids:
-                    if l.account_id.reconcile:
-                        total += l.debit - l.credit
-                if f.amount_total != 0:
-                    tipo_cambio = abs(total / f.amount_total)
-
             tipo = 'FACT'
-            tipo_interno_factura = f.type if 'type' in f.fields_get() else f.move_type
-            if tipo_interno_factura != 'in_invoice':
+            if f['tipo_interno'] != 'in_invoice':
                 tipo = 'NC'
-            if f.nota_debito:
+            if f['nota_debito']:
                 tipo = 'ND'
-            if f.partner_id.pequenio_contribuyente:
+            if f['pequenio_contribuyente']:
                 tipo += ' PEQ'
-           
-            numero = f.ref or ''
-            
+
+            numero = f['ref'] or ''
+
             # Por si usa factura electrónica
-            if 'firma_fel' in f.fields_get() and f.firma_fel:
-                numero = str(f.serie_fel) + '-' + str(f.numero_fel)
+            if f.get('firma_fel'):
+                numero = str(f['serie_fel']) + '-' + str(f['numero_fel'])
 
             linea = {
-                'estado': f.state,
+                'id': f['id'],
+                'estado': f['state'],
                 'tipo': tipo,
-                'fecha': f.invoice_date,
+                'fecha': f['invoice_date'],
                 'numero': numero,
-                'proveedor': f.partner_id,
+                'proveedor': proveedores.get(f['partner_id'], self.env['res.partner']),
                 'compra': 0,
                 'compra_exento': 0,
                 'servicio': 0,
@@ -81,49 +186,49 @@ class ReporteCompras(models.AbstractModel):
                 'total': 0
             }
 
-            for l in f.invoice_line_ids:
-                precio = ( l.price_unit * (1-(l.discount or 0.0)/100.0) ) * tipo_cambio
-                if tipo == 'NC':
-                    precio = precio * -1
-
-                tipo_linea = f.tipo_gasto or 'mixto'
-                if tipo_linea == 'mixto':
-                    if l.product_id.type == 'product':
-                        tipo_linea = 'compra'
+            # The move lines are signed by debit/credit, the book by document:
+            # credit notes are negative and debit notes positive
+            signo = (-1 if f['tipo_interno'] == 'in_refund' else 1) * (-1 if tipo == 'NC' else 1)
+
+            montos = bases.get(f['id'], [])
+            tipos_con_impuesto = {tipo_linea for tipo_linea, con_impuesto, monto in montos if con_impuesto}
+            if f['id'] in impuestos and len(tipos_con_impuesto) != 1:
+                self._montos_compute_all(self.env['account.move'].browse(f['id']), tipo, linea, totales, impuesto_id, f['tipo_cambio_efectivo'], memoria)
+            else:
+                for tipo_linea, con_impuesto, monto in montos:
+                    monto = monto * signo
+                    linea['base'] += monto
+                    totales[tipo_linea]['total'] += monto
+                    if con_impuesto:
+                        linea[tipo_linea] += monto
+                        totales[tipo_linea]['neto'] += monto
                     else:
-                        tipo_linea = 'servicio'
-
-                if f.partner_id.pequenio_contribuyente:
-                    tipo_linea = 'pequeño'
-
-                r = l.tax_ids.compute_all(precio, currency=f.currency_id, quantity=l.quantity, product=l.product_id, partner=f.partner_id)
-
-                linea['base'] += r['total_excluded']
-                totales[tipo_linea]['total'] += r['total_excluded']
-                if len(l.tax_ids) > 0:
-                    linea[tipo_linea] += r['total_excluded']
-                    totales[tipo_linea]['neto'] += r['total_excluded']
-                    for i in r['taxes']:
-                        if i['id'] == datos['impuesto_id'][0]:
-                            linea['iva'] += i['amount']
-                            totales[tipo_linea]['iva'] += i['amount']
-                            totales[tipo_linea]['total'] += i['amount']
-                        elif (i['amount'] > 0 and tipo != 'NC') or (i['amount'] < 0 and tipo == 'NC'):
-                            linea[tipo_linea+'_exento'] += i['amount']
-                            totales[tipo_linea]['exento'] += i['amount']
-                            totales[tipo_linea]['total'] += i['amount']
-                else:
-                    linea[tipo_linea+'_exento'] += r['total_excluded']
-                    totales[tipo_linea]['exento'] += r['total_excluded']
+                        linea[tipo_linea+'_exento'] += monto
+                        totales[tipo_linea]['exento'] += monto
+
+                # Only reached with a single taxed line type, so the tax lines
+                # belong to it
+                for tax_id, monto in impuestos.get(f['id'], []):
+                    self._sumar_impuesto(tax_id, monto * signo, tipo, min(tipos_con_impuesto), linea, totales, impuesto_id)
 
             linea['total'] += linea['compra'] + linea['compra_exento'] + linea['servicio'] + linea['servicio_exento'] + linea['combustible'] + linea['combustible_exento'] + linea['importacion'] + linea['importacion_exento'] + linea['pequeño'] + linea['pequeño_exento'] + linea['iva']
 
             lineas.append(linea)
-            
-        lineas = sorted(lineas, key = lambda i: str(i['fecha']) + str(i['numero']))
+
+        lineas = sorted(lineas, key=self._orden_lineas)
 
         return { 'lineas': lineas, 'totales': totales }
 
+    def _lineas(self, datos):
+        if datos.get('paralelo'):
+            return self._calcular_particionado(datos)
+        return self._calcular(datos)
+
+    def lineas(self, datos):
+        """Result of _lineas, reused while the data it reads does not change"""
+        cache = self.env['l10n_gt_extra.reporte_cache']
+        return cache.obtener(self._name, datos, self._parametros_cache, lambda: cache.huella_diarios(datos['diarios_id'], datos['fecha_desde'], datos['fecha_hasta']), lambda: self._lineas(datos))
+
     @api.model
     def _get_report_values(self, docids, data=None):
         model = self.env.context.get('active_model')
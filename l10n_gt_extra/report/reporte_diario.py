@@ -1,34 +1,23 @@
 # -*- encoding: utf-8 -*-
 
 from odoo import api, models, fields
-from odoo.release import version_info
 import logging
 
 class ReporteDiario(models.AbstractModel):
     _name = 'report.l10n_gt_extra.reporte_diario'
 
+    # Inputs of the wizard the result depends on
+    _parametros_cache = ['cuentas_id', 'fecha_desde', 'fecha_hasta', 'agrupado_por_dia']
+
     def retornar_saldo_inicial_todos_anios(self, cuenta, fecha_desde):
-        saldo_inicial = 0
-        self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, sum(l.debit) as debe, sum(l.credit) as haber '\
-        'from account_move_line l join account_account a on(l.account_id = a.id)'\
-        'where l.parent_state = \'posted\' and a.id = %s and l.date < %s group by a.id, a.code, a.name,l.debit,l.credit', (cuenta,fecha_desde))
-        for m in self.env.cr.dictfetchall():
-            saldo_inicial += m['debe'] - m['haber']
-        return saldo_inicial
+        return self.env['l10n_gt_extra.saldo_mensual'].sumar([cuenta], fecha_desde).get(cuenta, 0)
 
     def retornar_saldo_inicial_inicio_anio(self, cuenta, fecha_desde):
-        saldo_inicial = 0
-        fecha = fields.Date.from_string(fecha_desde)
-        self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, sum(l.debit) as debe, sum(l.credit) as haber '\
-        'from account_move_line l join account_account a on(l.account_id = a.id)'\
-        'where l.parent_state = \'posted\' and a.id = %s and l.date < %s and l.date >= %s group by a.id, a.code, a.name,l.debit,l.credit', (cuenta,fecha_desde,fecha.strftime('%Y-1-1')))
-        for m in self.env.cr.dictfetchall():
-            saldo_inicial += m['debe'] - m['haber']
-        return saldo_inicial
+        fecha = fields.Date.to_date(fecha_desde)
+        return self.env['l10n_gt_extra.saldo_mensual'].sumar([cuenta], fecha, fecha.replace(month=1, day=1)).get(cuenta, 0)
 
-    def lineas(self, datos):
+    def _lineas(self, datos):
         totales = {}
-        lineas_resumidas = {}
         lineas=[]
         totales['debe'] = 0
         totales['haber'] = 0
@@ -36,26 +25,22 @@ class ReporteDiario(models.AbstractModel):
         totales['saldo_final'] = 0
 
         account_ids = [x for x in datos['cuentas_id']]
-        movimientos = self.env['account.move.line'].search([
-            ('account_id','in',account_ids),
-            ('date','<=',datos['fecha_hasta']),
-            ('date','>=',datos['fecha_desde'])])
-
-        if version_info[0] in [13, 14, 15]:
-            include_initial_balance = 't.include_initial_balance'
-            join_initial_balance = 'join account_account_type t on (t.id = a.user_type_id)'
-        else:
-            include_initial_balance = 'a.include_initial_balance'
-            join_initial_balance = ''
+        if not account_ids:
+            return {'lineas': lineas,'totales': totales }
+
+        saldos_iniciales = self.env['l10n_gt_extra.saldo_mensual'].saldos_iniciales(account_ids, datos['fecha_desde'])
+
+        capacidades = self.env['l10n_gt_extra.capacidades'].capacidades()
+        include_initial_balance = capacidades['include_initial_balance']
+        join_initial_balance = capacidades['join_initial_balance']
 
-        accounts_str = ','.join([str(x) for x in datos['cuentas_id']])
         if datos['agrupado_por_dia']:
 
             self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, l.date as fecha, ' + include_initial_balance + ' as balance_inicial, sum(l.debit) as debe, sum(l.credit) as haber ' \
             	'from account_move_line l join account_account a on(l.account_id = a.id)' \
             	+ join_initial_balance + \
-            	'where l.parent_state = \'posted\' and a.id in ('+accounts_str+') and l.date >= %s and l.date <= %s group by a.id, a.code, a.name,l.date, ' + include_initial_balance + ' ORDER BY l.date,a.code',
-            (datos['fecha_desde'], datos['fecha_hasta']))
+            	'where l.parent_state = \'posted\' and a.id in %s and l.date >= %s and l.date <= %s group by a.id, a.code, a.name,l.date, ' + include_initial_balance + ' ORDER BY l.date,a.code',
+            (tuple(account_ids), datos['fecha_desde'], datos['fecha_hasta']))
 
             for r in self.env.cr.dictfetchall():
                 totales['debe'] += r['debe']
@@ -74,16 +59,10 @@ class ReporteDiario(models.AbstractModel):
                 lineas.append(linea)
 
             for l in lineas:
-                if not l['balance_inicial']:
-                    l['saldo_inicial'] += self.retornar_saldo_inicial_inicio_anio(l['id'], datos['fecha_desde'])
-                    l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                    totales['saldo_inicial'] += l['saldo_inicial']
-                    totales['saldo_final'] += l['saldo_final']
-                else:
-                    l['saldo_inicial'] += self.retornar_saldo_inicial_todos_anios(l['id'], datos['fecha_desde'])
-                    l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                    totales['saldo_inicial'] += l['saldo_inicial']
-                    totales['saldo_final'] += l['saldo_final']
+                l['saldo_inicial'] += saldos_iniciales.get(l['id'], 0)
+                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
+                totales['saldo_inicial'] += l['saldo_inicial']
+                totales['saldo_final'] += l['saldo_final']
 
             cuentas_agrupadas = {}
             llave = 'fecha'
@@ -103,8 +82,8 @@ class ReporteDiario(models.AbstractModel):
             self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, ' + include_initial_balance + ' as balance_inicial, sum(l.debit) as debe, sum(l.credit) as haber ' \
             	'from account_move_line l join account_account a on(l.account_id = a.id)' \
             	+ join_initial_balance + \
-            	'where l.parent_state = \'posted\' and a.id in ('+accounts_str+') and l.date >= %s and l.date <= %s group by a.id, a.code, a.name,' + include_initial_balance + ' ORDER BY a.code',
-            (datos['fecha_desde'], datos['fecha_hasta']))
+            	'where l.parent_state = \'posted\' and a.id in %s and l.date >= %s and l.date <= %s group by a.id, a.code, a.name,' + include_initial_balance + ' ORDER BY a.code',
+            (tuple(account_ids), datos['fecha_desde'], datos['fecha_hasta']))
 
             for r in self.env.cr.dictfetchall():
                 totales['debe'] += r['debe']
@@ -122,19 +101,18 @@ class ReporteDiario(models.AbstractModel):
                 lineas.append(linea)
 
             for l in lineas:
-                if not l['balance_inicial']:
-                    l['saldo_inicial'] += self.retornar_saldo_inicial_inicio_anio(l['id'], datos['fecha_desde'])
-                    l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                    totales['saldo_inicial'] += l['saldo_inicial']
-                    totales['saldo_final'] += l['saldo_final']
-                else:
-                    l['saldo_inicial'] += self.retornar_saldo_inicial_todos_anios(l['id'], datos['fecha_desde'])
-                    l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                    totales['saldo_inicial'] += l['saldo_inicial']
-                    totales['saldo_final'] += l['saldo_final']
+                l['saldo_inicial'] += saldos_iniciales.get(l['id'], 0)
+                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
+                totales['saldo_inicial'] += l['saldo_inicial']
+                totales['saldo_final'] += l['saldo_final']
 
         return {'lineas': lineas,'totales': totales }
 
+    def lineas(self, datos):
+        """Result of _lineas, reused while the data it reads does not change"""
+        cache = self.env['l10n_gt_extra.reporte_cache']
+        return cache.obtener(self._name, datos, self._parametros_cache, lambda: cache.huella_cuentas(datos['cuentas_id'], datos['fecha_hasta']), lambda: self._lineas(datos))
+
     @api.model
     def _get_report_values(self, docids, data=None):
         model = self.env.context.get('active_model')
@@ -1,7 +1,6 @@
 # -*- encoding: utf-8 -*-
 
 from odoo import api, models, fields
-from odoo.release import version_info
 import time
 import datetime
 import logging
@@ -10,118 +9,76 @@ class ReporteInventario(models.AbstractModel):
     _name = 'report.l10n_gt_extra.reporte_inventario'
 
     def retornar_saldo_inicial_todos_anios(self, cuenta, fecha_desde):
-        saldo_inicial = 0
-        self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, sum(l.debit) as debe, sum(l.credit) as haber '\
-        'from account_move_line l join account_account a on(l.account_id = a.id)'\
-        'where a.id = %s and l.date < %s group by a.id, a.code, a.name,l.debit,l.credit', (cuenta,fecha_desde))
-        for m in self.env.cr.dictfetchall():
-            saldo_inicial += m['debe'] - m['haber']
-        return saldo_inicial
+        return self.env['l10n_gt_extra.saldo_mensual'].sumar([cuenta], fecha_desde).get(cuenta, 0)
 
     def retornar_saldo_inicial_inicio_anio(self, cuenta, fecha_desde):
-        saldo_inicial = 0
-        fecha = fields.Date.from_string(fecha_desde)
-        self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, sum(l.debit) as debe, sum(l.credit) as haber '\
-        'from account_move_line l join account_account a on(l.account_id = a.id)'\
-        'where a.id = %s and l.date < %s and l.date >= %s group by a.id, a.code, a.name,l.debit,l.credit', (cuenta,fecha_desde,fecha.strftime('%Y-1-1')))
-        for m in self.env.cr.dictfetchall():
-            saldo_inicial += m['debe'] - m['haber']
-        return saldo_inicial
+        fecha = fields.Date.to_date(fecha_desde)
+        return self.env['l10n_gt_extra.saldo_mensual'].sumar([cuenta], fecha, fecha.replace(month=1, day=1)).get(cuenta, 0)
 
     def lineas(self, datos):
+        """Balance sheet in one query: accounts are classified in SQL, their
+        movements of the year and opening balances aggregated, and the totals
+        per group and of the book come from the same GROUPING SETS"""
         totales = {}
-        lineas_resumidas = {}
         lineas = {'activo':[],'total_activo': 0,'pasivo': [],'total_pasivo': 0,'capital': [],'total_capital': 0,}
-        agrupado = {'activo':[],'pasivo': [],'capital': []}
         totales['debe'] = 0
         totales['haber'] = 0
         totales['saldo_inicial'] = 0
         totales['saldo_final'] = 0
-        fecha_desde = ''
 
-        fecha_desde = str(fields.Date.to_date(datos['fecha_hasta']).strftime("%Y") + '-' + '01' + '-' + '01')
         account_ids = [x for x in datos['cuentas_id']]
-        accounts_str = ','.join([str(x) for x in datos['cuentas_id']])
-
-        if version_info[0] in [13, 14, 15]:
-            include_initial_balance = 't.include_initial_balance'
-            join_initial_balance = 'join account_account_type t on (t.id = a.user_type_id)'
-            account_type = 't.id'
-        else:
-            include_initial_balance = 'a.include_initial_balance'
-            join_initial_balance = ''
-            account_type = 'a.account_type'
-
-        self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, ' + account_type + ' as id_cuenta, ' + include_initial_balance + ' as balance_inicial, sum(l.debit) as debe, sum(l.credit) as haber ' \
-        	'from account_move_line l join account_account a on(l.account_id = a.id)' \
-        	+ join_initial_balance + \
-        	'where a.id in ('+accounts_str+') and l.date >= %s and l.date <= %s group by a.id, a.code, a.name, ' + account_type + ',' + include_initial_balance + ' ORDER BY a.code',
-        (fecha_desde, datos['fecha_hasta']))
+        if not account_ids:
+            return {'lineas': lineas,'totales': totales }
+
+        fecha_desde = self.fecha_desde(datos)
+
+        capacidades = self.env['l10n_gt_extra.capacidades'].capacidades()
+        include_initial_balance = capacidades['include_initial_balance']
+        join_initial_balance = capacidades['join_initial_balance']
+        grupo_balance = capacidades['grupo_balance']
+
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios('account.move.line', ['account_id', 'date', 'debit', 'credit', 'parent_state'])
+        # The year starts on January 1, so the accounts that carry their
+        # balance take it from the monthly snapshots of previous years only
+        self.env.cr.execute('with cuentas as (' \
+                'select a.id, a.code as codigo, a.name as cuenta, ' + grupo_balance + ' as grupo, ' + include_initial_balance + ' as balance_inicial ' \
+                'from account_account a ' + join_initial_balance + ' where a.id in %(cuentas)s' \
+            '), movimientos as (' \
+                'select l.account_id, sum(l.debit) as debe, sum(l.credit) as haber from account_move_line l ' \
+                'where l.parent_state = \'posted\' and l.account_id in %(cuentas)s and l.date >= %(desde)s and l.date <= %(hasta)s group by l.account_id' \
+            '), iniciales as (' \
+                'select s.account_id, sum(s.debe - s.haber) as saldo from l10n_gt_extra_saldo_mensual s ' \
+                'where s.account_id in %(cuentas)s and s.mes < %(desde)s group by s.account_id' \
+            ') ' \
+            'select c.grupo, c.id, c.codigo, c.cuenta, c.balance_inicial, grouping(c.grupo) as total_libro, grouping(c.id) as total_grupo, ' \
+                'sum(case when c.balance_inicial then coalesce(i.saldo, 0) else 0 end) as saldo_inicial, sum(m.debe) as debe, sum(m.haber) as haber ' \
+            'from cuentas c join movimientos m on (m.account_id = c.id) left join iniciales i on (i.account_id = c.id) ' \
+            'group by grouping sets ((c.grupo, c.id, c.codigo, c.cuenta, c.balance_inicial), (c.grupo), ()) ' \
+            'order by c.codigo',
+        {'cuentas': tuple(account_ids), 'desde': fecha_desde, 'hasta': datos['fecha_hasta']})
 
         for r in self.env.cr.dictfetchall():
-            totales['debe'] += r['debe']
-            totales['haber'] += r['haber']
-            linea = {
-                'id': r['id'],
-                'codigo': r['codigo'],
-                'cuenta': r['cuenta'],
-                'saldo_inicial': 0,
-                'debe': r['debe'],
-                'haber': r['haber'],
-                'saldo_final': 0,
-                'balance_inicial': r['balance_inicial']
-            }
-
-            if version_info[0] in [13, 14, 15]:
-                if r['id_cuenta'] in [1,3,5,6,7,8]:
-                    lineas['activo'].append(linea)
-                elif r['id_cuenta'] in [2,4,9,10]:
-                    lineas['pasivo'].append(linea)
-                elif r['id_cuenta'] in [11]:
-                    lineas['capital'].append(linea)
-            else:
-                if r['id_cuenta'][0:5] == 'asset':
-                    lineas['activo'].append(linea)
-                elif r['id_cuenta'][0:9] == 'liability':
-                    lineas['pasivo'].append(linea)
-                elif r['id_cuenta'][0:6] == 'equity':
-                    lineas['capital'].append(linea)
-
-        for l in lineas['activo']:
-            if not l['balance_inicial']:
-                l['saldo_inicial'] += self.retornar_saldo_inicial_inicio_anio(l['id'], fecha_desde)
-                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                totales['saldo_inicial'] += l['saldo_inicial']
-                totales['saldo_final'] += l['saldo_final']
-            else:
-                l['saldo_inicial'] += self.retornar_saldo_inicial_todos_anios(l['id'], fecha_desde)
-                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                totales['saldo_inicial'] += l['saldo_inicial']
-                totales['saldo_final'] += l['saldo_final']
-
-        for l in lineas['pasivo']:
-            if not l['balance_inicial']:
-                l['saldo_inicial'] += self.retornar_saldo_inicial_inicio_anio(l['id'], fecha_desde)
-                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                totales['saldo_inicial'] += l['saldo_inicial']
-                totales['saldo_final'] += l['saldo_final']
-            else:
-                l['saldo_inicial'] += self.retornar_saldo_inicial_todos_anios(l['id'], fecha_desde)
-                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                totales['saldo_inicial'] += l['saldo_inicial']
-                totales['saldo_final'] += l['saldo_final']
-
-        for l in lineas['capital']:
-            if not l['balance_inicial']:
-                l['saldo_inicial'] += self.retornar_saldo_inicial_inicio_anio(l['id'], fecha_desde)
-                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                totales['saldo_inicial'] += l['saldo_inicial']
-                totales['saldo_final'] += l['saldo_final']
-            else:
-                l['saldo_inicial'] += self.retornar_saldo_inicial_todos_anios(l['id'], fecha_desde)
-                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                totales['saldo_inicial'] += l['saldo_inicial']
-                totales['saldo_final'] += l['saldo_final']
+            saldo_final = r['saldo_inicial'] + r['debe'] - r['haber']
+            if r['total_libro']:
+                totales['debe'] = r['debe']
+                totales['haber'] = r['haber']
+            elif r['total_grupo']:
+                # Accounts outside the balance sheet only count in debe/haber
+                if r['grupo']:
+                    lineas['total_' + r['grupo']] = saldo_final
+                    totales['saldo_inicial'] += r['saldo_inicial']
+                    totales['saldo_final'] += saldo_final
+            elif r['grupo']:
+                lineas[r['grupo']].append({
+                    'id': r['id'],
+                    'codigo': r['codigo'],
+                    'cuenta': r['cuenta'],
+                    'saldo_inicial': r['saldo_inicial'],
+                    'debe': r['debe'],
+                    'haber': r['haber'],
+                    'saldo_final': saldo_final,
+                    'balance_inicial': r['balance_inicial']
+                })
 
         return {'lineas': lineas,'totales': totales }
 
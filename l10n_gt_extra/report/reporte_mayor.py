@@ -1,34 +1,28 @@
 # -*- encoding: utf-8 -*-
 
 from odoo import api, models, fields
-from odoo.release import version_info
 import logging
 
 class ReporteMayor(models.AbstractModel):
     _name = 'report.l10n_gt_extra.reporte_mayor'
 
+    # Inputs of the wizard the result depends on
+    _parametros_cache = ['cuentas_id', 'fecha_desde', 'fecha_hasta', 'agrupado_por_dia', 'agrupado_todo']
+
     def retornar_saldo_inicial_todos_anios(self, cuenta, fecha_desde):
-        saldo_inicial = 0
-        self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, sum(l.debit) as debe, sum(l.credit) as haber '\
-        'from account_move_line l join account_account a on(l.account_id = a.id)'\
-        'where l.parent_state = \'posted\' and a.id = %s and l.date < %s group by a.id, a.code, a.name,l.debit,l.credit', (cuenta,fecha_desde))
-        for m in self.env.cr.dictfetchall():
-            saldo_inicial += m['debe'] - m['haber']
-        return saldo_inicial
+        return self.env['l10n_gt_extra.saldo_mensual'].sumar([cuenta], fecha_desde).get(cuenta, 0)
 
     def retornar_saldo_inicial_inicio_anio(self, cuenta, fecha_desde):
-        saldo_inicial = 0
-        fecha = fields.Date.from_string(fecha_desde)
-        self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, sum(l.debit) as debe, sum(l.credit) as haber '\
-        'from account_move_line l join account_account a on(l.account_id = a.id)'\
-        'where l.parent_state = \'posted\' and a.id = %s and l.date < %s and l.date >= %s group by a.id, a.code, a.name,l.debit,l.credit', (cuenta,fecha_desde,fecha.strftime('%Y-1-1')))
-        for m in self.env.cr.dictfetchall():
-            saldo_inicial += m['debe'] - m['haber']
-        return saldo_inicial
+        fecha = fields.Date.to_date(fecha_desde)
+        return self.env['l10n_gt_extra.saldo_mensual'].sumar([cuenta], fecha, fecha.replace(month=1, day=1)).get(cuenta, 0)
 
-    def lineas(self, datos):
+    def retornar_saldos_iniciales(self, cuentas, fecha_desde):
+        """Opening balance of every account, {account_id: saldo}, read from
+        the monthly snapshots plus the current partial month."""
+        return self.env['l10n_gt_extra.saldo_mensual'].saldos_iniciales(cuentas, fecha_desde)
+
+    def _lineas(self, datos):
         totales = {}
-        lineas_resumidas = {}
         lineas=[]
         totales['debe'] = 0
         totales['haber'] = 0
@@ -36,27 +30,22 @@ class ReporteMayor(models.AbstractModel):
         totales['saldo_final'] = 0
 
         account_ids = [x for x in datos['cuentas_id']]
-        movimientos = self.env['account.move.line'].search([
-            ('account_id','in',account_ids),
-            ('parent_state','=','posted'),
-            ('date','<=',datos['fecha_hasta']),
-            ('date','>=',datos['fecha_desde'])])
-
-        if version_info[0] in [13, 14, 15]:
-            include_initial_balance = 't.include_initial_balance'
-            join_initial_balance = 'join account_account_type t on (t.id = a.user_type_id)'
-        else:
-            include_initial_balance = 'a.include_initial_balance'
-            join_initial_balance = ''
+        if not account_ids:
+            return {'lineas': lineas,'totales': totales }
+
+        saldos_iniciales = self.retornar_saldos_iniciales(account_ids, datos['fecha_desde'])
+
+        capacidades = self.env['l10n_gt_extra.capacidades'].capacidades()
+        include_initial_balance = capacidades['include_initial_balance']
+        join_initial_balance = capacidades['join_initial_balance']
 
-        accounts_str = ','.join([str(x) for x in datos['cuentas_id']])
         if datos['agrupado_por_dia']:
             
             self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, l.date as fecha, ' + include_initial_balance + ' as balance_inicial, sum(l.debit) as debe, sum(l.credit) as haber ' \
                 'from account_move_line l join account_account a on(l.account_id = a.id)' \
                 + join_initial_balance + \
-                'where l.parent_state = \'posted\' and a.id in ('+accounts_str+') and l.date >= %s and l.date <= %s group by a.id, a.code, a.name, l.date, ' + include_initial_balance + ' ORDER BY l.date, a.code',
-            (datos['fecha_desde'], datos['fecha_hasta']))
+                'where l.parent_state = \'posted\' and a.id in %s and l.date >= %s and l.date <= %s group by a.id, a.code, a.name, l.date, ' + include_initial_balance + ' ORDER BY l.date, a.code',
+            (tuple(account_ids), datos['fecha_desde'], datos['fecha_hasta']))
 
             for r in self.env.cr.dictfetchall():
                 totales['debe'] += r['debe']
@@ -88,10 +77,7 @@ class ReporteMayor(models.AbstractModel):
                         'total_haber': 0
                     }
 
-                    if not l['balance_inicial']:
-                        cuentas_agrupadas[l[llave]]['saldo_inicial'] = self.retornar_saldo_inicial_inicio_anio(l['id'], datos['fecha_desde'])
-                    else:
-                        cuentas_agrupadas[l[llave]]['saldo_inicial'] = saldo = self.retornar_saldo_inicial_todos_anios(l['id'], datos['fecha_desde'])
+                    cuentas_agrupadas[l[llave]]['saldo_inicial'] = saldos_iniciales.get(l['id'], 0)
                 cuentas_agrupadas[l[llave]]['fechas'].append(l)
 
             for cuenta in cuentas_agrupadas.values():
@@ -106,8 +92,8 @@ class ReporteMayor(models.AbstractModel):
             self.env.cr.execute('select a.id, a.code as codigo, a.name as cuenta, ' + include_initial_balance + ' as balance_inicial, sum(l.debit) as debe, sum(l.credit) as haber ' \
             	'from account_move_line l join account_account a on(l.account_id = a.id)' \
             	+ join_initial_balance + \
-            	'where l.parent_state = \'posted\' and a.id in ('+accounts_str+') and l.date >= %s and l.date <= %s group by a.id, a.code, a.name, ' + include_initial_balance + ' ORDER BY a.code',
-            (datos['fecha_desde'], datos['fecha_hasta']))
+            	'where l.parent_state = \'posted\' and a.id in %s and l.date >= %s and l.date <= %s group by a.id, a.code, a.name, ' + include_initial_balance + ' ORDER BY a.code',
+            (tuple(account_ids), datos['fecha_desde'], datos['fecha_hasta']))
 
             for r in self.env.cr.dictfetchall():
                 totales['debe'] += r['debe']
@@ -125,16 +111,10 @@ class ReporteMayor(models.AbstractModel):
                 lineas.append(linea)
 
             for l in lineas:
-                if not l['balance_inicial']:
-                    l['saldo_inicial'] += self.retornar_saldo_inicial_inicio_anio(l['id'], datos['fecha_desde'])
-                    l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                    totales['saldo_inicial'] += l['saldo_inicial']
-                    totales['saldo_final'] += l['saldo_final']
-                else:
-                    l['saldo_inicial'] += self.retornar_saldo_inicial_todos_anios(l['id'], datos['fecha_desde'])
-                    l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
-                    totales['saldo_inicial'] += l['saldo_inicial']
-                    totales['saldo_final'] += l['saldo_final']
+                l['saldo_inicial'] += saldos_iniciales.get(l['id'], 0)
+                l['saldo_final'] += l['saldo_inicial'] + l['debe'] - l['haber']
+                totales['saldo_inicial'] += l['saldo_inicial']
+                totales['saldo_final'] += l['saldo_final']
         else:
             # Always include move name and use move.ref as fallback for null etiqueta
             etiqueta_select = "CONCAT(m.name, ' - ', COALESCE(NULLIF(l.name, ''), m.ref, 'Sin descripción')) as etiqueta"
@@ -143,10 +123,13 @@ class ReporteMayor(models.AbstractModel):
             self.env.cr.execute('select ' + etiqueta_select + ', p.name as partner_name, a.id, a.code as codigo, a.name as cuenta, l.date,' + include_initial_balance + ' as balance_inicial, sum(l.debit) as debe, sum(l.credit) as haber ' \
             	'from account_move_line l join account_account a on(l.account_id = a.id) join account_move m on(l.move_id = m.id) left join res_partner p on(l.partner_id = p.id)' \
             	+ join_initial_balance + ' ' \
-            	'where l.parent_state = \'posted\' and a.id in ('+accounts_str+') and l.date >= %s and l.date <= %s group by ' + group_by_etiqueta + ', p.name, a.id, a.code, a.name, l.date,' + include_initial_balance + ' ORDER BY a.code',
-            (datos['fecha_desde'], datos['fecha_hasta']))
+            	'where l.parent_state = \'posted\' and a.id in %s and l.date >= %s and l.date <= %s group by ' + group_by_etiqueta + ', p.name, a.id, a.code, a.name, l.date,' + include_initial_balance + ' ORDER BY a.code',
+            (tuple(account_ids), datos['fecha_desde'], datos['fecha_hasta']))
+            filas = self.env.cr.dictfetchall()
+            avanzar = self.env['l10n_gt_extra.reporte_trabajo'].avance(len(filas), 10, 80, 'Calculando movimientos')
 
-            for r in self.env.cr.dictfetchall():
+            for r in filas:
+                avanzar()
                 totales['debe'] += r['debe']
                 totales['haber'] += r['haber']
                 linea = {
@@ -180,11 +163,8 @@ class ReporteMayor(models.AbstractModel):
                         'balance_inicial': l['balance_inicial']
                     }
 
-                    if not l['balance_inicial']:
-                        cuentas_agrupadas[l[llave]]['saldo_inicial'] = self.retornar_saldo_inicial_inicio_anio(l['id'], datos['fecha_desde'])
-                    else:
-                        cuentas_agrupadas[l[llave]]['saldo_inicial'] = self.retornar_saldo_inicial_todos_anios(l['id'], datos['fecha_desde'])
-                
+                    cuentas_agrupadas[l[llave]]['saldo_inicial'] = saldos_iniciales.get(l['id'], 0)
+
                 cuentas_agrupadas[l[llave]]['movimientos'].append(l)
 
             for cuenta in cuentas_agrupadas.values():
@@ -206,6 +186,11 @@ class ReporteMayor(models.AbstractModel):
 
         return {'lineas': lineas,'totales': totales }
 
+    def lineas(self, datos):
+        """Result of _lineas, reused while the data it reads does not change"""
+        cache = self.env['l10n_gt_extra.reporte_cache']
+        return cache.obtener(self._name, datos, self._parametros_cache, lambda: cache.huella_cuentas(datos['cuentas_id'], datos['fecha_hasta']), lambda: self._lineas(datos))
+
     @api.model
     def _get_report_values(self, docids, data=None):
         model = self.env.context.get('active_model')
@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+
+from odoo import api, models, fields
+from odoo.tools import config
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from dateutil.relativedelta import relativedelta
+import logging
+import os
+
+_logger = logging.getLogger(__name__)
+
+class ReporteParticionado(models.AbstractModel):
+    """Books that inherit this model implement ``_calcular(datos,
+    memoria=None)``, which returns ``{'lineas': [...], 'totales': {...}}``
+    for datos: lines sorted by ``_orden_lineas``, each with the ``fecha``,
+    ``numero`` and ``id`` of its move, and totals that add up across
+    partitions. memoria is the dict shared by the compute_all_memoria
+    calls of every partition. ``_calcular_particionado`` calls it once per
+    journal and month and merges the results."""
+    _name = 'l10n_gt_extra.reporte_particionado'
+    _description = 'Generación de libros por diario y mes en paralelo'
+
+    def _orden_lineas(self, linea):
+        # Lines with the same date and number, e.g. supplier bills without
+        # reference, keep the order of their moves in both modes
+        return (str(linea['fecha']) + str(linea['numero']), linea['id'])
+
+    def _particiones(self, datos):
+        """One copy of datos per journal and month, in journal and date order"""
+        fecha_desde = fields.Date.to_date(datos['fecha_desde'])
+        fecha_hasta = fields.Date.to_date(datos['fecha_hasta'])
+        particiones = []
+        for diario in sorted(datos['diarios_id']):
+            inicio = fecha_desde
+            while inicio <= fecha_hasta:
+                fin = min(inicio.replace(day=1) + relativedelta(months=1, days=-1), fecha_hasta)
+                particiones.append(dict(datos, diarios_id=[diario], fecha_desde=inicio, fecha_hasta=fin))
+                inicio = fin + relativedelta(days=1)
+        return particiones
+
+    def _procesos(self, particiones):
+        procesos = int(self.env['ir.config_parameter'].sudo().get_param('l10n_gt_extra.reporte_procesos', 0)) or os.cpu_count() or 1
+        # Leave connections for the rest of the server
+        return max(1, min(procesos, len(particiones), config['db_maxconn'] // 2))
+
+    def _calcular_particion(self, snapshot, datos, memoria):
+        """Compute one partition on its own cursor, reading the snapshot of
+        the transaction that started the report"""
+        # Environments need manage() in threads before 15
+        manage = api.Environment.manage() if hasattr(api.Environment, 'manage') else nullcontext()
+        with manage, self.env.registry.cursor() as cr:
+            cr.execute('set transaction snapshot %s', (snapshot,))
+            cr.execute('set transaction read only')
+            # Progress is reported per partition by the calling thread
+            contexto = dict(self.env.context)
+            contexto.pop('reporte_trabajo_id', None)
+            contexto.pop('reporte_instantanea', None)
+            env = api.Environment(cr, self.env.uid, contexto)
+            return env[self._name]._calcular(datos, memoria)
+
+    def _sumar_totales(self, totales, parcial):
+        for llave, valor in parcial.items():
+            if isinstance(valor, dict):
+                self._sumar_totales(totales.setdefault(llave, {}), valor)
+            else:
+                totales[llave] = totales.get(llave, 0) + valor
+
+    def _calcular_particionado(self, datos):
+        """Split the book by journal and month, compute the partitions in a
+        pool of threads, each with its own database connection, and merge
+        them in order.
+
+        The partitions import the snapshot of the current transaction, which
+        does not include its own uncommitted writes, so the book is only
+        split when the transaction has not written anything. Background jobs
+        pass the snapshot of the committed data in the reporte_instantanea
+        context key instead, see reporte_trabajo._instantanea."""
+        particiones = self._particiones(datos)
+        if len(particiones) < 2 or self.env.registry.in_test_mode():
+            return self._calcular(datos)
+
+        snapshot = self.env.context.get('reporte_instantanea')
+        if not snapshot:
+            self.env['l10n_gt_extra.capacidades'].guardar_cambios()
+            self.env.cr.execute('select txid_current_if_assigned()')
+            if self.env.cr.fetchone()[0] is not None:
+                _logger.info('%s: la transacción tiene cambios sin confirmar, se calcula sin particiones', self._name)
+                return self._calcular(datos)
+            self.env.cr.execute('select pg_export_snapshot()')
+            snapshot = self.env.cr.fetchone()[0]
+        # compute_all results are plain values, shared by every partition
+        memoria = {}
+
+        procesos = self._procesos(particiones)
+        _logger.info('%s: %s particiones en %s procesos', self._name, len(particiones), procesos)
+        avanzar = self.env['l10n_gt_extra.reporte_trabajo'].avance(len(particiones), 10, 80, 'Calculando diarios y meses')
+        resultados = []
+        with ThreadPoolExecutor(max_workers=procesos) as ejecutor:
+            for resultado in ejecutor.map(lambda particion: self._calcular_particion(snapshot, particion, memoria), particiones):
+                avanzar()
+                resultados.append(resultado)
+
+        lineas = []
+        totales = {}
+        for resultado in resultados:
+            for linea in resultado['lineas']:
+                # Records of the partitions belong to cursors already closed
+                for llave, valor in linea.items():
+                    if isinstance(valor, models.BaseModel):
+                        linea[llave] = valor.with_env(self.env)
+                lineas.append(linea)
+            self._sumar_totales(totales, resultado['totales'])
+
+        return {'lineas': sorted(lineas, key=self._orden_lineas), 'totales': totales}
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -19,6 +19,7 @@ class ReportePartida(models.AbstractModel):
             'doc_ids': docids,
             'doc_model': model,
             'docs': docs,
+            'capacidades': self.env['l10n_gt_extra.capacidades'].capacidades(),
             'current_company_id': self.env.company,
         }
 
@@ -6,8 +6,128 @@ import logging
 
 class ReporteVentas(models.AbstractModel):
     _name = 'report.l10n_gt_extra.reporte_ventas'
+    _inherit = ['l10n_gt_extra.reporte_particionado']
 
-    def lineas(self, datos):
+    # Inputs of the wizard the result depends on
+    _parametros_cache = ['diarios_id', 'impuesto_id', 'fecha_desde', 'fecha_hasta', 'resumido']
+
+    def _extraer_facturas(self, datos):
+        """Invoice headers of the book in one query, with the columns needed
+        to build the document type and number"""
+        capacidades = self.env['l10n_gt_extra.capacidades'].capacidades()
+        tipo_interno = 'm.' + capacidades['tipo_interno']
+
+        columnas = ''
+        if capacidades['requiere_resolucion']:
+            columnas += ', j.requiere_resolucion'
+        if capacidades['firma_gface']:
+            columnas += ', m.firma_gface'
+        if capacidades['firma_fel']:
+            columnas += ', m.firma_fel, m.serie_fel, m.numero_fel'
+
+        self.env.cr.execute('select m.id, m.state, m.tipo_cambio_efectivo, m.date, m.name, m.ref, m.nota_debito, ' + tipo_interno + ' as tipo_interno, ' \
+            'p.name as cliente, p.vat as nit, j.facturas_por_rangos, j.usar_referencia' + columnas + ' ' \
+            'from account_move m join account_journal j on (m.journal_id = j.id) left join res_partner p on (m.partner_id = p.id) ' \
+            'where m.state in (\'posted\', \'cancel\') and m.journal_id in %s and m.date >= %s and m.date <= %s ' \
+            'and m.amount_total != 0 and ' + tipo_interno + ' in (\'out_invoice\', \'out_refund\') order by m.id',
+        (tuple(datos['diarios_id']), datos['fecha_desde'], datos['fecha_hasta']))
+        return self.env.cr.dictfetchall()
+
+    def _extraer_montos(self, move_ids):
+        """Untaxed amounts per invoice and line type, and tax amounts per
+        invoice and tax, read from the posted move lines in company currency.
+        Amounts have the sign of the document (positive on invoices)."""
+        bases = {}
+        impuestos = {}
+        if not move_ids:
+            return bases, impuestos
+
+        lineas_factura = self.env['l10n_gt_extra.capacidades'].capacidades()['lineas_factura']
+
+        self.env.cr.execute('select l.move_id, ' \
+            'coalesce(nullif(m.tipo_gasto, \'mixto\'), case when pt.type = \'service\' then \'servicio\' else \'compra\' end) as tipo_linea, ' \
+            'exists(select 1 from account_move_line_account_tax_rel r where r.account_move_line_id = l.id) as con_impuesto, ' \
+            'sum(-l.balance) as monto ' \
+            'from account_move_line l join account_move m on (l.move_id = m.id) ' \
+            'left join product_product pp on (l.product_id = pp.id) left join product_template pt on (pp.product_tmpl_id = pt.id) ' \
+            'where l.move_id in %s and ' + lineas_factura + ' group by 1, 2, 3',
+        (tuple(move_ids),))
+        for r in self.env.cr.dictfetchall():
+            bases.setdefault(r['move_id'], []).append((r['tipo_linea'], r['con_impuesto'], r['monto']))
+
+        self.env.cr.execute('select l.move_id, l.tax_line_id, sum(-l.balance) as monto ' \
+            'from account_move_line l where l.move_id in %s and l.tax_line_id is not null group by 1, 2',
+        (tuple(move_ids),))
+        for r in self.env.cr.dictfetchall():
+            impuestos.setdefault(r['move_id'], []).append((r['tax_line_id'], r['monto']))
+
+        return bases, impuestos
+
+    def _montos_compute_all(self, f, tipo, linea, totales, impuesto_id, tipo_cambio_efectivo=None, memoria=None):
+        """Amounts of one invoice recomputed from its lines with compute_all,
+        used when the tax lines cannot be attributed to a single line type.
+        tipo_cambio_efectivo is the receivable total over the invoice total
+        stored when the invoice was posted; invoices posted before it existed
+        derive it from their lines. memoria is the compute_all_memoria dict
+        shared by the whole book."""
+        memoria = {} if memoria is None else memoria
+        impuesto = self.env['account.tax'].browse(impuesto_id)
+
+        tipo_cambio = 1
+        if f.currency_id.id != f.company_id.currency_id.id:
+            # Probar con impuesto inicialmente
+            for l in f.invoice_line_ids:
+                if impuesto in l.tax_ids:
+                    if l.amount_currency != 0:
+                        tipo_cambio = l.balance/l.amount_currency
+
+            # Si la factura no tiene impuesto, entonces usar cuenta por cobrar/pagar
+            if tipo_cambio == 1 and tipo_cambio_efectivo is not None:
+                tipo_cambio = tipo_cambio_efectivo
+            elif tipo_cambio == 1:
+                total = 0
+                for l in f.line_ids:
+                    if l.account_id.reconcile:
+                        total += l.debit - l.credit
+                if f.amount_total != 0:
+                    tipo_cambio = abs(total / f.amount_total)
+
+        for l in f.invoice_line_ids:
+            precio = ( l.price_unit * (1-(l.discount or 0.0)/100.0) ) * tipo_cambio
+            if tipo == 'NC':
+                precio = precio * -1
+
+            tipo_linea = f.tipo_gasto or 'mixto'
+            if tipo_linea == 'mixto':
+                if l.product_id.type != 'service':
+                    tipo_linea = 'compra'
+                else:
+                    tipo_linea = 'servicio'
+
+            r = l.tax_ids.compute_all_memoria(memoria, precio, currency=f.currency_id, quantity=l.quantity, product=l.product_id, partner=f.partner_id)
+
+            linea['base'] += r['total_excluded']
+            totales[tipo_linea]['total'] += r['total_excluded']
+            if len(l.tax_ids) > 0:
+                linea[tipo_linea] += r['total_excluded']
+                totales[tipo_linea]['neto'] += r['total_excluded']
+                for i in r['taxes']:
+                    self._sumar_impuesto(i['id'], i['amount'], tipo, tipo_linea, linea, totales, impuesto_id)
+            else:
+                linea[tipo_linea+'_exento'] += r['total_excluded']
+                totales[tipo_linea]['exento'] += r['total_excluded']
+
+    def _sumar_impuesto(self, tax_id, monto, tipo, tipo_linea, linea, totales, impuesto_id):
+        if tax_id == impuesto_id:
+            linea['iva'] += monto
+            totales[tipo_linea]['iva'] += monto
+            totales[tipo_linea]['total'] += monto
+        elif (monto > 0 and tipo != 'NC') or (monto < 0 and tipo == 'NC'):
+            linea[tipo_linea+'_exento'] += monto
+            totales[tipo_linea]['exento'] += monto
+            totales[tipo_linea]['total'] += monto
+
+    def _calcular(self, datos, memoria=None):
         totales = {}
 
         totales['num_facturas'] = 0
@@ -15,75 +135,56 @@ class ReporteVentas(models.AbstractModel):
         totales['servicio'] = {'exento':0,'neto':0,'iva':0,'total':0}
         totales['importacion'] = {'exento':0,'neto':0,'iva':0,'total':0}
         totales['combustible'] = {'exento':0,'neto':0,'iva':0,'total':0}
-        
-        journal_ids = [x for x in datos['diarios_id']]
-        filtro = [
-            ('state','in',['posted','cancel']),
-            ('journal_id','in',journal_ids),
-            ('date','<=',datos['fecha_hasta']),
-            ('date','>=',datos['fecha_desde']),
-            ('amount_total','!=',0),
-        ]
-        
-        if 'type' in self.env['account.move'].fields_get():
-            filtro.append(('type','in',['out_invoice','out_refund']))
-        else:
-            filtro.append(('move_type','in',['out_invoice','out_refund']))
-
-        facturas = self.env['account.move'].search(filtro)
-        impuesto = self.env['account.tax'].browse(datos['impuesto_id'][0])
 
         lineas = []
+        if not datos['diarios_id']:
+            return { 'lineas': lineas, 'totales': totales }
+
+        self.env['l10n_gt_extra.capacidades'].guardar_cambios()
+        impuesto_id = datos['impuesto_id'][0]
+        facturas = self._extraer_facturas(datos)
+        bases, impuestos = self._extraer_montos([f['id'] for f in facturas if f['state'] == 'posted'])
+
+        # compute_all results shared by the invoices of the book, and by
+        # the partitions when it is computed in parallel
+        if memoria is None:
+            memoria = {}
+        avanzar = self.env['l10n_gt_extra.reporte_trabajo'].avance(len(facturas), 10, 80, 'Calculando facturas')
+
         for f in facturas:
+            avanzar()
             totales['num_facturas'] += 1
 
-            tipo_cambio = 1
-            if f.currency_id.id != f.company_id.currency_id.id:
-                # Probar con impuesto inicialmente
-                for l in f.invoice_line_ids:
-                    if impuesto in l.tax_ids:
-                        if l.amount_currency != 0:
-                            tipo_cambio = l.balance/l.amount_currency
-                
-                # Si la factura no tiene impuesto, entonces usar cuenta por cobrar/pagar
-                if tipo_cambio == 1:
-                    total = 0
-                    for l in f.line_ids:
-                        if l.account_id.reconcile:
-                            total += l.debit - l.credit
-                    if f.amount_total != 0:
-                        tipo_cambio = abs(total / f.amount_total)
-
             tipo = 'FACT'
-            tipo_interno_factura = f.type if 'type' in f.fields_get() else f.move_type
-            if tipo_interno_factura != 'out_invoice':
+            if f['tipo_interno'] != 'out_invoice':
                 tipo = 'NC'
-            if f.nota_debito:
+            if f['nota_debito']:
                 tipo = 'ND'
 
-            numero = f.name or '-'
+            numero = f['name'] or '-'
 
             # Por si es un diario de rango de facturas
-            if f.journal_id.facturas_por_rangos or f.journal_id.usar_referencia:
-                numero = f.ref
+            if f['facturas_por_rangos'] or f['usar_referencia']:
+                numero = f['ref']
 
             # Por si usa factura electrónica
-            if 'firma_gface' in f.fields_get() and f.firma_gface:
-                numero = str(f.ref)
-            if 'firma_fel' in f.fields_get() and f.firma_fel:
-                numero = str(f.serie_fel) + '-' + str(f.numero_fel)
+            if f.get('firma_gface'):
+                numero = str(f['ref'])
+            if f.get('firma_fel'):
+                numero = str(f['serie_fel']) + '-' + str(f['numero_fel'])
 
             # Por si usa tickets
-            if 'requiere_resolucion' in f.journal_id.fields_get() and f.journal_id.requiere_resolucion:
-                numero = f.ref
+            if f.get('requiere_resolucion'):
+                numero = f['ref']
 
             linea = {
-                'estado': f.state,
+                'id': f['id'],
+                'estado': f['state'],
                 'tipo': tipo,
-                'fecha': f.date,
+                'fecha': f['date'],
                 'numero': numero,
-                'cliente': f.partner_id.name,
-                'nit': f.partner_id.vat,
+                'cliente': f['cliente'],
+                'nit': f['nit'],
                 'compra': 0,
                 'compra_exento': 0,
                 'servicio': 0,
@@ -97,79 +198,90 @@ class ReporteVentas(models.AbstractModel):
                 'total': 0
             }
 
-            if f.state == 'cancel':
+            if f['state'] == 'cancel':
                 lineas.append(linea)
                 continue
 
-            for l in f.invoice_line_ids:
-                precio = ( l.price_unit * (1-(l.discount or 0.0)/100.0) ) * tipo_cambio
-                if tipo == 'NC':
-                    precio = precio * -1
-
-                tipo_linea = f.tipo_gasto or 'mixto'
-                if tipo_linea == 'mixto':
-                    if l.product_id.type != 'service':
-                        tipo_linea = 'compra'
+            # The move lines are signed by debit/credit, the book by document:
+            # credit notes are negative and debit notes positive
+            signo = (-1 if f['tipo_interno'] == 'out_refund' else 1) * (-1 if tipo == 'NC' else 1)
+
+            montos = bases.get(f['id'], [])
+            tipos_con_impuesto = {tipo_linea for tipo_linea, con_impuesto, monto in montos if con_impuesto}
+            if f['id'] in impuestos and len(tipos_con_impuesto) != 1:
+                self._montos_compute_all(self.env['account.move'].browse(f['id']), tipo, linea, totales, impuesto_id, f['tipo_cambio_efectivo'], memoria)
+            else:
+                for tipo_linea, con_impuesto, monto in montos:
+                    monto = monto * signo
+                    linea['base'] += monto
+                    totales[tipo_linea]['total'] += monto
+                    if con_impuesto:
+                        linea[tipo_linea] += monto
+                        totales[tipo_linea]['neto'] += monto
                     else:
-                        tipo_linea = 'servicio'
-
-                r = l.tax_ids.compute_all(precio, currency=f.currency_id, quantity=l.quantity, product=l.product_id, partner=f.partner_id)
-
-                linea['base'] += r['total_excluded']
-                totales[tipo_linea]['total'] += r['total_excluded']
-                if len(l.tax_ids) > 0:
-                    linea[tipo_linea] += r['total_excluded']
-                    totales[tipo_linea]['neto'] += r['total_excluded']
-                    for i in r['taxes']:
-                        if i['id'] == datos['impuesto_id'][0]:
-                            linea['iva'] += i['amount']
-                            totales[tipo_linea]['iva'] += i['amount']
-                            totales[tipo_linea]['total'] += i['amount']
-                        elif (i['amount'] > 0 and tipo != 'NC') or (i['amount'] < 0 and tipo == 'NC'):
-                            linea[tipo_linea+'_exento'] += i['amount']
-                            totales[tipo_linea]['exento'] += i['amount']
-                            totales[tipo_linea]['total'] += i['amount']
-                else:
-                    linea[tipo_linea+'_exento'] += r['total_excluded']
-                    totales[tipo_linea]['exento'] += r['total_excluded']
+                        linea[tipo_linea+'_exento'] += monto
+                        totales[tipo_linea]['exento'] += monto
+
+                # Only reached with a single taxed line type, so the tax lines
+                # belong to it
+                for tax_id, monto in impuestos.get(f['id'], []):
+                    self._sumar_impuesto(tax_id, monto * signo, tipo, min(tipos_con_impuesto), linea, totales, impuesto_id)
 
             linea['total'] += linea['compra'] + linea['compra_exento'] + linea['servicio'] + linea['servicio_exento'] + linea['combustible'] + linea['combustible_exento'] + linea['importacion'] + linea['importacion_exento'] + linea['iva']
 
             lineas.append(linea)
 
-        lineas = sorted(lineas, key = lambda i: str(i['fecha']) + str(i['numero']))
+        lineas = sorted(lineas, key=self._orden_lineas)
+
+        return { 'lineas': lineas, 'totales': totales }
+
+    def _resumir(self, lineas):
+        """One line per document type and date"""
+        lineas_resumidas = {}
+        for l in lineas:
+            llave = l['tipo']+str(l['fecha'])
+            if llave not in lineas_resumidas:
+                lineas_resumidas[llave] = dict(l)
+                lineas_resumidas[llave]['estado'] = 'open'
+                lineas_resumidas[llave]['cliente'] = 'Varios'
+                lineas_resumidas[llave]['nit'] = 'Varios'
+                lineas_resumidas[llave]['facturas'] = [l['numero']]
+            else:
+                lineas_resumidas[llave]['compra'] += l['compra']
+                lineas_resumidas[llave]['compra_exento'] += l['compra_exento']
+                lineas_resumidas[llave]['servicio'] += l['servicio']
+                lineas_resumidas[llave]['servicio_exento'] += l['servicio_exento']
+                lineas_resumidas[llave]['combustible'] += l['combustible']
+                lineas_resumidas[llave]['combustible_exento'] += l['combustible_exento']
+                lineas_resumidas[llave]['importacion'] += l['importacion']
+                lineas_resumidas[llave]['importacion_exento'] += l['importacion_exento']
+                lineas_resumidas[llave]['base'] += l['base']
+                lineas_resumidas[llave]['iva'] += l['iva']
+                lineas_resumidas[llave]['total'] += l['total']
+                lineas_resumidas[llave]['facturas'].append(l['numero'])
+
+        for l in lineas_resumidas.values():
+            facturas = sorted(l['facturas'])
+            l['numero'] = str(l['facturas'][0]) + ' al ' + str(l['facturas'][-1])
+
+        lineas = sorted(lineas_resumidas.values(), key=lambda l: l['tipo']+str(l['fecha']))
+        return lineas
+
+    def _lineas(self, datos):
+        if datos.get('paralelo'):
+            res = self._calcular_particionado(datos)
+        else:
+            res = self._calcular(datos)
 
         if datos['resumido']:
-            lineas_resumidas = {}
-            for l in lineas:
-                llave = l['tipo']+str(l['fecha'])
-                if llave not in lineas_resumidas:
-                    lineas_resumidas[llave] = dict(l)
-                    lineas_resumidas[llave]['estado'] = 'open'
-                    lineas_resumidas[llave]['cliente'] = 'Varios'
-                    lineas_resumidas[llave]['nit'] = 'Varios'
-                    lineas_resumidas[llave]['facturas'] = [l['numero']]
-                else:
-                    lineas_resumidas[llave]['compra'] += l['compra']
-                    lineas_resumidas[llave]['compra_exento'] += l['compra_exento']
-                    lineas_resumidas[llave]['servicio'] += l['servicio']
-                    lineas_resumidas[llave]['servicio_exento'] += l['servicio_exento']
-                    lineas_resumidas[llave]['combustible'] += l['combustible']
-                    lineas_resumidas[llave]['combustible_exento'] += l['combustible_exento']
-                    lineas_resumidas[llave]['importacion'] += l['importacion']
-                    lineas_resumidas[llave]['importacion_exento'] += l['importacion_exento']
-                    lineas_resumidas[llave]['base'] += l['base']
-                    lineas_resumidas[llave]['iva'] += l['iva']
-                    lineas_resumidas[llave]['total'] += l['total']
-                    lineas_resumidas[llave]['facturas'].append(l['numero'])
-
-            for l in lineas_resumidas.values():
-                facturas = sorted(l['facturas'])
-                l['numero'] = str(l['facturas'][0]) + ' al ' + str(l['facturas'][-1])
-
-            lineas = sorted(lineas_resumidas.values(), key=lambda l: l['tipo']+str(l['fecha']))
+            res['lineas'] = self._resumir(res['lineas'])
 
-        return { 'lineas': lineas, 'totales': totales }
+        return res
+
+    def lineas(self, datos):
+        """Result of _lineas, reused while the data it reads does not change"""
+        cache = self.env['l10n_gt_extra.reporte_cache']
+        return cache.obtener(self._name, datos, self._parametros_cache, lambda: cache.huella_diarios(datos['diarios_id'], datos['fecha_desde'], datos['fecha_hasta']), lambda: self._lineas(datos))
 
     @api.model
     def _get_report_values(self, docids, data=None):
@@ -0,0 +1,6 @@
+# -*- encoding: utf-8 -*-
+
+from . import test_reportes_consultas
+from . import test_saldo_mensual
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
@@ -0,0 +1,82 @@
+# -*- encoding: utf-8 -*-
+
+from odoo.release import version_info
+from odoo.tests.common import TransactionCase, tagged
+import json
+
+@tagged('post_install', '-at_install')
+class TestReportesConsultas(TransactionCase):
+    """The ledger and the journal book read every account in the same
+    queries, so rendering them must not take more queries with more
+    accounts"""
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestReportesConsultas, cls).setUpClass()
+        # Measure the books themselves, not the cached results
+        cls.env['ir.config_parameter'].sudo().set_param('l10n_gt_extra.reporte_cache_limite', 0)
+
+        cls.diario = cls.env['account.journal'].create({'name': 'Diario de pruebas', 'code': 'TGTX', 'type': 'general'})
+        cls.cuentas = cls.env['account.account']
+        for i in range(5):
+            cls.cuentas |= cls._crear_cuenta('TGTX%s' % i)
+
+        for fecha in ('2023-12-20', '2024-01-10', '2024-01-25'):
+            for cuenta in cls.cuentas[1:]:
+                partida = cls.env['account.move'].create({
+                    'journal_id': cls.diario.id,
+                    'date': fecha,
+                    'line_ids': [
+                        (0, 0, {'account_id': cls.cuentas[0].id, 'name': 'Prueba', 'debit': 100, 'credit': 0}),
+                        (0, 0, {'account_id': cuenta.id, 'name': 'Prueba', 'debit': 0, 'credit': 100}),
+                    ],
+                })
+                partida.action_post()
+
+    @classmethod
+    def _crear_cuenta(cls, codigo):
+        valores = {'code': codigo, 'name': 'Cuenta %s' % codigo}
+        if cls.env['l10n_gt_extra.capacidades'].capacidades()['tipos_de_cuenta']:
+            valores['user_type_id'] = cls.env.ref('account.data_account_type_current_assets').id
+        else:
+            valores['account_type'] = 'asset_current'
+        return cls.env['account.account'].create(valores)
+
+    def _renderizar(self, reporte, modelo, cuentas, **valores):
+        asistente = self.env[modelo].create(dict(valores, cuentas_id=[(6, 0, cuentas.ids)], fecha_desde='2024-01-01', fecha_hasta='2024-01-31'))
+        # Same data the browser sends back through JSON for print_report
+        data = json.loads(json.dumps({'ids': [], 'model': modelo, 'form': asistente.read()[0]}, default=str))
+        Reporte = self.env['ir.actions.report'].with_context(active_model=modelo, active_ids=asistente.ids)
+        if version_info[0] >= 16:
+            return Reporte._render_qweb_html(reporte, asistente.ids, data=data)
+        return self.env.ref(reporte).with_context(active_model=modelo, active_ids=asistente.ids)._render_qweb_html(asistente.ids, data=data)
+
+    def _comparar_consultas(self, reporte, modelo, **valores):
+        """Render the book with one account, then with all of them, which
+        must not need more queries"""
+        # Compile the templates and fill the caches that do not depend on
+        # the accounts
+        self._renderizar(reporte, modelo, self.cuentas, **valores)
+
+        inicio = self.cr.sql_log_count
+        self._renderizar(reporte, modelo, self.cuentas[:1], **valores)
+        consultas = self.cr.sql_log_count - inicio
+
+        with self.assertQueryCount(consultas):
+            html = self._renderizar(reporte, modelo, self.cuentas, **valores)[0]
+        for cuenta in self.cuentas:
+            self.assertIn(cuenta.code.encode(), html)
+
+    def test_mayor(self):
+        self._comparar_consultas('l10n_gt_extra.action_reporte_mayor', 'l10n_gt_extra.asistente_reporte_mayor')
+
+    def test_mayor_agrupado_por_dia(self):
+        self._comparar_consultas('l10n_gt_extra.action_reporte_mayor', 'l10n_gt_extra.asistente_reporte_mayor', agrupado_por_dia=True)
+
+    def test_diario(self):
+        self._comparar_consultas('l10n_gt_extra.action_reporte_diario', 'l10n_gt_extra.asistente_reporte_diario')
+
+    def test_diario_agrupado_por_dia(self):
+        self._comparar_consultas('l10n_gt_extra.action_reporte_diario', 'l10n_gt_extra.asistente_reporte_diario', agrupado_por_dia=True)
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4:
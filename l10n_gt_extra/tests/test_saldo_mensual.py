@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+
+from odoo.release import version_info
+from odoo.tests.common import TransactionCase, tagged
+
+@tagged('post_install', '-at_install')
+class TestSaldoMensual(TransactionCase):
+    """Posting, resetting and cancelling moves keep the monthly balances in
+    step with the posted lines"""
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestSaldoMensual, cls).setUpClass()
+        cls.diario = cls.env['account.journal'].create({'name': 'Diario de saldos', 'code': 'TGSM', 'type': 'general'})
+        cls.cuentas = cls.env['account.account']
+        for i in range(2):
+            valores = {'code': 'TGSM%s' % i, 'name': 'Cuenta TGSM%s' % i}
+            if cls.env['l10n_gt_extra.capacidades'].capacidades()['tipos_de_cuenta']:
+                valores['user_type_id'] = cls.env.ref('account.data_account_type_current_assets').id
+            else:
+                valores['account_type'] = 'asset_current'
+            cls.cuentas |= cls.env['account.account'].create(valores)
+
+    def _crear_partida(self, fecha, monto):
+        return self.env['account.move'].create({
+            'journal_id': self.diario.id,
+            'date': fecha,
+            'line_ids': [
+                (0, 0, {'account_id': self.cuentas[0].id, 'name': 'Prueba', 'debit': monto, 'credit': 0}),
+                (0, 0, {'account_id': self.cuentas[1].id, 'name': 'Prueba', 'debit': 0, 'credit': monto}),
+            ],
+        })
+
+    def _saldos(self, fecha_hasta):
+        saldos = self.env['l10n_gt_extra.saldo_mensual'].sumar(self.cuentas.ids, fecha_hasta)
+        return [saldos.get(cuenta.id, 0) for cuenta in self.cuentas]
+
+    def test_validar(self):
+        self._crear_partida('2024-01-10', 100).action_post()
+        self._crear_partida('2024-02-05', 40).action_post()
+        # January comes from the snapshots, the days of February from the lines
+        self.assertEqual(self._saldos('2024-02-10'), [140, -140])
+        self.assertEqual(self._saldos('2024-03-01'), [140, -140])
+        self.assertEqual(self._saldos('2024-02-01'), [100, -100])
+
+    def test_borrador(self):
+        partida = self._crear_partida('2024-01-10', 100)
+        partida.action_post()
+        partida.button_draft()
+        self.assertEqual(self._saldos('2024-03-01'), [0, 0])
+        partida.action_post()
+        self.assertEqual(self._saldos('2024-03-01'), [100, -100])
+
+    def test_cancelar(self):
+        partida = self._crear_partida('2024-01-10', 100)
+        partida.action_post()
+        if version_info[0] < 16:
+            partida.button_draft()
+        partida.button_cancel()
+        self.assertEqual(self._saldos('2024-03-01'), [0, 0])
+
+# vim:expandtab:smartindent:tabstop=4:softtabstop=4:shiftwidth=4: